@@ -1,14 +1,345 @@
-﻿import cv2
+﻿import os
+import time
+import cv2
 import numpy as np
-from sklearn.cluster import KMeans
+
+
+# ============================================================================
+# CIELAB DÖNÜŞÜMÜ VE ΔE METRİKLERİ
+# ============================================================================
+
+# sRGB (D65) -> XYZ
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041]
+])
+_D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+
+def rgb_to_lab(rgb) -> np.ndarray:
+    """Convert (..., 3) sRGB values in 0-255 to CIELAB (D65)"""
+    rgb = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+    xyz = (linear @ _RGB_TO_XYZ.T) / _D65_WHITE
+    
+    epsilon = 216 / 24389
+    kappa = 24389 / 27
+    f = np.where(xyz > epsilon, np.cbrt(xyz), (kappa * xyz + 16) / 116)
+    
+    lab = np.empty_like(f)
+    lab[..., 0] = 116 * f[..., 1] - 16
+    lab[..., 1] = 500 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200 * (f[..., 1] - f[..., 2])
+    return lab
+
+
+def delta_e_76(lab1, lab2) -> np.ndarray:
+    """CIE76 ΔE (broadcasting Euclidean distance in Lab)"""
+    return np.linalg.norm(np.asarray(lab1) - np.asarray(lab2), axis=-1)
+
+
+def delta_e_2000(lab1, lab2) -> np.ndarray:
+    """CIEDE2000 ΔE, broadcast over the leading dimensions"""
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+    
+    C1 = np.hypot(a1, b1)
+    C2 = np.hypot(a2, b2)
+    C_bar7 = ((C1 + C2) / 2) ** 7
+    G = 0.5 * (1 - np.sqrt(C_bar7 / (C_bar7 + 25 ** 7)))
+    
+    a1p = (1 + G) * a1
+    a2p = (1 + G) * a2
+    C1p = np.hypot(a1p, b1)
+    C2p = np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+    
+    dLp = L2 - L1
+    dCp = C2p - C1p
+    
+    dhp = h2p - h1p
+    dhp = np.where(dhp > 180, dhp - 360, dhp)
+    dhp = np.where(dhp < -180, dhp + 360, dhp)
+    dhp = np.where(C1p * C2p == 0, 0, dhp)
+    dHp = 2 * np.sqrt(C1p * C2p) * np.sin(np.radians(dhp / 2))
+    
+    Lp_bar = (L1 + L2) / 2
+    Cp_bar = (C1p + C2p) / 2
+    
+    hp_sum = h1p + h2p
+    hp_bar = np.where(np.abs(h1p - h2p) > 180, (hp_sum + 360) / 2, hp_sum / 2)
+    hp_bar = np.where(np.abs(h1p - h2p) > 180, np.where(hp_sum < 360, hp_bar, hp_bar - 360), hp_bar)
+    hp_bar = np.where(C1p * C2p == 0, hp_sum, hp_bar)
+    
+    T = (1
+         - 0.17 * np.cos(np.radians(hp_bar - 30))
+         + 0.24 * np.cos(np.radians(2 * hp_bar))
+         + 0.32 * np.cos(np.radians(3 * hp_bar + 6))
+         - 0.20 * np.cos(np.radians(4 * hp_bar - 63)))
+    
+    d_theta = 30 * np.exp(-(((hp_bar - 275) / 25) ** 2))
+    Cp_bar7 = Cp_bar ** 7
+    R_C = 2 * np.sqrt(Cp_bar7 / (Cp_bar7 + 25 ** 7))
+    S_L = 1 + (0.015 * (Lp_bar - 50) ** 2) / np.sqrt(20 + (Lp_bar - 50) ** 2)
+    S_C = 1 + 0.045 * Cp_bar
+    S_H = 1 + 0.015 * Cp_bar * T
+    R_T = -np.sin(np.radians(2 * d_theta)) * R_C
+    
+    return np.sqrt(
+        (dLp / S_L) ** 2
+        + (dCp / S_C) ** 2
+        + (dHp / S_H) ** 2
+        + R_T * (dCp / S_C) * (dHp / S_H)
+    )
+
+
+def delta_e_to_similarity(delta_e) -> np.ndarray:
+    """ΔE -> 0-100 benzerlik (ΔE 0 = 100, ΔE >= 100 = 0)"""
+    return np.clip(100 - np.asarray(delta_e, dtype=np.float64), 0, 100)
+
+
+class ReferencePalette:
+    """
+    Bir şirketin ürün referans renkleri, CIELAB'a bir kez çevrilmiş halde
+    
+    lab: (M, 3) Lab dizisi
+    color_names: M elemanlı renk adı listesi ("primary", "secondary", ...)
+    class_columns: {class_name: lab içindeki sütun indeksleri}
+    """
+    
+    def __init__(self, reference_colors_by_class: dict):
+        rgb, self.color_names, self.class_columns = [], [], {}
+        for class_name, palette in (reference_colors_by_class or {}).items():
+            if not palette:
+                continue
+            columns = []
+            for color_name, hex_color in palette.items():
+                columns.append(len(rgb))
+                rgb.append(ColorAnalyzer._hex_to_rgb(hex_color))
+                self.color_names.append(color_name)
+            self.class_columns[class_name] = np.array(columns)
+        
+        self.rgb = np.array(rgb, dtype=np.float64).reshape(-1, 3)
+        self.lab = rgb_to_lab(self.rgb)
+    
+    def __len__(self):
+        return len(self.color_names)
 
 
 class ColorAnalyzer:
-    def __init__(self, n_colors: int = 5):
+    MAX_KMEANS_POINTS = 4096  # k-means'e giren en fazla histogram bini
+    COLOR_METRICS = ('rgb', 'cie76', 'ciede2000')
+    
+    def __init__(self, n_colors: int = 5, pixel_budget: int = None, quantize_bits: int = 5, seed: int = 42,
+                 metric: str = None):
         self.n_colors = n_colors
+        # Renk karşılaştırma metriği: ciede2000 (varsayılan, algısal), cie76 veya
+        # rgb (eski skorlarla birebir uyum için). Metrik değişince geçmiş
+        # skorlar POST /api/scoring/company/{id}/rescore ile yeniden hesaplanır.
+        self.metric = (metric or os.getenv("COLOR_MATCH_METRIC", "ciede2000")).lower()
+        if self.metric not in self.COLOR_METRICS:
+            raise ValueError(f"metric must be one of: {', '.join(self.COLOR_METRICS)}")
+        # Sabit piksel bütçesi: görüntü boyutundan bağımsız maliyet
+        self.pixel_budget = pixel_budget or int(os.getenv("COLOR_PIXEL_BUDGET", 20000))
+        # Kanal başına bit (5 bit -> 32x32x32 histogram)
+        self.quantize_bits = quantize_bits
+        self.seed = seed
+        self.n_init = 4
+        self.max_iter = 20
+    
+    # ========================================================================
+    # HIZLI BASKIN RENK MOTORU
+    # ========================================================================
+    
+    @staticmethod
+    def _jpeg_size(image_path: str):
+        """JPEG SOF başlığından (width, height); JPEG değilse veya okunamazsa None"""
+        with open(image_path, 'rb') as f:
+            if f.read(2) != b'\xff\xd8':
+                return None
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                if marker[1] in (0x01, 0xFF) or 0xD0 <= marker[1] <= 0xD7:
+                    continue  # Uzunluksuz işaretler
+                length = int.from_bytes(f.read(2), 'big')
+                # SOF0-SOF15 (DHT, JPG, DAC hariç)
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    header = f.read(5)
+                    if len(header) < 5:
+                        return None
+                    return int.from_bytes(header[3:5], 'big'), int.from_bytes(header[1:3], 'big')
+                f.seek(length - 2, os.SEEK_CUR)
+    
+    def _reduction_flag(self, image_path: str) -> int:
+        """
+        Largest IMREAD_REDUCED factor that still leaves 4 x pixel_budget pixels
+        
+        Boyut JPEG başlığından okunur; küçültme çözücü içinde yapıldığı için
+        yalnızca JPEG'de uygulanır, diğer biçimler tam çözülüp örneklenir.
+        """
+        try:
+            size = self._jpeg_size(image_path)
+        except OSError:
+            size = None
+        if size is None:
+            return cv2.IMREAD_COLOR
+        
+        width, height = size
+        for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if (width // factor) * (height // factor) >= 4 * self.pixel_budget:
+                return flag
+        return cv2.IMREAD_COLOR
+    
+    def _read_rgb(self, image_path: str) -> np.ndarray:
+        """Read image as RGB, letting the JPEG decoder downscale large images"""
+        image = cv2.imread(image_path, self._reduction_flag(image_path))
+        if image is None:
+            raise ValueError(f"Cannot read image: {image_path}")
+        
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    
+    def _sample_pixels(self, image: np.ndarray) -> np.ndarray:
+        """Stratified grid sample limited to pixel_budget pixels"""
+        height, width = image.shape[:2]
+        total = height * width
+        if total <= self.pixel_budget:
+            return image.reshape(-1, 3)
+        
+        # Her hücreden bir piksel: ızgara adımı bütçeye göre seçilir
+        step = int(np.ceil(np.sqrt(total / self.pixel_budget)))
+        offset = step // 2
+        return image[offset::step, offset::step].reshape(-1, 3)
+    
+    def _quantize(self, pixels: np.ndarray):
+        """
+        3D histogram pre-quantization -> (bin mean colors, bin weights)
+        
+        Dolu bin sayısı MAX_KMEANS_POINTS'i aşarsa (gürültülü/çok renkli
+        görüntüler) kanal başına bit azaltılır; k-means maliyeti bin sayısıyla
+        sınırlı kalır.
+        """
+        bits = self.quantize_bits
+        while True:
+            shift = 8 - bits
+            q = (pixels >> shift).astype(np.int32)
+            bins = (q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2]
+            
+            n_bins = 1 << (3 * bits)
+            counts = np.bincount(bins, minlength=n_bins)
+            occupied = np.nonzero(counts)[0]
+            if len(occupied) <= self.MAX_KMEANS_POINTS or bits <= 3:
+                break
+            bits -= 1
+        weights = counts[occupied].astype(np.float64)
+        
+        # Bin içindeki gerçek ortalama renk (bin merkezi yerine)
+        means = np.empty((len(occupied), 3), dtype=np.float64)
+        for channel in range(3):
+            sums = np.bincount(bins, weights=pixels[:, channel].astype(np.float64), minlength=n_bins)
+            means[:, channel] = sums[occupied] / weights
+        
+        return means, weights
+    
+    def _weighted_kmeans(self, points: np.ndarray, weights: np.ndarray, k: int):
+        """Deterministic weighted k-means (k-means++ init) over histogram bins"""
+        k = min(k, len(points))
+        rng = np.random.default_rng(self.seed)
+        point_norms = (points ** 2).sum(axis=1)
+        
+        best = None
+        for _ in range(self.n_init):
+            # Ağırlıklı k-means++ başlangıcı
+            centers = np.empty((k, 3), dtype=np.float64)
+            centers[0] = points[rng.choice(len(points), p=weights / weights.sum())]
+            closest = ((points - centers[0]) ** 2).sum(axis=1)
+            for i in range(1, k):
+                probs = closest * weights
+                total = probs.sum()
+                if total <= 0:
+                    centers[i:] = centers[0]
+                    break
+                centers[i] = points[rng.choice(len(points), p=probs / total)]
+                closest = np.minimum(closest, ((points - centers[i]) ** 2).sum(axis=1))
+            
+            labels = None
+            for _ in range(self.max_iter):
+                # ||p - c||^2 = ||p||^2 - 2 p.c + ||c||^2
+                distances = point_norms[:, None] - 2 * points @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+                new_labels = distances.argmin(axis=1)
+                if labels is not None and np.array_equal(new_labels, labels):
+                    break
+                labels = new_labels
+                
+                cluster_weights = np.bincount(labels, weights=weights, minlength=k)
+                non_empty = cluster_weights > 0
+                for channel in range(3):
+                    sums = np.bincount(labels, weights=points[:, channel] * weights, minlength=k)
+                    centers[non_empty, channel] = sums[non_empty] / cluster_weights[non_empty]
+            else:
+                # max_iter doldu: son merkezlere göre etiket ve mesafeleri yenile
+                distances = point_norms[:, None] - 2 * points @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+                labels = distances.argmin(axis=1)
+            
+            inertia = float((distances[np.arange(len(points)), labels] * weights).sum())
+            if best is None or inertia < best[0]:
+                best = (inertia, centers.copy(), labels)
+        
+        _, centers, labels = best
+        cluster_weights = np.bincount(labels, weights=weights, minlength=k)
+        return centers, cluster_weights
+    
+    def extract_dominant_colors_from_array(self, image: np.ndarray):
+        """Extract dominant colors from an RGB array with a bounded pixel budget"""
+        pixels = self._sample_pixels(image)
+        points, weights = self._quantize(pixels)
+        centers, cluster_weights = self._weighted_kmeans(points, weights, self.n_colors)
+        
+        percentages = (cluster_weights / cluster_weights.sum()) * 100
+        colors = np.clip(np.rint(centers), 0, 255).astype(int)
+        
+        # Sort by percentage
+        sorted_indices = np.argsort(percentages, kind='stable')[::-1]
+        
+        dominant_colors = []
+        for idx in sorted_indices:
+            if cluster_weights[idx] <= 0:
+                continue
+            color = colors[idx].tolist()
+            hex_color = '#{:02x}{:02x}{:02x}'.format(color[0], color[1], color[2])
+            dominant_colors.append({
+                'rgb': color,
+                'hex': hex_color,
+                'percentage': round(float(percentages[idx]), 2)
+            })
+        
+        return dominant_colors
     
     def extract_dominant_colors(self, image_path: str):
         """Extract dominant colors from image"""
+        try:
+            image = self._read_rgb(image_path)
+            
+            return {
+                'success': True,
+                'colors': self.extract_dominant_colors_from_array(image)
+            }
+        
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def extract_dominant_colors_kmeans(self, image_path: str):
+        """Reference implementation: full-resolution sklearn KMeans (slow)"""
+        from sklearn.cluster import KMeans
+        
         try:
             image = cv2.imread(image_path)
             image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
@@ -50,17 +381,255 @@ class ColorAnalyzer:
                 'error': str(e)
             }
     
+    def evaluate_dominant_colors(self, image_path: str):
+        """
+        Hızlı motoru referans KMeans çıktısıyla karşılaştır
+        
+        Her referans renk en yakın hızlı renkle eşleştirilir; RGB mesafesi ve
+        yüzde farkı raporlanır.
+        """
+        start = time.perf_counter()
+        fast = self.extract_dominant_colors(image_path)
+        fast_ms = (time.perf_counter() - start) * 1000
+        
+        start = time.perf_counter()
+        reference = self.extract_dominant_colors_kmeans(image_path)
+        reference_ms = (time.perf_counter() - start) * 1000
+        
+        if not fast['success'] or not reference['success']:
+            return {
+                'success': False,
+                'error': fast.get('error') or reference.get('error')
+            }
+        
+        fast_rgb = np.array([c['rgb'] for c in fast['colors']], dtype=np.float64)
+        fast_pct = np.array([c['percentage'] for c in fast['colors']])
+        ref_rgb = np.array([c['rgb'] for c in reference['colors']], dtype=np.float64)
+        ref_pct = np.array([c['percentage'] for c in reference['colors']])
+        
+        distances = np.linalg.norm(ref_rgb[:, None, :] - fast_rgb[None, :, :], axis=2)
+        nearest = distances.argmin(axis=1)
+        color_errors = distances[np.arange(len(ref_rgb)), nearest]
+        
+        # Yüzdeye göre ağırlıklı ortalama hata
+        weighted_error = float(np.average(color_errors, weights=ref_pct)) if ref_pct.sum() > 0 else 0.0
+        
+        return {
+            'success': True,
+            'fast_ms': round(fast_ms, 2),
+            'reference_ms': round(reference_ms, 2),
+            'speedup': round(reference_ms / fast_ms, 1) if fast_ms > 0 else None,
+            'mean_rgb_error': round(float(color_errors.mean()), 2),
+            'weighted_rgb_error': round(weighted_error, 2),
+            'max_rgb_error': round(float(color_errors.max()), 2),
+            'percentage_error': round(float(np.abs(ref_pct - fast_pct[nearest]).mean()), 2)
+        }
+    
+    def similarity_matrix(self, rgb: np.ndarray, palette: ReferencePalette) -> np.ndarray:
+        """(N, 3) RGB renkleri x palet -> (N, M) 0-100 benzerlik matrisi"""
+        rgb = np.asarray(rgb, dtype=np.float64).reshape(-1, 3)
+        
+        if self.metric == 'rgb':
+            distances = np.linalg.norm(rgb[:, None, :] - palette.rgb[None, :, :], axis=2)
+            max_distance = np.sqrt(3 * (255 ** 2))
+            return (1 - (distances / max_distance)) * 100
+        
+        lab = rgb_to_lab(rgb)
+        if self.metric == 'cie76':
+            delta_e = delta_e_76(lab[:, None, :], palette.lab[None, :, :])
+        else:
+            delta_e = delta_e_2000(lab[:, None, :], palette.lab[None, :, :])
+        return delta_e_to_similarity(delta_e)
+    
     def compare_colors(self, color1: list, color2: list):
-        """Compare two RGB colors using Euclidean distance"""
-        color1 = np.array(color1)
-        color2 = np.array(color2)
-        distance = np.linalg.norm(color1 - color2)
+        """Compare two RGB colors (RGB distance by default, see metric)"""
+        if self.metric == 'rgb':
+            color1 = np.array(color1)
+            color2 = np.array(color2)
+            distance = np.linalg.norm(color1 - color2)
+            
+            # Normalize to 0-100 similarity score
+            max_distance = np.sqrt(3 * (255 ** 2))
+            similarity = (1 - (distance / max_distance)) * 100
+            
+            return round(float(similarity), 2)
+        
+        lab1, lab2 = rgb_to_lab(color1), rgb_to_lab(color2)
+        if self.metric == 'cie76':
+            delta_e = delta_e_76(lab1, lab2)
+        else:
+            delta_e = delta_e_2000(lab1, lab2)
+        
+        return round(float(delta_e_to_similarity(delta_e)), 2)
+    
+    # ========================================================================
+    # TOPLU (BATCH) ÜRÜN RENK EŞLEŞTİRME
+    # ========================================================================
+    
+    @staticmethod
+    def _hex_to_rgb(hex_color: str) -> list:
+        hex_color = hex_color.lstrip('#')
+        return [int(hex_color[i:i+2], 16) for i in (0, 2, 4)]
+    
+    @staticmethod
+    def _bbox_array(detections: list) -> np.ndarray:
+        """Detections -> (N, 4) int array; accepts [x1, y1, x2, y2] or {'x1': ...}"""
+        boxes = np.zeros((len(detections), 4), dtype=np.int64)
+        for i, det in enumerate(detections):
+            bbox = det.get('bbox')
+            if isinstance(bbox, dict):
+                bbox = [bbox.get('x1', 0), bbox.get('y1', 0), bbox.get('x2', 0), bbox.get('y2', 0)]
+            if bbox:
+                boxes[i] = [int(v) for v in bbox[:4]]
+        return boxes
+    
+    def _crop_samples(self, image: np.ndarray, boxes: np.ndarray, grid: int = 16):
+        """
+        Sample a grid x grid lattice inside every bbox at once
+        
+        Kutular görüntü sınırına kırpılır; kırpımdan sonra alanı kalmayan
+        (dejenere veya tamamen görüntü dışı) kutular örneklenmez.
         
-        # Normalize to 0-100 similarity score
-        max_distance = np.sqrt(3 * (255 ** 2))
-        similarity = (1 - (distance / max_distance)) * 100
+        Returns:
+            (samples (V, grid*grid, 3), valid (N,) bool) - V = valid.sum()
+        """
+        height, width = image.shape[:2]
+        x1 = np.clip(boxes[:, 0], 0, width)
+        y1 = np.clip(boxes[:, 1], 0, height)
+        x2 = np.clip(boxes[:, 2], 0, width)
+        y2 = np.clip(boxes[:, 3], 0, height)
+        valid = (x2 > x1) & (y2 > y1)
+        x1, y1, x2, y2 = x1[valid], y1[valid], x2[valid], y2[valid]
         
-        return round(similarity, 2)
+        steps = (np.arange(grid) + 0.5) / grid
+        xs = (x1[:, None] + steps[None, :] * (x2 - x1)[:, None]).astype(np.int64)
+        ys = (y1[:, None] + steps[None, :] * (y2 - y1)[:, None]).astype(np.int64)
+        
+        samples = image[ys[:, :, None], xs[:, None, :]]
+        return samples.reshape(len(xs), grid * grid, 3), valid
+    
+    def dominant_colors_for_boxes(self, image: np.ndarray, boxes: np.ndarray, bits: int = 4) -> np.ndarray:
+        """
+        Her bbox için baskın renk (vektörel histogram modu)
+        
+        Tüm kırpımlar tek bir bincount ile histogramlanır; en kalabalık
+        bin içindeki örneklerin ortalaması baskın renk olarak döner.
+        Görüntüyle kesişmeyen kutuların satırı NaN'dır.
+        """
+        dominant = np.full((len(boxes), 3), np.nan)
+        if len(boxes) == 0:
+            return dominant
+        
+        samples, valid = self._crop_samples(image, boxes)
+        n_crops, n_samples = samples.shape[:2]
+        if n_crops == 0:
+            return dominant
+        
+        shift = 8 - bits
+        q = (samples >> shift).astype(np.int64)
+        bins = (q[..., 0] << (2 * bits)) | (q[..., 1] << bits) | q[..., 2]
+        
+        n_bins = 1 << (3 * bits)
+        offsets = (np.arange(n_crops) * n_bins)[:, None]
+        hist = np.bincount((bins + offsets).ravel(), minlength=n_crops * n_bins).reshape(n_crops, n_bins)
+        mode = hist.argmax(axis=1)
+        
+        mask = bins == mode[:, None]
+        sums = (samples.astype(np.float64) * mask[..., None]).sum(axis=1)
+        dominant[valid] = sums / mask.sum(axis=1)[:, None]
+        return dominant
+    
+    # ========================================================================
+    # RENK İMZASI (SKU AYRIŞTIRMA İÇİN)
+    # ========================================================================
+    
+    SIGNATURE_BITS = 2  # Kanal başına 4 bin -> 64 boyutlu imza
+    
+    def _signatures_from_samples(self, samples: np.ndarray) -> np.ndarray:
+        """(N, S, 3) örnek -> (N, 64) Hellinger gömülü histogram imzaları"""
+        bits = self.SIGNATURE_BITS
+        n_bins = 1 << (3 * bits)
+        n_rows = samples.shape[0]
+        
+        shift = 8 - bits
+        q = (samples >> shift).astype(np.int64)
+        bins = (q[..., 0] << (2 * bits)) | (q[..., 1] << bits) | q[..., 2]
+        
+        offsets = (np.arange(n_rows) * n_bins)[:, None]
+        hist = np.bincount((bins + offsets).ravel(), minlength=n_rows * n_bins).reshape(n_rows, n_bins)
+        hist = hist / np.maximum(hist.sum(axis=1, keepdims=True), 1)
+        
+        # sqrt: Öklid mesafesi Hellinger mesafesine denk gelir (KD-tree için)
+        return np.sqrt(hist)
+    
+    def color_signature_from_array(self, image: np.ndarray) -> np.ndarray:
+        """Tüm görüntü için renk imzası (RGB dizi)"""
+        pixels = self._sample_pixels(image)
+        return self._signatures_from_samples(pixels[None, :, :])[0]
+    
+    def color_signature(self, image_path: str):
+        """Referans ürün görüntüsünden renk imzası (liste) veya None"""
+        try:
+            return self.color_signature_from_array(self._read_rgb(image_path)).round(5).tolist()
+        except Exception as e:
+            print(f"⚠️ Renk imzası hesaplanamadı ({image_path}): {e}")
+            return None
+    
+    def signatures_for_boxes(self, image: np.ndarray, detections: list) -> np.ndarray:
+        """Tüm tespit kırpımları için imzalar, tek geçişte -> (N, 64); görüntü dışı kutular NaN"""
+        signatures = np.full((len(detections), 1 << (3 * self.SIGNATURE_BITS)), np.nan)
+        if not detections:
+            return signatures
+        
+        samples, valid = self._crop_samples(image, self._bbox_array(detections))
+        if len(samples):
+            signatures[valid] = self._signatures_from_samples(samples)
+        return signatures
+    
+    def analyze_detections_colors(self, image: np.ndarray, detections: list, reference_colors):
+        """
+        Tüm tespitlerin renk analizini tek geçişte yap
+        
+        Args:
+            image: RGB görüntü (decode edilmiş)
+            detections: YOLO tespit listesi ('class_name' veya 'class', 'bbox')
+            reference_colors: ReferencePalette veya {class_name: {"primary": "#FF0000", ...}}
+        
+        Returns:
+            Tespit sırasıyla hizalı liste; referans rengi olmayan sınıflar ve
+            görüntüyle kesişmeyen kutular için None
+        """
+        if not detections:
+            return []
+        
+        palette = reference_colors
+        if not isinstance(palette, ReferencePalette):
+            palette = ReferencePalette(reference_colors)
+        
+        dominant = self.dominant_colors_for_boxes(image, self._bbox_array(detections))
+        
+        # Tespitler x referanslar benzerlik matrisi (tek vektörel işlem)
+        similarity = None
+        if len(palette):
+            similarity = np.round(self.similarity_matrix(dominant, palette), 2)
+        
+        results = []
+        for i, det in enumerate(detections):
+            class_name = det.get('class_name', det.get('class'))
+            columns = palette.class_columns.get(class_name)
+            if columns is None or np.isnan(dominant[i, 0]):
+                results.append(None)
+                continue
+            
+            scores = {palette.color_names[c]: float(similarity[i, c]) for c in columns}
+            results.append({
+                'success': True,
+                'dominant_color': [int(round(v)) for v in dominant[i]],
+                'color_match_scores': scores,
+                'best_match': max(scores.items(), key=lambda x: x[1])[0] if scores else None
+            })
+        
+        return results
     
     def analyze_product_colors(self, image_path: str, bbox: list, reference_colors: dict):
         """Analyze colors in specific product region"""
@@ -68,33 +637,28 @@ class ColorAnalyzer:
             image = cv2.imread(image_path)
             image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
             
-            # Crop to bbox
-            x1, y1, x2, y2 = map(int, bbox)
-            product_region = image[y1:y2, x1:x2]
+            dominant = self.dominant_colors_for_boxes(image, self._bbox_array([{'bbox': bbox}]))[0]
+            if np.isnan(dominant[0]):
+                return {
+                    'success': False,
+                    'error': 'bbox does not intersect the image'
+                }
             
-            # Get dominant colors
-            pixels = product_region.reshape(-1, 3)
-            kmeans = KMeans(n_clusters=min(3, len(pixels)), random_state=42, n_init=10)
-            kmeans.fit(pixels)
-            dominant = kmeans.cluster_centers_.astype(int)[0].tolist()
-            
-            # Compare with reference colors
-            color_match_scores = {}
-            for color_name, hex_color in reference_colors.items():
-                # Convert hex to RGB
-                hex_color = hex_color.lstrip('#')
-                ref_rgb = [int(hex_color[i:i+2], 16) for i in (0, 2, 4)]
-                
-                # Calculate similarity
-                similarity = self.compare_colors(dominant, ref_rgb)
-                color_match_scores[color_name] = similarity
+            result = self.analyze_detections_colors(
+                image,
+                [{'class_name': '_product', 'bbox': bbox}],
+                {'_product': reference_colors}
+            )[0]
             
-            return {
-                'success': True,
-                'dominant_color': dominant,
-                'color_match_scores': color_match_scores,
-                'best_match': max(color_match_scores.items(), key=lambda x: x[1])[0] if color_match_scores else None
-            }
+            if result is None:
+                result = {
+                    'success': True,
+                    'dominant_color': [int(round(v)) for v in dominant],
+                    'color_match_scores': {},
+                    'best_match': None
+                }
+            
+            return result
         
         except Exception as e:
             return {
@@ -1,8 +1,25 @@
 ﻿import numpy as np
 
 
+RULE_TYPES = ['shelf_coverage', 'product_visibility', 'planogram_compliance', 'color_match']
+DEFAULT_COVERAGE_BAND = (70.0, 85.0)
+
+
+def coverage_band(parameters: dict = None) -> tuple:
+    """shelf_coverage kural parametrelerinden (ideal_min, ideal_max); geçersizse ValueError"""
+    parameters = parameters or {}
+    try:
+        ideal_min = float(parameters.get('ideal_min', DEFAULT_COVERAGE_BAND[0]))
+        ideal_max = float(parameters.get('ideal_max', DEFAULT_COVERAGE_BAND[1]))
+    except (TypeError, ValueError):
+        raise ValueError("ideal_min and ideal_max must be numbers")
+    if not 0 < ideal_min <= ideal_max <= 100:
+        raise ValueError("shelf_coverage requires 0 < ideal_min <= ideal_max <= 100")
+    return ideal_min, ideal_max
+
+
 class ScoringEngine:
-    def __init__(self, scoring_rules: list = None):
+    def __init__(self, scoring_rules: list = None, coverage_ideal_min: float = 70, coverage_ideal_max: float = 85):
         self.scoring_rules = scoring_rules or []
         self.default_weights = {
             'shelf_coverage': 0.25,
@@ -10,16 +27,20 @@ class ScoringEngine:
             'planogram_compliance': 0.25,
             'color_match': 0.20
         }
+        # İdeal raf doluluk bandı (şirket kuralıyla değiştirilebilir)
+        self.coverage_ideal_min = coverage_ideal_min
+        self.coverage_ideal_max = coverage_ideal_max
     
     def calculate_shelf_coverage_score(self, coverage_percent: float):
         """Score based on shelf coverage percentage"""
-        # Ideal coverage is 70-85%
-        if 70 <= coverage_percent <= 85:
+        # Ideal coverage is 70-85% by default
+        ideal_min, ideal_max = self.coverage_ideal_min, self.coverage_ideal_max
+        if ideal_min <= coverage_percent <= ideal_max:
             score = 100
-        elif coverage_percent < 70:
-            score = (coverage_percent / 70) * 100
+        elif coverage_percent < ideal_min:
+            score = (coverage_percent / ideal_min) * 100
         else:
-            score = 100 - ((coverage_percent - 85) * 2)
+            score = 100 - ((coverage_percent - ideal_max) * 2)
         
         return max(0, min(100, score))
     
@@ -84,3 +105,176 @@ class ScoringEngine:
             'component_scores': scores,
             'weights_used': weights
         }
+    
+    # ========================================================================
+    # TOPLU (VEKTÖREL) PUANLAMA
+    # ========================================================================
+    
+    POSITIONS = ('left', 'center', 'right')
+    
+    @classmethod
+    def distribution_matrix(cls, distributions: list) -> np.ndarray:
+        """List of {'left', 'center', 'right'} dicts -> (N, 3) array, NaN rows for missing"""
+        matrix = np.full((len(distributions), 3), np.nan)
+        for i, distribution in enumerate(distributions):
+            if distribution:
+                matrix[i] = [distribution.get(position, 0) for position in cls.POSITIONS]
+        return matrix
+    
+    def calculate_total_scores_batch(self, columns: dict, weights: dict = None):
+        """
+        Vectorized calculate_total_score for many analyses at once
+        
+        Args:
+            columns: Kolon bazlı diziler (hepsi N uzunlukta)
+                - shelf_coverage: (N,)
+                - visibility_score: (N,)
+                - expected_distribution: (N, 3) veya (3,) ya da dict (tüm satırlar için)
+                - actual_distribution: (N, 3); NaN satır = dağılım yok
+                - color_match: (N,) ortalama renk eşleşme skoru; NaN = eşleşme yok
+                - planogram_score: (N,) opsiyonel; dağılım yoksa kullanılacak hazır skor
+            weights: Bileşen ağırlıkları (varsayılan: default_weights)
+        
+        Returns:
+            {'total_score': (N,), 'component_scores': {bileşen: (N,)}, 'weights_used': weights}
+        """
+        weights = weights or self.default_weights
+        
+        coverage = np.asarray(columns.get('shelf_coverage', []), dtype=np.float64)
+        n = len(coverage)
+        coverage = np.nan_to_num(coverage)
+        
+        # Shelf coverage: ideal band (default 70-85%)
+        ideal_min, ideal_max = self.coverage_ideal_min, self.coverage_ideal_max
+        coverage_score = np.where(
+            coverage < ideal_min,
+            (coverage / ideal_min) * 100,
+            np.where(coverage <= ideal_max, 100.0, 100 - ((coverage - ideal_max) * 2))
+        )
+        coverage_score = np.clip(coverage_score, 0, 100)
+        
+        visibility = np.nan_to_num(np.asarray(columns.get('visibility_score', np.zeros(n)), dtype=np.float64))
+        visibility_score = np.minimum(100, visibility)
+        
+        # Planogram compliance
+        expected = columns.get('expected_distribution', {'left': 33, 'center': 34, 'right': 33})
+        if isinstance(expected, dict):
+            expected = [expected.get(position, 0) for position in self.POSITIONS]
+        expected = np.broadcast_to(np.asarray(expected, dtype=np.float64), (n, 3))
+        actual = np.asarray(columns.get('actual_distribution', np.full((n, 3), np.nan)), dtype=np.float64).reshape(n, 3)
+        
+        missing = np.isnan(actual).any(axis=1) | np.isnan(expected).any(axis=1)
+        total_diff = np.abs(expected - actual).sum(axis=1)
+        max_diff = expected.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            planogram_score = np.where(max_diff > 0, (1 - (total_diff / max_diff)) * 100, 50.0)
+        planogram_score = np.clip(planogram_score, 0, 100)
+        
+        precomputed = columns.get('planogram_score')
+        if precomputed is not None:
+            precomputed = np.asarray(precomputed, dtype=np.float64)
+            fallback = np.where(np.isnan(precomputed), 50.0, precomputed)
+        else:
+            fallback = np.full(n, 50.0)
+        planogram_score = np.where(missing, fallback, planogram_score)
+        
+        # Color match
+        color = np.asarray(columns.get('color_match', np.full(n, np.nan)), dtype=np.float64)
+        color_score = np.where(np.isnan(color), 50.0, np.round(color, 2))
+        
+        scores = {
+            'shelf_coverage': coverage_score,
+            'product_visibility': visibility_score,
+            'planogram_compliance': planogram_score,
+            'color_match': color_score
+        }
+        
+        total_score = sum(
+            scores[key] * weights.get(key, 0.25)
+            for key in scores.keys()
+        )
+        
+        return {
+            'total_score': np.round(total_score, 2),
+            'component_scores': scores,
+            'weights_used': weights
+        }
+
+
+class ScoringProfile:
+    """
+    Bir şirketin derlenmiş puanlama profili
+    
+    ScoringRule satırlarından bir kez üretilir: normalize ağırlıklar, kural
+    parametreleri ve hazır bir ScoringEngine. Puanlama yalnızca bellek içi
+    bir çağrıdır.
+    """
+    
+    DEFAULT_EXPECTED_DISTRIBUTION = {'left': 33, 'center': 34, 'right': 33}
+    
+    def __init__(self, company_id: int, rules: list = None, version: int = 0):
+        self.company_id = company_id
+        self.version = version
+        self.rules_count = len(rules or [])
+        self.parameters = {}
+        
+        if not rules:
+            self.weights = dict(ScoringEngine().default_weights)
+        else:
+            # Build custom weights from rules
+            self.weights = {}
+            total_weight = sum(rule['weight'] or 0 for rule in rules)
+            
+            for rule in rules:
+                normalized_weight = (rule['weight'] or 0) / total_weight if total_weight > 0 else 0.25
+                self.weights[rule['rule_type']] = normalized_weight
+                if rule.get('parameters'):
+                    self.parameters.setdefault(rule['rule_type'], {}).update(rule['parameters'])
+            
+            # Fill missing weights with 0
+            for key in RULE_TYPES:
+                if key not in self.weights:
+                    self.weights[key] = 0.0
+        
+        # Kural parametreleri: ör. shelf_coverage -> {"ideal_min": 60, "ideal_max": 80}
+        try:
+            self.coverage_ideal_min, self.coverage_ideal_max = coverage_band(self.parameters.get('shelf_coverage'))
+        except ValueError as e:
+            # API'den önce kaydedilmiş bozuk kural: puanlama varsayılan bantla sürer
+            print(f"⚠️ Şirket {company_id} shelf_coverage parametreleri geçersiz ({e}), varsayılan bant kullanılıyor")
+            self.coverage_ideal_min, self.coverage_ideal_max = DEFAULT_COVERAGE_BAND
+        
+        planogram_params = self.parameters.get('planogram_compliance', {})
+        self.expected_distribution = planogram_params.get(
+            'expected_distribution', self.DEFAULT_EXPECTED_DISTRIBUTION
+        )
+        
+        self.engine = ScoringEngine(
+            coverage_ideal_min=self.coverage_ideal_min,
+            coverage_ideal_max=self.coverage_ideal_max
+        )
+    
+    def score(self, metrics: dict):
+        """calculate_total_score with the company's weights and thresholds"""
+        metrics = dict(metrics)
+        if not metrics.get('expected_distribution'):
+            metrics['expected_distribution'] = self.expected_distribution
+        return self.engine.calculate_total_score(metrics, self.weights)
+    
+    def score_batch(self, columns: dict):
+        """calculate_total_scores_batch with the company's weights and thresholds"""
+        columns = dict(columns)
+        if columns.get('expected_distribution') is None:
+            columns['expected_distribution'] = self.expected_distribution
+        return self.engine.calculate_total_scores_batch(columns, self.weights)
+    
+    def to_dict(self):
+        return {
+            'company_id': self.company_id,
+            'version': self.version,
+            'rules_count': self.rules_count,
+            'weights': self.weights,
+            'parameters': self.parameters,
+            'coverage_ideal_band': [self.coverage_ideal_min, self.coverage_ideal_max],
+            'expected_distribution': self.expected_distribution
+        }
@@ -279,16 +279,19 @@ class ShelfAnalyzer:
     # ANA ANALİZ FONKSİYONU
     # ========================================================================
     
-    def analyze_shelf(self, detections: list, full_image: np.ndarray = None) -> Dict:
+    def analyze_shelf(self, detections: list, full_image: np.ndarray = None, image_scale: float = 1.0) -> Dict:
         """
         Komple raf analizi
         
         Args:
             detections: YOLO tespit listesi
             full_image: Tam raf görüntüsü (opsiyonel, klasik metrikler için)
+            image_scale: full_image genişliği / orijinal genişlik (çıkarım kopyası)
         
         Returns:
-            Yapılandırılmış analiz sonucu
+            Yapılandırılmış analiz sonucu; klasik metrikler hesaplandıysa
+            'classic_metrics_scale' hangi ölçekte hesaplandıklarını gösterir
+            (kenar yoğunluğu çözünürlüğe bağlıdır)
         """
         # Ürünleri gözlere ata
         eye_detections = self.assign_detections_to_eyes(detections)
@@ -317,6 +320,8 @@ class ShelfAnalyzer:
                 'visibility_score': self.calculate_visibility_score(detections)
             }
         }
+        if full_image is not None:
+            analysis['classic_metrics_scale'] = round(image_scale, 4)
         
         # Ağırlıklı genel skor
         if eye_analyses:
@@ -350,6 +355,11 @@ class ShelfAnalyzer:
             'improved_eyes': []
         }
         
+        # Farklı ölçekte hesaplanmış klasik metrikler doğrudan karşılaştırılamaz
+        # (işaret yoksa analiz orijinal görüntü üzerinde yapılmıştır)
+        if previous.get('classic_metrics_scale', 1.0) != current.get('classic_metrics_scale', 1.0):
+            comparison['scale_mismatch'] = True
+        
         # Genel skor karşılaştırması
         prev_score = previous.get('summary', {}).get('total_score', 0)
         curr_score = current.get('summary', {}).get('total_score', 0)
@@ -0,0 +1,104 @@
+﻿import numpy as np
+
+
+class ColorSignatureIndex:
+    """
+    Şirket bazlı ürün renk imzası indeksi (KD-tree)
+    
+    Genel YOLO sınıflarını ("bottle" gibi) en yakın SKU'lara eşler.
+    Ürünler tek tek eklenir/çıkarılır; ağaç yalnızca bir sorgu geldiğinde
+    ve içerik değiştiyse yeniden kurulur.
+    """
+    
+    def __init__(self, company_id: int):
+        self.company_id = company_id
+        self.version = None
+        # {product_id: {'name', 'sku', 'package_type', 'updated_at', 'signature'}}
+        self.entries = {}
+        self._tree = None
+        self._ids = []
+        self._dirty = True
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def upsert(self, product_id: int, name: str, signature, sku: str = None,
+               package_type: str = None, updated_at=None):
+        """Bir ürünün imzasını ekle veya güncelle"""
+        if signature is None:
+            self.remove(product_id)
+            return
+        
+        self.entries[product_id] = {
+            'name': name,
+            'sku': sku,
+            'package_type': package_type,
+            'updated_at': updated_at,
+            'signature': np.asarray(signature, dtype=np.float64)
+        }
+        self._dirty = True
+    
+    def remove(self, product_id: int):
+        if self.entries.pop(product_id, None) is not None:
+            self._dirty = True
+    
+    def _build(self):
+        from sklearn.neighbors import KDTree
+        
+        self._ids = list(self.entries.keys())
+        if self._ids:
+            matrix = np.vstack([self.entries[pid]['signature'] for pid in self._ids])
+            self._tree = KDTree(matrix, leaf_size=16)
+        else:
+            self._tree = None
+        self._dirty = False
+    
+    def query(self, signatures: np.ndarray, k: int = 3, package_types: list = None) -> list:
+        """
+        Her imza için en yakın k ürün
+        
+        Args:
+            signatures: (N, D) tespit imzaları
+            k: aday sayısı
+            package_types: tespit başına YOLO sınıfı; eşleşen package_type'a
+                sahip ürün varsa adaylar onlarla sınırlandırılır
+        
+        Returns:
+            N elemanlı liste; her eleman [{'product_id', 'name', 'sku', 'distance'}, ...]
+            (imzası NaN olan, görüntü dışı tespitler için boş liste)
+        """
+        if self._dirty:
+            self._build()
+        
+        signatures = np.asarray(signatures, dtype=np.float64)
+        results = [[] for _ in range(len(signatures))]
+        valid_rows = np.flatnonzero(np.isfinite(signatures).all(axis=1)) if len(signatures) else []
+        if self._tree is None or len(valid_rows) == 0:
+            return results
+        
+        # Paket tipi filtresi için fazladan aday çek
+        n_query = min(len(self._ids), k * 4 if package_types else k)
+        distances, indices = self._tree.query(signatures[valid_rows], k=n_query)
+        
+        known_types = {entry['package_type'] for entry in self.entries.values() if entry['package_type']}
+        
+        for position, row in enumerate(valid_rows):
+            wanted_type = package_types[row] if package_types else None
+            candidates = []
+            for distance, idx in zip(distances[position], indices[position]):
+                product_id = self._ids[idx]
+                entry = self.entries[product_id]
+                if wanted_type in known_types and entry['package_type'] != wanted_type:
+                    continue
+                candidates.append({
+                    'product_id': product_id,
+                    'name': entry['name'],
+                    'sku': entry['sku'],
+                    # Hellinger mesafesi 0-1 aralığında (sqrt(2) ile normalize)
+                    'distance': round(float(distance / np.sqrt(2)), 4)
+                })
+                if len(candidates) >= k:
+                    break
+            results[row] = candidates
+        
+        return results
@@ -1,23 +1,29 @@
 ﻿import os
-from ultralytics import YOLO
 import cv2
+import threading
 import numpy as np
+from collections import OrderedDict
 from pathlib import Path
 
+# Süreç içinde açık tutulan YOLO model sayısı (şirket modelleri + varsayılan)
+YOLO_MODEL_CACHE_SIZE = int(os.getenv("YOLO_MODEL_CACHE_SIZE", "4"))
+
 
 class YOLOInference:
     def __init__(self, model_path: str):
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model not found: {model_path}")
         
+        from ultralytics import YOLO  # torch dahil ağır; ilk model yüklemesinde
+        
         self.model = YOLO(model_path)
         self.model_path = model_path
     
-    def predict(self, image_path: str, conf_threshold: float = 0.25):
-        """Run inference on image"""
+    def predict(self, image_path, conf_threshold: float = 0.25):
+        """Run inference on image (dosya yolu veya okunmuş BGR dizi)"""
         try:
             # Read image
-            image = cv2.imread(image_path)
+            image = image_path if isinstance(image_path, np.ndarray) else cv2.imread(image_path)
             if image is None:
                 raise ValueError(f"Cannot read image: {image_path}")
             
@@ -87,3 +93,70 @@ class YOLOInference:
             cv2.imwrite(output_path, image)
         
         return image
+
+
+def detections_from_result(result, names: dict) -> list:
+    """Ultralytics Results -> /analyze tespit formatı (class, confidence, x, y, bbox)"""
+    detections = []
+    for box in result.boxes:
+        x1, y1, x2, y2 = box.xyxy[0].tolist()
+        detections.append({
+            "class": names[int(box.cls[0])],
+            "confidence": float(box.conf[0]),
+            "x": int((x1 + x2) / 2),
+            "y": int((y1 + y2) / 2),
+            "bbox": {
+                "x1": int(x1),
+                "y1": int(y1),
+                "x2": int(x2),
+                "y2": int(y2)
+            }
+        })
+    return detections
+
+
+class SharedYOLO:
+    """
+    Süreç içinde paylaşılan YOLO modeli
+    
+    Model her istekte yeniden yüklenmez; predictor thread-safe olmadığı için
+    predict çağrıları model başına bir kilitle sıraya alınır.
+    """
+    
+    def __init__(self, model_path: str):
+        from ultralytics import YOLO  # torch dahil ağır; ilk model yüklemesinde
+        
+        self.model = YOLO(model_path)
+        self.model_path = model_path
+        self.names = self.model.names
+        self._lock = threading.Lock()
+    
+    def predict(self, images: list, conf_threshold: float = 0.25) -> list:
+        """
+        Görüntü listesi için tek seferde (batch) çıkarım
+        
+        Returns:
+            Her görüntü için tespit listesi (detections_from_result)
+        """
+        if not images:
+            return []
+        with self._lock:
+            results = self.model.predict(source=images, conf=conf_threshold, save=False, verbose=False)
+        return [detections_from_result(result, self.names) for result in results]
+
+
+_shared_models = OrderedDict()
+_shared_lock = threading.Lock()
+
+
+def get_shared_model(model_path: str) -> SharedYOLO:
+    """Önbellekteki modeli getir, yoksa yükle (en az kullanılan düşürülür)"""
+    with _shared_lock:
+        model = _shared_models.get(model_path)
+        if model is None:
+            model = SharedYOLO(model_path)
+            _shared_models[model_path] = model
+            while len(_shared_models) > YOLO_MODEL_CACHE_SIZE:
+                _shared_models.popitem(last=False)
+        _shared_models.move_to_end(model_path)
+        return model
@@ -1,5 +1,4 @@
 ﻿import os
-from ultralytics import YOLO
 from pathlib import Path
 import yaml
 from datetime import datetime
@@ -37,11 +36,22 @@ class YOLOTrainer:
         
         return str(yaml_path)
     
-    def train(self, yaml_path: str, epochs: int = 50, batch: int = 16, imgsz: int = 640):
-        """Train YOLO model"""
+    def train(self, yaml_path: str, epochs: int = 50, batch: int = 16, imgsz: int = 640, on_epoch_end=None):
+        """
+        Train YOLO model
+        
+        on_epoch_end(epoch, total_epochs): her epoch sonunda çağrılır (ilerleme)
+        """
         try:
+            from ultralytics import YOLO  # torch dahil ağır; sadece eğitimde yüklenir
+            
             # Load base model
             model = YOLO(self.base_model)
+            if on_epoch_end:
+                model.add_callback(
+                    "on_fit_epoch_end",
+                    lambda trainer: on_epoch_end(trainer.epoch + 1, trainer.epochs)
+                )
             
             # Train
             results = model.train(
@@ -89,6 +99,8 @@ class YOLOTrainer:
     def validate(self, model_path: str, yaml_path: str):
         """Validate trained model"""
         try:
+            from ultralytics import YOLO
+            
             model = YOLO(model_path)
             results = model.val(data=yaml_path)
             
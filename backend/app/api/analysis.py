@@ -1,16 +1,29 @@
-﻿from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+﻿from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Response, Request
+from sqlalchemy.orm import Session, load_only
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Union
 import os
-import shutil
 import time
 import json
+from datetime import datetime, timedelta
 
 from app.models.database import get_db, Analysis, Model, Company
-from app.tasks.training_tasks import analyze_image_task, celery_app
+from app.services.pagination import keyset_page
+from app.services.rollups import record_analysis, get_daily_trend
+from app.services.detection_store import store_detections, summarize_detections, pack_detection_list, load_packed_detections, GROUP_BY_OPTIONS
+from app.services.analysis_archive import load_archived_payloads, resolve_payload
+from app.services.response_cache import cached_response, invalidate_responses
+from app.services.blob_store import store_upload, receive_upload, discard_upload, store_received, remove_orphan
+from app.services.derivatives import prepare_inference_image, schedule_derivatives
+from app.services.admission import analysis_admission
+from app.services.single_flight import flight_key, join_flight
+from app.services.compact import FastJSONResponse, parse_fields, select_fields
 
-router = APIRouter()
+# Yanıtlar orjson ile yazılır (app.services.compact)
+router = APIRouter(default_response_class=FastJSONResponse)
 
 
 class AnalysisRequest(BaseModel):
@@ -34,15 +47,100 @@ class AnalysisResultResponse(BaseModel):
     planogram_score: float
     total_score: float
     analysis_date: str
+    # Sadece ?include=detections,color_analysis ile döner
+    # Hibrit/toplu analizler dict ({'summary', 'eyes', ...}), Celery analizleri tespit listesi saklar
+    detections: Optional[Union[dict, list]] = None
+    color_analysis: Optional[dict] = None
 
     class Config:
         from_attributes = True
 
 
+# Liste/geçmiş sorgularında yüklenen kolonlar (büyük JSON alanlar hariç)
+ANALYSIS_LIST_COLUMNS = (
+    Analysis.id,
+    Analysis.company_id,
+    Analysis.model_id,
+    Analysis.shelf_id,
+    Analysis.total_products,
+    Analysis.product_counts,
+    Analysis.shelf_coverage,
+    Analysis.visibility_score,
+    Analysis.planogram_score,
+    Analysis.total_score,
+    Analysis.analysis_date,
+    Analysis.archived_at,
+    Analysis.archive_path,
+)
+
+# ?include= ile açıkça istenebilecek büyük alanlar
+ANALYSIS_INCLUDE_FIELDS = {
+    'detections': Analysis.detections,
+    'color_analysis': Analysis.color_analysis,
+}
+
+
 # ============================================================================
 # YARDIMCI FONKSİYONLAR
 # ============================================================================
 
+def parse_include(include: Optional[str]) -> List[str]:
+    """?include=detections,color_analysis -> alan listesi"""
+    if not include:
+        return []
+    
+    fields = [f.strip() for f in include.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in ANALYSIS_INCLUDE_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown include field(s): {', '.join(unknown)}. Allowed: {', '.join(ANALYSIS_INCLUDE_FIELDS)}"
+        )
+    return fields
+
+
+def analysis_projection(include_fields: List[str]):
+    """Liste kolonları + istenen büyük alanlar için load_only"""
+    columns = ANALYSIS_LIST_COLUMNS + tuple(ANALYSIS_INCLUDE_FIELDS[f] for f in include_fields)
+    return load_only(*columns)
+
+
+def serialize_analysis(a: Analysis, include_fields: List[str], archived_payloads: dict = None) -> dict:
+    """
+    Analysis -> response dict
+    
+    Sadece yüklenmiş kolonlara dokunur; ertelenmiş JSON alanlara erişip
+    satır başına ek sorgu tetiklemez. Arşivlenmiş analizlerin JSON alanları
+    archived_payloads'tan (load_archived_payloads) gelir.
+    """
+    data = {
+        'id': a.id,
+        'company_id': a.company_id,
+        'model_id': a.model_id,
+        'total_products': a.total_products,
+        'product_counts': a.product_counts,
+        'shelf_coverage': a.shelf_coverage,
+        'visibility_score': a.visibility_score,
+        'planogram_score': a.planogram_score,
+        'total_score': a.total_score,
+        'analysis_date': str(a.analysis_date)
+    }
+    for field in include_fields:
+        if a.archived_at:
+            data[field] = (archived_payloads or {}).get(a.id, {}).get(field)
+        else:
+            data[field] = getattr(a, field)
+    return data
+
+
+def load_included_payloads(analyses: list, include_fields: List[str]) -> dict:
+    """?include= istendiyse arşivlenmiş analizlerin JSON'unu toplu oku"""
+    archived = [a for a in analyses if a.archived_at]
+    if not include_fields or not archived:
+        return {}
+    return load_archived_payloads(archived)
+
+
 def get_company_model(company_id: int, db: Session):
     """
     Şirketin aktif modelini getir
@@ -79,7 +177,7 @@ def get_company_model(company_id: int, db: Session):
 # UPLOAD AND ANALYZE (CELERY İLE)
 # ============================================================================
 
-@router.post("/upload", response_model=AnalysisResponse)
+@router.post("/upload", response_model=AnalysisResponse, dependencies=[Depends(analysis_admission)])
 async def upload_and_analyze(
     company_id: int,
     model_id: int,
@@ -99,19 +197,14 @@ async def upload_and_analyze(
     if model.status != "completed":
         raise HTTPException(status_code=400, detail="Model is not ready for inference")
 
-    # Save uploaded image
-    upload_dir = os.getenv("UPLOAD_DIR", "./uploads")
-    analysis_dir = os.path.join(upload_dir, "analysis_images")
-    os.makedirs(analysis_dir, exist_ok=True)
-
-    file_ext = os.path.splitext(file.filename)[1]
-    filename = f"analysis_{company_id}_{model_id}_{int(time.time())}{file_ext}"
-    file_path = os.path.join(analysis_dir, filename)
-
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Save uploaded image (içerik adresli depo; referans worker'ın analizi için)
+    blob = await store_upload(db, file)
+    db.commit()
+    file_path = blob.path
+    schedule_derivatives(file_path)
 
     # Start analysis task
+    from app.tasks.training_tasks import analyze_image_task
     task = analyze_image_task.delay(company_id, model_id, file_path)
 
     return AnalysisResponse(
@@ -123,6 +216,7 @@ async def upload_and_analyze(
 # Get Analysis Status
 @router.get("/status/{task_id}")
 def get_analysis_status(task_id: str):
+    from app.tasks.training_tasks import celery_app
     task = celery_app.AsyncResult(task_id)
 
     response = {
@@ -148,35 +242,106 @@ def get_analysis_status(task_id: str):
 
 
 # Get Company Analyses
-@router.get("/company/{company_id}", response_model=List[AnalysisResultResponse])
-def get_company_analyses(company_id: int, limit: int = 50, db: Session = Depends(get_db)):
-    analyses = db.query(Analysis).filter(
+@router.get(
+    "/company/{company_id}",
+    response_model=List[AnalysisResultResponse],
+    response_model_exclude_unset=True
+)
+def get_company_analyses(
+    company_id: int,
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    include: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    include_fields = parse_include(include)
+    
+    # Keyset sayfalama: sonraki sayfa X-Next-Cursor header'ında
+    query = db.query(Analysis).options(analysis_projection(include_fields)).filter(
         Analysis.company_id == company_id
-    ).order_by(Analysis.analysis_date.desc()).limit(limit).all()
+    )
+    analyses, _ = keyset_page(query, Analysis.analysis_date, Analysis.id, limit, cursor, response)
+    archived_payloads = load_included_payloads(analyses, include_fields)
 
-    return analyses
+    return [serialize_analysis(a, include_fields, archived_payloads) for a in analyses]
 
 
 # Get Analysis by ID
-@router.get("/{analysis_id}", response_model=AnalysisResultResponse)
-def get_analysis(analysis_id: int, db: Session = Depends(get_db)):
-    analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
+@router.get("/{analysis_id}", response_model=AnalysisResultResponse, response_model_exclude_unset=True)
+def get_analysis(analysis_id: int, include: Optional[str] = None, db: Session = Depends(get_db)):
+    include_fields = parse_include(include)
+    
+    analysis = db.query(Analysis).options(analysis_projection(include_fields)).filter(
+        Analysis.id == analysis_id
+    ).first()
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return serialize_analysis(analysis, include_fields, load_included_payloads([analysis], include_fields))
+
+
+@router.get("/{analysis_id}/detections")
+def get_analysis_detections(analysis_id: int, db: Session = Depends(get_db)):
+    """
+    Tespitler paketlenmiş dizi biçiminde (analysis_detections tablosundan)
+    
+    Koordinatlar çıkarım kopyasındadır; orijinal = değer / image_scale.
+    """
+    analysis = db.query(Analysis).options(load_only(Analysis.id, Analysis.image_scale)).filter(
+        Analysis.id == analysis_id
+    ).first()
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
-    return analysis
+    
+    return {
+        'analysis_id': analysis.id,
+        'image_scale': analysis.image_scale or 1.0,
+        **load_packed_detections(db, analysis_id)
+    }
+
+
+@router.get("/{analysis_id}/annotated.jpg")
+def get_annotated_image(
+    analysis_id: int,
+    max_width: int = 1280,
+    eyes: bool = True,
+    scores: bool = True,
+    labels: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Tespitleri (ve istenirse göz sınırları / göz skorlarını) çizilmiş JPEG
+    
+    Seçenek başına bir kez üretilir ve diskte önbelleklenir.
+    """
+    from app.services.annotation_renderer import render_annotated
+    
+    analysis = db.query(Analysis).options(
+        load_only(Analysis.id, Analysis.image_path, Analysis.image_scale, Analysis.archived_at, Analysis.archive_path)
+    ).filter(Analysis.id == analysis_id).first()
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    path = render_annotated(db, analysis, max_width=max_width, eyes=eyes, scores=scores, labels=labels)
+    if not path:
+        raise HTTPException(status_code=404, detail="Analysis image not found")
+    return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": "private, max-age=86400"})
 
 
 # ============================================================================
 # GELİŞMİŞ ANALİZ (DİNAMİK MODEL YÜKLEME)
 # ============================================================================
 
-@router.post("/analyze")
+@router.post("/analyze", dependencies=[Depends(analysis_admission)])
 async def enhanced_analyze(
     file: UploadFile = File(...),
     eye_count: int = 3,
     shelf_id: Optional[str] = None,
     company_id: Optional[int] = 1,
     save_to_db: bool = True,
+    sku_match: bool = False,
+    fields: Optional[str] = None,
+    packed_detections: bool = False,
     db: Session = Depends(get_db)
 ):
     """
@@ -185,31 +350,48 @@ async def enhanced_analyze(
     - Klasik CV + YOLO hibrit yaklaşım
     - Zaman serisi karşılaştırma
     - Şirket bazlı özel model desteği
+    - Opsiyonel renk imzası ile SKU ayrıştırma (sku_match=true)
+    - Kompakt yanıt: ?fields=analysis_id,analysis.summary ile alan seçimi,
+      packed_detections=true ile tespitler paketlenmiş dizi olarak
     """
     start_time = time.time()
+    flight = None
+    field_tree = parse_fields(fields)
+    
+    def compact_response(response: dict):
+        if not packed_detections:
+            response = {key: value for key, value in response.items() if key != 'detections'}
+        return FastJSONResponse(select_fields(response, field_tree))
     
     try:
-        # Kalıcı klasör oluştur
-        upload_dir = os.getenv("UPLOAD_DIR", "./uploads")
-        analysis_dir = os.path.join(upload_dir, "analysis_images")
-        os.makedirs(analysis_dir, exist_ok=True)
-
-        # Dosyayı kalıcı olarak kaydet
-        file_ext = os.path.splitext(file.filename)[1]
-        timestamp = int(time.time())
-        filename = f"analysis_{company_id}_{shelf_id or 'unknown'}_{timestamp}{file_ext}"
-        file_path = os.path.join(analysis_dir, filename)
-
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Aynı görüntü + parametrelerle süren analiz varsa onun yanıtını bekle
+        # (mobil tekrar denemeleri ikinci kez çıkarım çalıştırmaz)
+        upload = await receive_upload(file)
+        flight = await join_flight(flight_key(
+            upload['sha256'],
+            eye_count=eye_count,
+            shelf_id=shelf_id,
+            company_id=company_id,
+            save_to_db=save_to_db,
+            sku_match=sku_match
+        ))
+        if flight.shared:
+            discard_upload(upload)
+            return compact_response({**flight.result, "coalesced": True})
+        
+        # Dosyayı içerik adresli depoya kaydet (aynı görüntü tekrar yazılmaz);
+        # referans analiz kaydıyla aynı transaction'da commit edilir
+        blob = store_received(db, upload)
+        file_path = blob.path
+        analysis_id = None
 
         try:
-            from ultralytics import YOLO
             import cv2
+            from app.ai.yolo_inference import get_shared_model
             from app.ai.shelf_analyzer import ShelfAnalyzer
 
-            # Görüntüyü oku
-            img = cv2.imread(file_path)
+            # Önceden boyutlandırılmış çıkarım kopyasını oku (yoksa üretilir)
+            img, image_scale = await run_in_threadpool(prepare_inference_image, db, file_path)
             if img is None:
                 raise Exception("Görüntü okunamadı")
 
@@ -225,81 +407,74 @@ async def enhanced_analyze(
             }
             
             try:
-                model = YOLO(model_path)
-                results = model(img)
-                
-                for r in results:
-                    boxes = r.boxes
-                    for box in boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].tolist()
-                        conf = float(box.conf[0])
-                        cls = int(box.cls[0])
-
-                        detections.append({
-                            "class": model.names[cls],
-                            "confidence": conf,
-                            "x": int((x1 + x2) / 2),
-                            "y": int((y1 + y2) / 2),
-                            "bbox": {
-                                "x1": int(x1),
-                                "y1": int(y1),
-                                "x2": int(x2),
-                                "y2": int(y2)
-                            }
-                        })
-                        
+                # Süreç içinde paylaşılan model (her istekte yeniden yüklenmez)
+                model = get_shared_model(model_path)
+                # Event loop bloklanmaz; aynı görüntüyle gelen istekler bu sırada birleşir
+                detections = (await run_in_threadpool(model.predict, [img]))[0]
+            except ImportError:
+                raise
             except Exception as model_error:
                 print(f"⚠️ Model hatası: {model_error}")
                 # Fallback: Varsayılan modele geç
                 if model_path != 'yolov8n.pt':
                     print("🔄 Varsayılan modele geçiliyor...")
                     try:
-                        model = YOLO('yolov8n.pt')
+                        model = get_shared_model('yolov8n.pt')
                         model_info['model_path'] = 'yolov8n.pt (fallback)'
                         model_info['model_name'] = 'Default YOLO (Fallback)'
                         
-                        results = model(img)
-                        for r in results:
-                            boxes = r.boxes
-                            for box in boxes:
-                                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                                conf = float(box.conf[0])
-                                cls = int(box.cls[0])
-                                detections.append({
-                                    "class": model.names[cls],
-                                    "confidence": conf,
-                                    "x": int((x1 + x2) / 2),
-                                    "y": int((y1 + y2) / 2),
-                                    "bbox": {
-                                        "x1": int(x1),
-                                        "y1": int(y1),
-                                        "x2": int(x2),
-                                        "y2": int(y2)
-                                    }
-                                })
+                        detections = (await run_in_threadpool(model.predict, [img]))[0]
                     except:
                         detections = []
 
             # Gelişmiş analiz
             analyzer = ShelfAnalyzer(img.shape, eye_count=eye_count)
-            analysis_result = analyzer.analyze_shelf(detections, img)
+            analysis_result = analyzer.analyze_shelf(detections, img, image_scale)
             
             # Model bilgisini ekle
             analysis_result['model_info'] = model_info
+            
+            # Opsiyonel: renk imzası ile SKU ayrıştırma
+            if sku_match and detections:
+                try:
+                    from app.services.product_cache import match_detection_skus
+                    
+                    rgb_image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                    candidates = match_detection_skus(db, company_id, rgb_image, detections)
+                    
+                    sku_counts = {}
+                    for det_candidates in candidates:
+                        if det_candidates:
+                            best = det_candidates[0]['name']
+                            sku_counts[best] = sku_counts.get(best, 0) + 1
+                    
+                    analysis_result['sku_analysis'] = {
+                        'matched_detections': sum(1 for c in candidates if c),
+                        'product_counts': sku_counts,
+                        'candidates': [
+                            {'index': i, 'class': det['class'], 'candidates': det_candidates}
+                            for i, (det, det_candidates) in enumerate(zip(detections, candidates))
+                        ]
+                    }
+                except Exception as sku_error:
+                    print(f"⚠️ SKU eşleştirme hatası: {sku_error}")
 
             # Zaman serisi karşılaştırması
             comparison = None
             if shelf_id and save_to_db:
-                prev_analyses = db.query(Analysis).filter(
+                prev_analyses = db.query(Analysis).options(
+                    load_only(Analysis.id, Analysis.detections, Analysis.archived_at, Analysis.archive_path)
+                ).filter(
                     Analysis.company_id == company_id,
-                    Analysis.image_path.contains(shelf_id)
+                    Analysis.shelf_id == shelf_id
                 ).order_by(Analysis.analysis_date.desc()).limit(1).all()
 
                 if prev_analyses:
                     prev_analysis = prev_analyses[0]
-                    if prev_analysis.detections:
+                    prev_detections = resolve_payload(prev_analysis, 'detections')
+                    if prev_detections:
                         try:
-                            prev_data = prev_analysis.detections if isinstance(prev_analysis.detections, dict) else json.loads(prev_analysis.detections)
+                            prev_data = prev_detections if isinstance(prev_detections, dict) else json.loads(prev_detections)
                             comparison = ShelfAnalyzer.compare_analyses(prev_data, analysis_result)
                         except Exception as comp_error:
                             print(f"⚠️ Karşılaştırma hatası: {comp_error}")
@@ -308,13 +483,13 @@ async def enhanced_analyze(
             inference_time = time.time() - start_time
 
             # VERİTABANINA KAYDET
-            analysis_id = None
             if save_to_db:
                 try:
                     new_analysis = Analysis(
                         company_id=company_id,
                         model_id=model_record.id if model_record else 1,
                         image_path=file_path,
+                        shelf_id=shelf_id,
                         detections=analysis_result,
                         total_products=analysis_result['summary']['total_products'],
                         product_counts=analysis_result['summary']['product_counts'],
@@ -322,15 +497,25 @@ async def enhanced_analyze(
                         visibility_score=analysis_result['summary']['visibility_score'],
                         total_score=analysis_result['summary']['total_score'],
                         planogram_score=0.0,
-                        inference_time=inference_time
+                        inference_time=inference_time,
+                        image_scale=image_scale
                     )
                     
                     db.add(new_analysis)
+                    db.flush()
+                    
+                    # Normalize tespitler ve günlük özet aynı transaction'da yazılır
+                    store_detections(db, new_analysis, detections, analyzer.eyes)
+                    record_analysis(
+                        db, new_analysis,
+                        degraded_eyes=len(comparison['degraded_eyes']) if comparison else 0
+                    )
                     db.commit()
                     db.refresh(new_analysis)
                     
                     analysis_id = new_analysis.id
                     print(f"✅ Analiz kaydedildi (ID: {analysis_id})")
+                    schedule_derivatives(file_path)
                     
                 except Exception as db_error:
                     print(f"⚠️ Veritabanı hatası: {db_error}")
@@ -344,7 +529,10 @@ async def enhanced_analyze(
                 "model_used": model_info,
                 "inference_time": round(inference_time, 2),
                 "saved_to_db": save_to_db and analysis_id is not None,
-                "message": f"{analysis_result['summary']['total_products']} ürün tespit edildi"
+                "message": f"{analysis_result['summary']['total_products']} ürün tespit edildi",
+                # Koordinatlar çıkarım kopyasında; orijinal = değer / image_scale
+                "image_scale": image_scale,
+                "detections": pack_detection_list(detections, analyzer.eyes)
             }
 
             if comparison:
@@ -355,7 +543,7 @@ async def enhanced_analyze(
                     degraded_names = [e['eye_name'] for e in comparison['degraded_eyes']]
                     response['message'] += f" | ⚠️ Bozulan: {', '.join(degraded_names)}"
 
-            return response
+            return compact_response(flight.publish(response))
 
         except ImportError as e:
             return {
@@ -369,9 +557,63 @@ async def enhanced_analyze(
                 "error": f"Analiz hatası: {str(e)}",
                 "total_objects": 0
             }
-
+        finally:
+            if analysis_id is None:
+                # Kaydedilmeyen analizin (hata, save_to_db=false) görüntü referansı bırakılır
+                db.rollback()
+                remove_orphan(db, file_path)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Dosya hatası: {str(e)}")
+    finally:
+        if flight is not None:
+            flight.finish()
+
+
+@router.post("/analyze-batch", dependencies=[Depends(analysis_admission)])
+async def analyze_batch(
+    files: List[UploadFile] = File(...),
+    eye_count: int = 3,
+    company_id: Optional[int] = 1,
+    save_to_db: bool = True,
+    db: Session = Depends(get_db)
+):
+    """
+    Toplu Raf Analizi (mağaza ziyareti: 50-200 fotoğraf)
+    - Çoklu dosya veya ZIP arşivi
+    - Önbellekteki model ile batch çıkarım, sınırlı paralellik
+    - Her görüntü tamamlandıkça bir NDJSON satırı (application/x-ndjson)
+    - Parça başına tek transaction'da toplu kayıt
+    """
+    from app.services.batch_analysis import ingest_uploads, run_batch, ndjson_lines, release_pending
+    
+    model_path, model_record = get_company_model(company_id, db)
+    
+    items, skipped = await ingest_uploads(db, files)
+    if not items:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="No images to analyze")
+    db.commit()
+    
+    # Akış yarıda kalırsa (istemci bağlantıyı kesti) kaydedilmeyenlerin referansı bırakılır
+    pending = [item['image_path'] for item in items]
+    results = run_batch(
+        items,
+        company_id=company_id,
+        model_path=model_path,
+        model_id=model_record.id if model_record else 1,
+        eye_count=eye_count,
+        save_to_db=save_to_db,
+        skipped=skipped,
+        pending=pending
+    )
+    return StreamingResponse(
+        ndjson_lines(results),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(release_pending, pending)
+    )
 
 
 # ============================================================================
@@ -379,32 +621,40 @@ async def enhanced_analyze(
 # ============================================================================
 
 @router.get("/models/{company_id}")
-def get_company_models(company_id: int, db: Session = Depends(get_db)):
+def get_company_models(
+    company_id: int,
+    request: Request,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Şirketin tüm modellerini listele
+    Şirketin modellerini listele (keyset sayfalama, X-Next-Cursor, ETag)
     """
-    models = db.query(Model).filter(
-        Model.company_id == company_id
-    ).order_by(Model.created_at.desc()).all()
+    def build(response):
+        query = db.query(Model).filter(Model.company_id == company_id)
+        models, _ = keyset_page(query, Model.created_at, Model.id, limit, cursor, response)
+        
+        return [
+            {
+                'id': m.id,
+                'name': m.name,
+                'version': m.version,
+                'status': m.status,
+                'is_active': m.is_active,
+                'model_path': m.model_path,
+                'accuracy': m.accuracy,
+                'precision': m.precision,
+                'recall': m.recall,
+                'mAP50': m.mAP50,
+                'mAP50_95': m.mAP50_95,
+                'created_at': str(m.created_at) if m.created_at else None,
+                'training_completed_at': str(m.training_completed_at) if m.training_completed_at else None
+            }
+            for m in models
+        ]
     
-    return [
-        {
-            'id': m.id,
-            'name': m.name,
-            'version': m.version,
-            'status': m.status,
-            'is_active': m.is_active,
-            'model_path': m.model_path,
-            'accuracy': m.accuracy,
-            'precision': m.precision,
-            'recall': m.recall,
-            'mAP50': m.mAP50,
-            'mAP50_95': m.mAP50_95,
-            'created_at': str(m.created_at) if m.created_at else None,
-            'training_completed_at': str(m.training_completed_at) if m.training_completed_at else None
-        }
-        for m in models
-    ]
+    return cached_response(request, [f"models:{company_id}"], build)
 
 
 @router.post("/models/{model_id}/activate")
@@ -428,6 +678,7 @@ def activate_model(model_id: int, company_id: int, db: Session = Depends(get_db)
     
     model.is_active = True
     db.commit()
+    invalidate_responses(f"models:{company_id}")
     
     return {
         'success': True,
@@ -441,14 +692,105 @@ def activate_model(model_id: int, company_id: int, db: Session = Depends(get_db)
 # ZAMAN SERİSİ
 # ============================================================================
 
+@router.get("/company/{company_id}/trend")
+def get_company_trend(company_id: int, days: int = 30, db: Session = Depends(get_db)):
+    """
+    Günlük skor / doluluk trendi (analysis_daily_stats'tan)
+    """
+    days = max(1, min(days, 366))
+    return {
+        'company_id': company_id,
+        'days': days,
+        'trend': get_daily_trend(db, company_id, days)
+    }
+
+
+@router.get("/company/{company_id}/detections/summary")
+def get_detection_summary(
+    company_id: int,
+    group_by: str = 'class',
+    class_name: Optional[str] = None,
+    shelf_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    days: Optional[int] = None,
+    limit: int = 1000,
+    db: Session = Depends(get_db)
+):
+    """
+    Ürün / gün / raf / göz bazlı tespit toplamları (analysis_detections)
+    
+    Örn. X ürününün son 7 gündeki yüz sayısı:
+    ?class_name=X&days=7&group_by=shelf
+    """
+    if group_by not in GROUP_BY_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(GROUP_BY_OPTIONS)}")
+    
+    if days and not since:
+        since = datetime.utcnow() - timedelta(days=days)
+    
+    rows = summarize_detections(
+        db, company_id,
+        since=since,
+        until=until,
+        class_name=class_name,
+        shelf_id=shelf_id,
+        group_by=group_by,
+        limit=max(1, min(limit, 10000))
+    )
+    
+    return {
+        'company_id': company_id,
+        'group_by': group_by,
+        'since': str(since) if since else None,
+        'until': str(until) if until else None,
+        'results': rows
+    }
+
+
+@router.post("/archive")
+def archive_old_analyses(company_id: Optional[int] = None, older_than_days: Optional[int] = None):
+    """
+    Saklama süresini aşan analizleri Parquet arşivine taşı (Celery)
+    
+    Skorlar ve tarih tabloda kalır; büyük JSON alanlar arşiv dosyasından
+    okunur (?include=detections, raf karşılaştırması).
+    """
+    from app.tasks.training_tasks import archive_analyses_task
+    
+    task = archive_analyses_task.delay(company_id=company_id, older_than_days=older_than_days)
+    return {
+        'task_id': task.id,
+        'status': 'PENDING',
+        'message': 'Archive started'
+    }
+
+
 @router.get("/history/{shelf_id}")
-def get_shelf_history(shelf_id: str, limit: int = 10, db: Session = Depends(get_db)):
+def get_shelf_history(
+    shelf_id: str,
+    limit: int = 10,
+    company_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
     """
     Belirli bir rafın analiz geçmişi
+    
+    company_id verilirse ix_analyses_company_shelf_date, verilmezse
+    ix_analyses_shelf_date üzerinden index seek yapılır.
     """
-    analyses = db.query(Analysis).filter(
-        Analysis.image_path.contains(shelf_id)
-    ).order_by(Analysis.analysis_date.desc()).limit(limit).all()
+    query = db.query(Analysis).options(load_only(
+        Analysis.id,
+        Analysis.analysis_date,
+        Analysis.total_score,
+        Analysis.total_products,
+        Analysis.shelf_coverage,
+        Analysis.archived_at
+    )).filter(Analysis.shelf_id == shelf_id)
+    if company_id is not None:
+        query = query.filter(Analysis.company_id == company_id)
+    
+    analyses = query.order_by(Analysis.analysis_date.desc()).limit(limit).all()
 
     history = []
     for a in analyses:
@@ -457,7 +799,8 @@ def get_shelf_history(shelf_id: str, limit: int = 10, db: Session = Depends(get_
             'date': str(a.analysis_date),
             'total_score': a.total_score,
             'total_products': a.total_products,
-            'shelf_coverage': a.shelf_coverage
+            'shelf_coverage': a.shelf_coverage,
+            'archived': a.archived_at is not None
         })
 
     return {
@@ -1,12 +1,13 @@
-﻿from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+﻿from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 import os
-import shutil
 
 from app.models.database import get_db, Company
+from app.services.response_cache import cached_response, invalidate_responses
+from app.services.uploads import save_upload
 
 router = APIRouter()
 
@@ -45,14 +46,19 @@ def create_company(company: CompanyCreate, db: Session = Depends(get_db)):
     db.add(new_company)
     db.commit()
     db.refresh(new_company)
+    invalidate_responses("companies")
     return new_company
 
 
 # Get All Companies
 @router.get("/", response_model=List[CompanyResponse])
-def get_companies(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    companies = db.query(Company).filter(Company.is_active == True).order_by(Company.id).offset(skip).limit(limit).all()
-    return companies
+def get_companies(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    def build(response):
+        companies = db.query(Company).filter(Company.is_active == True).order_by(Company.id).offset(skip).limit(limit).all()
+        return [CompanyResponse.model_validate(c).model_dump(mode="json") for c in companies]
+    
+    # ETag / 304 (yazmalarda "companies" versiyonu artar)
+    return cached_response(request, ["companies"], build)
 
 
 # Get Company by ID
@@ -77,6 +83,7 @@ def update_company(company_id: int, company: CompanyCreate, db: Session = Depend
     
     db.commit()
     db.refresh(db_company)
+    invalidate_responses("companies")
     return db_company
 
 
@@ -90,12 +97,13 @@ def delete_company(company_id: int, db: Session = Depends(get_db)):
     company.is_active = False
     company.updated_at = datetime.utcnow()
     db.commit()
+    invalidate_responses("companies")
     return {"message": "Company deleted successfully"}
 
 
 # Upload Company Logo
 @router.post("/{company_id}/logo")
-def upload_logo(company_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_logo(company_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
     company = db.query(Company).filter(Company.id == company_id).first()
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
@@ -110,12 +118,12 @@ def upload_logo(company_id: int, file: UploadFile = File(...), db: Session = Dep
     filename = f"company_{company_id}{file_ext}"
     file_path = os.path.join(logo_dir, filename)
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await save_upload(file, file_path)
     
     # Update company
     company.logo_url = f"/uploads/company_logos/{filename}"
     company.updated_at = datetime.utcnow()
     db.commit()
+    invalidate_responses("companies")
     
     return {"message": "Logo uploaded successfully", "logo_url": company.logo_url}
\ No newline at end of file
@@ -1,12 +1,15 @@
-﻿from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+﻿from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 import os
-import shutil
 
 from app.models.database import get_db, Dataset, Company
+from app.services.pagination import keyset_page
+from app.services.response_cache import cached_response, invalidate_responses
+from app.services.blob_store import store_dataset_upload, remove_orphan
+from app.services.derivatives import schedule_derivatives
 
 router = APIRouter()
 
@@ -79,21 +82,29 @@ async def upload_dataset_bulk(
         
         # Dosyaları kaydet
         uploaded_files = []
+        blob_paths = []
+        orphans = []
         for file in files:
             # Dosya uzantısı kontrolü
             if not file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
                 continue
             
-            file_path = os.path.join(images_dir, file.filename)
+            file_path = os.path.join(images_dir, os.path.basename(file.filename))
             
             try:
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer)
+                # Depoya yaz, dataset klasörüne hardlink ver (tekrar eden görüntü yer kaplamaz)
+                blob, orphan = await store_dataset_upload(db, new_dataset.id, file, file_path)
+                orphans.append(orphan)
                 
                 uploaded_files.append({
                     'filename': file.filename,
-                    'size': os.path.getsize(file_path)
+                    'size': blob.size
                 })
+                blob_paths.append(blob.path)
+            except HTTPException as e:
+                # Sınırı aşan dosya atlanır, diğerleri yüklenmeye devam eder
+                print(f"Dosya atlandı ({file.filename}): {e.detail}")
+                continue
             except Exception as e:
                 print(f"Dosya yükleme hatası ({file.filename}): {e}")
                 continue
@@ -103,6 +114,10 @@ async def upload_dataset_bulk(
         new_dataset.total_images = len(uploaded_files)
         new_dataset.status = "uploaded"
         db.commit()
+        for orphan in orphans:
+            remove_orphan(db, orphan)
+        invalidate_responses(f"datasets:{company_id}")
+        schedule_derivatives(*blob_paths)
         
         return {
             "success": True,
@@ -142,33 +157,42 @@ def create_dataset(dataset: DatasetCreate, db: Session = Depends(get_db)):
     db.add(new_dataset)
     db.commit()
     db.refresh(new_dataset)
+    invalidate_responses(f"datasets:{dataset.company_id}")
     
     return new_dataset
 
 
 # Get Company Datasets
 @router.get("/company/{company_id}")
-def get_company_datasets(company_id: int, db: Session = Depends(get_db)):
+def get_company_datasets(
+    company_id: int,
+    request: Request,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Şirketin tüm dataset'lerini listele
+    Şirketin dataset'lerini listele (keyset sayfalama, X-Next-Cursor, ETag)
     """
-    datasets = db.query(Dataset).filter(
-        Dataset.company_id == company_id
-    ).order_by(Dataset.created_at.desc()).all()
+    def build(response):
+        query = db.query(Dataset).filter(Dataset.company_id == company_id, Dataset.is_active == True)
+        datasets, _ = keyset_page(query, Dataset.created_at, Dataset.id, limit, cursor, response)
+        
+        return [
+            {
+                'id': d.id,
+                'name': d.name,
+                'description': d.description,
+                'total_images': d.total_images,
+                'image_count': d.total_images,  # Frontend için
+                'annotated_images': d.annotated_images,
+                'status': d.status,
+                'created_at': str(d.created_at) if d.created_at else None
+            }
+            for d in datasets
+        ]
     
-    return [
-        {
-            'id': d.id,
-            'name': d.name,
-            'description': d.description,
-            'total_images': d.total_images,
-            'image_count': d.total_images,  # Frontend için
-            'annotated_images': d.annotated_images,
-            'status': d.status,
-            'created_at': str(d.created_at) if d.created_at else None
-        }
-        for d in datasets
-    ]
+    return cached_response(request, [f"datasets:{company_id}"], build)
 
 
 # Get Dataset by ID
@@ -187,7 +211,8 @@ async def upload_image_to_dataset(
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
-    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    # Silinmiş dataset'e yüklenen görüntü purge sonrası sahipsiz kalırdı
+    dataset = db.query(Dataset).filter(Dataset.id == dataset_id, Dataset.is_active == True).first()
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
     
@@ -203,14 +228,16 @@ async def upload_image_to_dataset(
         os.makedirs(images_dir, exist_ok=True)
     
     # Dosyayı kaydet
-    file_path = os.path.join(images_dir, file.filename)
+    file_path = os.path.join(images_dir, os.path.basename(file.filename))
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    blob, orphan = await store_dataset_upload(db, dataset_id, file, file_path)
     
     # Dataset güncelle
     dataset.total_images += 1
     db.commit()
+    remove_orphan(db, orphan)
+    invalidate_responses(f"datasets:{dataset.company_id}")
+    schedule_derivatives(blob.path)
     
     return {
         "message": "Fotoğraf yüklendi",
@@ -245,8 +272,28 @@ def delete_dataset(dataset_id: int, db: Session = Depends(get_db)):
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
     
-    # Soft delete
+    # Soft delete: kayıt ve görüntüler kalır, listeden düşer. Görüntü linkleri
+    # ve blob referansları bekleme süresinden sonra purge_deleted_datasets ile
+    # bırakılır (POST /api/datasets/purge).
+    dataset.is_active = False
     dataset.updated_at = datetime.utcnow()
     db.commit()
+    invalidate_responses(f"datasets:{dataset.company_id}")
     
-    return {"message": "Dataset silindi"}
\ No newline at end of file
+    return {"message": "Dataset silindi"}
+
+
+# Purge Deleted Datasets
+@router.post("/purge")
+def purge_datasets(company_id: Optional[int] = None, older_than_days: Optional[int] = None):
+    """
+    Bekleme süresini aşan silinmiş dataset'lerin görüntülerini bırak (Celery)
+    """
+    from app.tasks.training_tasks import purge_deleted_datasets_task
+    
+    task = purge_deleted_datasets_task.delay(company_id=company_id, older_than_days=older_than_days)
+    return {
+        'task_id': task.id,
+        'status': 'PENDING',
+        'message': 'Purge started'
+    }
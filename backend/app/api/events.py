@@ -0,0 +1,52 @@
+﻿from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+import json
+
+from app.services.task_events import subscribe
+
+router = APIRouter()
+
+
+# ============================================================================
+# GÖREV DURUMU (PUSH) - /status/{task_id} polling yerine
+# ============================================================================
+
+@router.get("/tasks/{task_id}")
+async def stream_task_events(task_id: str):
+    """
+    Görev durumlarını Server-Sent Events olarak akıt
+    
+    Her update_state bir `state` olayı olarak gelir; görev SUCCESS/FAILURE
+    olduğunda akış kapanır. Olay yokken keepalive yorum satırı gönderilir.
+    """
+    async def events():
+        async for event in subscribe(task_id):
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: state\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # nginx arabelleğe almasın
+        }
+    )
+
+
+@router.websocket("/tasks/{task_id}/ws")
+async def task_events_websocket(websocket: WebSocket, task_id: str):
+    """
+    Görev durumlarını WebSocket üzerinden gönder (JSON mesajlar)
+    """
+    await websocket.accept()
+    try:
+        async for event in subscribe(task_id):
+            if event is None:
+                continue
+            await websocket.send_text(json.dumps(event, ensure_ascii=False, default=str))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
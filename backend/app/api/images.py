@@ -0,0 +1,45 @@
+﻿from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+import os
+
+from app.models.database import get_db, ImageBlob
+from app.services.derivatives import DERIVATIVE_SPECS, build_derivatives
+
+router = APIRouter()
+
+# İçerik adresli: aynı URL hiçbir zaman farklı içerik döndürmez
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+
+# ============================================================================
+# GÖRÜNTÜ TÜREVLERİ (galeri küçük resmi / önizleme / çıkarım kopyası)
+# ============================================================================
+
+@router.get("/{sha256}")
+async def get_image(sha256: str, variant: str = "thumbnail", db: Session = Depends(get_db)):
+    """
+    Depodaki görüntünün türevini döndür
+    
+    variant: thumbnail | preview | inference | original. Türev henüz arka
+    planda üretilmediyse istek sırasında üretilir ve kaydedilir.
+    """
+    if variant != "original" and variant not in DERIVATIVE_SPECS:
+        raise HTTPException(status_code=400, detail=f"Invalid variant. Use: original, {', '.join(DERIVATIVE_SPECS)}")
+    
+    blob = db.query(ImageBlob).filter(ImageBlob.sha256 == sha256).first()
+    if not blob or not os.path.exists(blob.path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    if variant == "original":
+        path = blob.path
+    else:
+        path = getattr(blob, f"{variant}_path")
+        if not path or not os.path.exists(path):
+            path = (await run_in_threadpool(build_derivatives, blob, (variant,))).get(variant)
+            if not path:
+                raise HTTPException(status_code=422, detail="Image could not be decoded")
+            db.commit()
+    
+    return FileResponse(path, headers={"Cache-Control": IMMUTABLE_CACHE})
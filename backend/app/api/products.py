@@ -1,20 +1,18 @@
-﻿from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+﻿from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
-import os
-import shutil
-import uuid
 
 from app.models.database import get_db, Product, Company
+from app.services.product_cache import invalidate_product_catalog
+from app.services.response_cache import cached_response
+from app.services.blob_store import store_upload, release_blob, remove_orphan
+from app.services.derivatives import schedule_derivatives
+from app.services.rollups import adjust_product_count
 
 router = APIRouter()
 
-# Ürün resimleri için klasör
-PRODUCT_IMAGES_DIR = r"C:\Users\recepuce\Desktop\images"
-os.makedirs(PRODUCT_IMAGES_DIR, exist_ok=True)
-
 
 # Pydantic Schemas
 class ProductResponse(BaseModel):
@@ -47,17 +45,14 @@ async def create_product(
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
     
+    file_path = None
     try:
-        # Dosya adı oluştur (unique)
-        file_ext = os.path.splitext(reference_image.filename)[1]
-        safe_name = name.replace(' ', '_').replace('/', '_')
-        unique_filename = f"{safe_name}_{uuid.uuid4().hex[:8]}{file_ext}"
-        file_path = os.path.join(PRODUCT_IMAGES_DIR, unique_filename)
+        # Dosyayı içerik adresli depoya kaydet
+        file_path = (await store_upload(db, reference_image)).path
         
-        # Dosyayı kaydet
-        with open(file_path, "wb") as buffer:
-            content = await reference_image.read()
-            buffer.write(content)
+        # Renk imzası (SKU indeksi için bir kez hesaplanır)
+        from app.ai.color_analyzer import ColorAnalyzer
+        color_signature = ColorAnalyzer().color_signature(file_path)
         
         # Ürün oluştur
         new_product = Product(
@@ -66,36 +61,46 @@ async def create_product(
             brand=brand,
             category=category if category else None,
             reference_image=file_path,
+            color_signature=color_signature,
             is_own_product=is_own_product
         )
         
         db.add(new_product)
+        adjust_product_count(db, company_id, 1)
         db.commit()
         db.refresh(new_product)
+        invalidate_product_catalog(company_id)
+        schedule_derivatives(file_path)
         
         return new_product
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
-        # Hata durumunda dosyayı sil
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # Hata durumunda dosyayı sil (başka kayıt kullanmıyorsa)
+        remove_orphan(db, file_path)
         raise HTTPException(status_code=500, detail=f"Error creating product: {str(e)}")
 
 
 # Get Company Products
 @router.get("/", response_model=List[ProductResponse])
 def get_products(
+    request: Request,
     company_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
-    query = db.query(Product)
-    
-    if company_id:
-        query = query.filter(Product.company_id == company_id)
+    def build(response):
+        query = db.query(Product)
+        
+        if company_id:
+            query = query.filter(Product.company_id == company_id)
+        
+        products = query.all()
+        return [ProductResponse.model_validate(p).model_dump(mode="json") for p in products]
     
-    products = query.all()
-    return products
+    # ETag / 304 (invalidate_product_catalog versiyonları artırır)
+    return cached_response(request, [f"products:{company_id}" if company_id else "products"], build)
 
 
 # Get Product by ID
@@ -122,6 +127,7 @@ async def update_product(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    orphan = None
     try:
         # Update fields
         if name is not None:
@@ -135,28 +141,29 @@ async def update_product(
         
         # Update image if provided
         if reference_image:
-            # Delete old image
-            if product.reference_image and os.path.exists(product.reference_image):
-                os.remove(product.reference_image)
-            
-            # Save new image
-            file_ext = os.path.splitext(reference_image.filename)[1]
-            safe_name = product.name.replace(' ', '_').replace('/', '_')
-            unique_filename = f"{safe_name}_{uuid.uuid4().hex[:8]}{file_ext}"
-            file_path = os.path.join(PRODUCT_IMAGES_DIR, unique_filename)
-            
-            with open(file_path, "wb") as buffer:
-                content = await reference_image.read()
-                buffer.write(content)
+            # Save new image, release old one (commit sonrası silinir)
+            file_path = (await store_upload(db, reference_image)).path
+            if product.reference_image:
+                orphan = release_blob(db, product.reference_image)
             
             product.reference_image = file_path
+            
+            from app.ai.color_analyzer import ColorAnalyzer
+            product.color_signature = ColorAnalyzer().color_signature(file_path)
         
         product.updated_at = datetime.utcnow()
         db.commit()
         db.refresh(product)
+        invalidate_product_catalog(product.company_id)
+        remove_orphan(db, orphan)
+        if reference_image:
+            schedule_derivatives(product.reference_image)
         
         return product
         
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error updating product: {str(e)}")
@@ -170,13 +177,16 @@ def delete_product(product_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Product not found")
     
     try:
-        # Delete image file
-        if product.reference_image and os.path.exists(product.reference_image):
-            os.remove(product.reference_image)
+        # Release image (başka kayıt kullanmıyorsa commit sonrası silinir)
+        orphan = release_blob(db, product.reference_image) if product.reference_image else None
         
         # Delete from database
+        company_id = product.company_id
         db.delete(product)
+        adjust_product_count(db, company_id, -1)
         db.commit()
+        invalidate_product_catalog(company_id)
+        remove_orphan(db, orphan)
         
         return {"message": "Product deleted successfully"}
         
@@ -1,11 +1,17 @@
 ﻿from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from typing import List, Dict
 from pydantic import BaseModel
 from datetime import datetime
+import time
+import numpy as np
 
-from app.models.database import get_db, ScoringRule, Company
-from app.ai.scoring_engine import ScoringEngine
+from app.models.database import get_db, ScoringRule, Company, Analysis
+from app.ai.scoring_engine import ScoringEngine, RULE_TYPES, coverage_band
+from app.services.scoring_profiles import get_scoring_profile, invalidate_scoring_profile
+from app.services.rollups import apply_score_deltas
+from app.services.analysis_archive import load_archived_payloads
 
 router = APIRouter()
 
@@ -42,6 +48,18 @@ class ScoreCalculationRequest(BaseModel):
     custom_weights: Dict = None
 
 
+def validate_scoring_rule(rule: ScoringRuleCreate):
+    """Kural tipi ve parametreleri; geçersizse 400"""
+    if rule.rule_type not in RULE_TYPES:
+        raise HTTPException(status_code=400, detail=f"Invalid rule type. Must be one of: {RULE_TYPES}")
+    
+    if rule.rule_type == "shelf_coverage":
+        try:
+            coverage_band(rule.parameters)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
 # Create Scoring Rule
 @router.post("/", response_model=ScoringRuleResponse)
 def create_scoring_rule(rule: ScoringRuleCreate, db: Session = Depends(get_db)):
@@ -49,10 +67,7 @@ def create_scoring_rule(rule: ScoringRuleCreate, db: Session = Depends(get_db)):
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
     
-    # Validate rule type
-    valid_types = ["shelf_coverage", "product_visibility", "planogram_compliance", "color_match"]
-    if rule.rule_type not in valid_types:
-        raise HTTPException(status_code=400, detail=f"Invalid rule type. Must be one of: {valid_types}")
+    validate_scoring_rule(rule)
     
     new_rule = ScoringRule(
         company_id=rule.company_id,
@@ -64,6 +79,7 @@ def create_scoring_rule(rule: ScoringRuleCreate, db: Session = Depends(get_db)):
     db.add(new_rule)
     db.commit()
     db.refresh(new_rule)
+    invalidate_scoring_profile(new_rule.company_id)
     
     return new_rule
 
@@ -94,6 +110,8 @@ def update_scoring_rule(rule_id: int, rule: ScoringRuleCreate, db: Session = Dep
     if not db_rule:
         raise HTTPException(status_code=404, detail="Scoring rule not found")
     
+    validate_scoring_rule(rule)
+    
     db_rule.rule_name = rule.rule_name
     db_rule.rule_type = rule.rule_type
     db_rule.weight = rule.weight
@@ -102,6 +120,7 @@ def update_scoring_rule(rule_id: int, rule: ScoringRuleCreate, db: Session = Dep
     
     db.commit()
     db.refresh(db_rule)
+    invalidate_scoring_profile(db_rule.company_id)
     return db_rule
 
 
@@ -115,6 +134,7 @@ def delete_scoring_rule(rule_id: int, db: Session = Depends(get_db)):
     rule.is_active = False
     rule.updated_at = datetime.utcnow()
     db.commit()
+    invalidate_scoring_profile(rule.company_id)
     
     return {"message": "Scoring rule deleted successfully"}
 
@@ -159,42 +179,157 @@ def calculate_company_score(
     request: ScoreCalculationRequest,
     db: Session = Depends(get_db)
 ):
-    # Get company scoring rules
-    rules = db.query(ScoringRule).filter(
-        ScoringRule.company_id == company_id,
-        ScoringRule.is_active == True
-    ).all()
+    profile = get_scoring_profile(db, company_id)
     
-    if not rules:
-        # Use default weights
-        scoring = ScoringEngine()
-        weights = scoring.default_weights
-    else:
-        # Build custom weights from rules
-        weights = {}
-        total_weight = sum(rule.weight for rule in rules)
-        
-        for rule in rules:
-            normalized_weight = rule.weight / total_weight if total_weight > 0 else 0.25
-            weights[rule.rule_type] = normalized_weight
-        
-        # Fill missing weights with 0
-        for key in ['shelf_coverage', 'product_visibility', 'planogram_compliance', 'color_match']:
-            if key not in weights:
-                weights[key] = 0.0
-    
-    # Calculate score
-    scoring = ScoringEngine()
+    # Calculate score (derlenmiş profil: bellek içi)
     metrics = {
         'shelf_coverage': request.shelf_coverage,
         'visibility_score': request.visibility_score,
-        'expected_distribution': request.expected_distribution or {'left': 33, 'center': 34, 'right': 33},
+        'expected_distribution': request.expected_distribution,
         'actual_distribution': request.actual_distribution or {'left': 0, 'center': 0, 'right': 0},
         'color_matches': request.color_matches or {}
     }
     
-    result = scoring.calculate_total_score(metrics, weights)
-    result['custom_rules_applied'] = len(rules)
-    result['custom_weights'] = weights
+    result = profile.score(metrics)
+    result['custom_rules_applied'] = profile.rules_count
+    result['custom_weights'] = profile.weights
     
     return result
+
+
+# Get Compiled Company Scoring Profile
+@router.get("/company/{company_id}/profile")
+def get_company_scoring_profile(company_id: int, db: Session = Depends(get_db)):
+    return get_scoring_profile(db, company_id).to_dict()
+
+
+# Re-score Company History (toplu, vektörel)
+@router.post("/company/{company_id}/rescore")
+def rescore_company_history(
+    company_id: int,
+    chunk_size: int = 1000,
+    dry_run: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Şirketin geçmiş analizlerini güncel ağırlıklarla yeniden puanla
+    
+    Analizler id sırasıyla chunk_size'lık parçalar halinde okunur, her parça
+    ScoringEngine.calculate_total_scores_batch ile tek çağrıda puanlanır ve
+    tek bir toplu UPDATE ile yazılır.
+    
+    Büyük JSON kolonlar yüklenmez; yalnızca color_analysis['color_matches'] ve
+    detections['summary']['distribution'] yolları veritabanında çıkarılır
+    (arşivdekiler Parquet'ten). color_matches olmayan analizlerde (eski
+    kayıtlar, hibrit analizler) renk bileşeni nötr (NaN -> 50) sayılır.
+    """
+    company = db.query(Company).filter(Company.id == company_id).first()
+    if not company:
+        raise HTTPException(status_code=404, detail="Company not found")
+    
+    chunk_size = max(1, min(chunk_size, 10000))
+    profile = get_scoring_profile(db, company_id)
+    
+    start_time = time.time()
+    last_id = 0
+    rescored = 0
+    missing_color = 0
+    chunks = 0
+    score_sum = 0.0
+    
+    while True:
+        rows = db.query(
+            Analysis.id,
+            Analysis.shelf_coverage,
+            Analysis.visibility_score,
+            Analysis.planogram_score,
+            Analysis.total_score,
+            Analysis.analysis_date,
+            Analysis.archived_at,
+            Analysis.archive_path,
+            Analysis.detections[('summary', 'distribution')].label('distribution'),
+            Analysis.color_analysis['color_matches'].label('color_matches')
+        ).filter(
+            Analysis.company_id == company_id,
+            Analysis.id > last_id
+        ).order_by(Analysis.id).limit(chunk_size).all()
+        
+        if not rows:
+            break
+        
+        # Arşivlenmiş analizlerin JSON'u Parquet'ten
+        archived_payloads = load_archived_payloads([row for row in rows if row.archived_at])
+        last_id = rows[-1].id
+        chunks += 1
+        
+        # Kolon bazlı diziler
+        distributions = []
+        color_scores = []
+        for row in rows:
+            distribution, color_matches = row.distribution, row.color_matches
+            if row.archived_at:
+                payload = archived_payloads.get(row.id, {})
+                detections, color_analysis = payload.get('detections'), payload.get('color_analysis')
+                summary = detections.get('summary', {}) if isinstance(detections, dict) else {}
+                distribution = summary.get('distribution')
+                color_matches = color_analysis.get('color_matches') if isinstance(color_analysis, dict) else None
+            
+            if color_matches is None:
+                missing_color += 1
+            distributions.append(distribution if isinstance(distribution, dict) else None)
+            # calculate_color_match_score ile aynı: ortalama, eşleşme yoksa NaN (-> 50)
+            color_scores.append(
+                float(np.mean(list(color_matches.values()))) if isinstance(color_matches, dict) and color_matches else np.nan
+            )
+        
+        columns = {
+            'shelf_coverage': np.array([row.shelf_coverage or 0 for row in rows], dtype=np.float64),
+            'visibility_score': np.array([row.visibility_score or 0 for row in rows], dtype=np.float64),
+            'actual_distribution': ScoringEngine.distribution_matrix(distributions),
+            'planogram_score': np.array(
+                [row.planogram_score if row.planogram_score is not None else np.nan for row in rows],
+                dtype=np.float64
+            ),
+            'color_match': np.array(color_scores, dtype=np.float64)
+        }
+        
+        result = profile.score_batch(columns)
+        total_scores = result['total_score']
+        planogram_scores = result['component_scores']['planogram_compliance']
+        
+        if not dry_run:
+            db.execute(
+                update(Analysis),
+                [
+                    {
+                        'id': row.id,
+                        'total_score': float(total_scores[i]),
+                        'planogram_score': round(float(planogram_scores[i]), 2)
+                    }
+                    for i, row in enumerate(rows)
+                ]
+            )
+            
+            # Günlük özetlerdeki skor toplamlarını aynı transaction'da düzelt
+            score_deltas = {}
+            for i, row in enumerate(rows):
+                day = row.analysis_date.date() if row.analysis_date else None
+                score_deltas[day] = score_deltas.get(day, 0.0) + float(total_scores[i]) - (row.total_score or 0.0)
+            apply_score_deltas(db, company_id, score_deltas)
+            db.commit()
+        
+        rescored += len(rows)
+        score_sum += float(total_scores.sum())
+    
+    return {
+        'success': True,
+        'company_id': company_id,
+        'rescored': rescored,
+        'missing_color': missing_color,
+        'chunks': chunks,
+        'average_score': round(score_sum / rescored, 2) if rescored else None,
+        'weights_used': profile.weights,
+        'custom_rules_applied': profile.rules_count,
+        'dry_run': dry_run,
+        'elapsed': round(time.time() - start_time, 2)
+    }
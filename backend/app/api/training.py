@@ -5,7 +5,7 @@ from typing import Optional
 from datetime import datetime
 
 from app.models.database import get_db, Model, Dataset, Company
-from app.tasks.training_tasks import train_model_task, celery_app
+from app.services.response_cache import invalidate_responses
 
 router = APIRouter()
 
@@ -65,6 +65,7 @@ def start_training(request: TrainingRequest, db: Session = Depends(get_db)):
     db.add(model)
     db.commit()
     db.refresh(model)
+    invalidate_responses(f"models:{request.company_id}")
     
     # Start Celery task
     config = {
@@ -73,6 +74,7 @@ def start_training(request: TrainingRequest, db: Session = Depends(get_db)):
         'imgsz': request.image_size
     }
     
+    from app.tasks.training_tasks import train_model_task
     task = train_model_task.delay(
         request.company_id,
         request.dataset_id,
@@ -91,6 +93,7 @@ def start_training(request: TrainingRequest, db: Session = Depends(get_db)):
 # Get Task Status
 @router.get("/status/{task_id}", response_model=TaskStatusResponse)
 def get_task_status(task_id: str):
+    from app.tasks.training_tasks import celery_app
     task = celery_app.AsyncResult(task_id)
     
     response = {
@@ -1,15 +1,21 @@
 ﻿import os
+import time
 from fastapi import FastAPI, Depends, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import text
 from sqlalchemy.orm import Session
+from typing import Optional
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
 # Import routers
-from app.api import companies, products, datasets, training, analysis, scoring
-from app.models.database import get_db, Product, Analysis as AnalysisModel
+from app.api import companies, products, datasets, training, analysis, scoring, events, images
+from app.models.database import get_db, get_pool_stats
+from app.services.rollups import get_stats, count_products, count_active_shelves, DASHBOARD_WINDOW_DAYS
+from app.services.admission import analysis_admission, get_admission_stats
+from app.services.compact import CompressionMiddleware
 
 # Create FastAPI app
 app = FastAPI(
@@ -18,6 +24,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Yanıt sıkıştırma: brotli (yüklüyse) / gzip; akış ve görüntü yolları hariç
+app.add_middleware(CompressionMiddleware)
+
 # CORS Configuration - Tüm originlere izin ver
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +34,7 @@ app.add_middleware(
     allow_credentials=False,  # Credentials kapalı
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Retry-After"],  # Keyset sayfalama, yanıt önbelleği, kabul kontrolü
 )
 
 # Include routers
@@ -34,6 +44,8 @@ app.include_router(datasets.router, prefix="/api/datasets", tags=["Datasets"])
 app.include_router(training.router, prefix="/api/training", tags=["Training"])
 app.include_router(analysis.router, prefix="/api/analysis", tags=["Analysis"])
 app.include_router(scoring.router, prefix="/api/scoring", tags=["Scoring"])
+app.include_router(events.router, prefix="/api/events", tags=["Events"])
+app.include_router(images.router, prefix="/api/images", tags=["Images"])
 
 
 @app.get("/")
@@ -50,34 +62,63 @@ def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/health/db")
+def database_health_check(db: Session = Depends(get_db)):
+    """
+    Veritabanı bağlantısı + connection pool durumu
+    """
+    start_time = time.time()
+    try:
+        db.execute(text("SELECT 1"))
+        status = "healthy"
+        error = None
+    except Exception as e:
+        status = "unhealthy"
+        error = str(e)
+    
+    response = {
+        "status": status,
+        "latency_ms": round((time.time() - start_time) * 1000, 2),
+        "pool": get_pool_stats()
+    }
+    if error:
+        response["error"] = error
+    return response
+
+
+@app.get("/health/admission")
+def admission_health_check():
+    """
+    Analiz kabul kontrolü: aktif analizler, kuyruk derinliği, red sayaçları
+    """
+    return get_admission_stats()
+
+
 # ============================================================================
 # Frontend için kısayol endpoint'leri
 # ============================================================================
 
 @app.get("/api/stats")
-def get_dashboard_stats(db: Session = Depends(get_db)):
+def get_dashboard_stats(company_id: Optional[int] = None, db: Session = Depends(get_db)):
     """
-    Dashboard için istatistikler
+    Dashboard için istatistikler (özet ve sayaç tablolarından)
+    
+    Ürün sayısı companies.product_count, aktif raflar shelf_activity, skor ve
+    uyarılar son DASHBOARD_WINDOW_DAYS günün analysis_daily_stats satırlarından
+    okunur; analyses/products tabloları taranmaz.
     """
     try:
-        total_products = db.query(Product).count()
-        total_analyses = db.query(AnalysisModel).count()
-        
-        # Son analizlerin ortalama skoru
-        recent_analyses = db.query(AnalysisModel).order_by(
-            AnalysisModel.analysis_date.desc()
-        ).limit(10).all()
-        
-        avg_score = sum(a.total_score for a in recent_analyses) / len(recent_analyses) if recent_analyses else 85
-        
-        # Düşük stok uyarısı (örnek)
-        alerts = 3
+        # Son dönem ortalama skor ve bozulan göz uyarıları
+        recent = get_stats(db, company_id, days=DASHBOARD_WINDOW_DAYS)
+        avg_score = recent['average_score']
+        if avg_score is None:
+            avg_score = 85  # Son dönemde analiz yok
         
         return {
-            "total_products": total_products,
-            "active_shelves": 6,
+            "total_products": count_products(db, company_id),
+            "active_shelves": count_active_shelves(db, company_id),
             "stock_level": int(avg_score),
-            "alerts": alerts
+            "alerts": recent['degraded_eye_alerts']
         }
     except Exception as e:
         # Veritabanı bağlantısı yoksa varsayılan değerler
@@ -92,7 +133,7 @@ def get_dashboard_stats(db: Session = Depends(get_db)):
 # Frontend'den direkt /api/analyze çağrısı için yönlendirme
 from app.api.analysis import enhanced_analyze
 
-@app.post("/api/analyze")
+@app.post("/api/analyze", dependencies=[Depends(analysis_admission)])
 async def analyze_shortcut(
     file: UploadFile = File(...),
     eye_count: int = 3,
@@ -1,6 +1,6 @@
 ﻿from .database import (
     Base,
-    engine,
+    get_engine,
     SessionLocal,
     get_db,
     Company,
@@ -15,6 +15,7 @@
 __all__ = [
     "Base",
     "engine",
+    "get_engine",
     "SessionLocal",
     "get_db",
     "Company",
@@ -25,3 +26,10 @@ __all__ = [
     "ScoringRule",
     "init_db"
 ]
+
+
+def __getattr__(name):
+    # engine ilk erişimde oluşturulur (app.models.database.get_engine)
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,39 +1,188 @@
 ﻿import os
+import threading
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Text, Float, DateTime, Boolean, ForeignKey, JSON
+from sqlalchemy import create_engine, event, Column, Integer, String, Text, Float, Date, DateTime, Boolean, ForeignKey, JSON, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, deferred
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, StaticPool
 from urllib.parse import quote_plus
 
 # Environment variables
+# DATABASE_BACKEND: mssql (varsayılan) | postgresql | sqlite
+# DATABASE_URL verilirse backend URL'den belirlenir ve diğer ayarlar yok sayılır
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "mssql").lower()
+
 MSSQL_SERVER = os.getenv("MSSQL_SERVER", "localhost\\MSSQLSERVERDEV")
 MSSQL_DATABASE = os.getenv("MSSQL_DATABASE", "FotoAnaliz")
 MSSQL_USERNAME = os.getenv("MSSQL_USERNAME", "")
 MSSQL_PASSWORD = os.getenv("MSSQL_PASSWORD", "")
 MSSQL_PORT = os.getenv("MSSQL_PORT", "1433")
 
-# MSSQL Connection String
-if MSSQL_USERNAME:
-    # SQL Server Authentication
-    password_encoded = quote_plus(MSSQL_PASSWORD)
-    DATABASE_URL = f"mssql+pyodbc://{MSSQL_USERNAME}:{password_encoded}@{MSSQL_SERVER}/{MSSQL_DATABASE}?driver=ODBC+Driver+18+for+SQL+Server&TrustServerCertificate=yes"
-else:
-    # Windows Authentication (Trusted Connection)
-    DATABASE_URL = f"mssql+pyodbc://{MSSQL_SERVER}/{MSSQL_DATABASE}?driver=ODBC+Driver+18+for+SQL+Server&Trusted_Connection=yes&TrustServerCertificate=yes"
+POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
+POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
+POSTGRES_DB = os.getenv("POSTGRES_DB", "fotoanaliz")
+POSTGRES_USER = os.getenv("POSTGRES_USER", "postgres")
+POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "")
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "./retail_shelf_ai.db")
+
+# Connection pool (sqlite :memory: hariç tüm backend'ler)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 3600))
+
+SUPPORTED_BACKENDS = ("mssql", "postgresql", "sqlite")
+
 
-print(f"Connecting to: {MSSQL_SERVER}/{MSSQL_DATABASE}")
-print(f"Auth type: {'SQL Server' if MSSQL_USERNAME else 'Windows Authentication'}")
+def _mssql_url() -> str:
+    if MSSQL_USERNAME:
+        # SQL Server Authentication
+        password_encoded = quote_plus(MSSQL_PASSWORD)
+        return f"mssql+pyodbc://{MSSQL_USERNAME}:{password_encoded}@{MSSQL_SERVER}/{MSSQL_DATABASE}?driver=ODBC+Driver+18+for+SQL+Server&TrustServerCertificate=yes"
+    # Windows Authentication (Trusted Connection)
+    return f"mssql+pyodbc://{MSSQL_SERVER}/{MSSQL_DATABASE}?driver=ODBC+Driver+18+for+SQL+Server&Trusted_Connection=yes&TrustServerCertificate=yes"
+
+
+def _postgresql_url() -> str:
+    password_encoded = quote_plus(POSTGRES_PASSWORD)
+    return f"postgresql+psycopg2://{POSTGRES_USER}:{password_encoded}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+
+
+def _sqlite_url() -> str:
+    if SQLITE_PATH == ":memory:":
+        return "sqlite://"
+    return f"sqlite:///{SQLITE_PATH}"
+
+
+def build_database_url() -> str:
+    """DATABASE_URL veya DATABASE_BACKEND ayarlarından bağlantı URL'i"""
+    explicit_url = os.getenv("DATABASE_URL")
+    if explicit_url:
+        return explicit_url
+
+    builders = {
+        "mssql": _mssql_url,
+        "postgresql": _postgresql_url,
+        "sqlite": _sqlite_url,
+    }
+    if DATABASE_BACKEND not in builders:
+        raise ValueError(f"DATABASE_BACKEND must be one of: {', '.join(SUPPORTED_BACKENDS)}")
+    return builders[DATABASE_BACKEND]()
+
+
+def _enable_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: okuyucular yazarı beklemez; foreign_keys: ON DELETE CASCADE için
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute(f"PRAGMA busy_timeout={int(DB_POOL_TIMEOUT * 1000)}")
+    cursor.close()
+
+
+def create_database_engine(url: str = None):
+    """
+    Backend'e göre yapılandırılmış engine
+
+    MSSQL/PostgreSQL ve dosya tabanlı SQLite QueuePool kullanır
+    (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE);
+    bellek içi SQLite tek bağlantılı StaticPool kullanır.
+    """
+    url = make_url(url or build_database_url())
+    echo = True if os.getenv("DEBUG") == "True" else False
+
+    if url.get_backend_name() == "sqlite":
+        connect_args = {"check_same_thread": False, "timeout": DB_POOL_TIMEOUT}
+        if not url.database or url.database == ":memory:":
+            return create_engine(url, echo=echo, connect_args=connect_args, poolclass=StaticPool)
+
+        engine = create_engine(
+            url,
+            echo=echo,
+            connect_args=connect_args,
+            poolclass=QueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT
+        )
+        event.listen(engine, "connect", _enable_sqlite_pragmas)
+        return engine
+
+    return create_engine(
+        url,
+        echo=echo,
+        pool_pre_ping=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE
+    )
+
+
+# SQLAlchemy Engine (ilk kullanımda oluşturulur; import sırasında bağlantı/driver yüklenmez)
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                url = make_url(build_database_url())
+                print(f"Connecting to: {url.render_as_string(hide_password=True)}")
+                if url.get_backend_name() == "mssql":
+                    print(f"Auth type: {'SQL Server' if url.username else 'Windows Authentication'}")
+                _engine = create_database_engine(url)
+    return _engine
+
+
+def get_pool_stats() -> dict:
+    """Connection pool durumu (engine henüz oluşturulmadıysa created=False)"""
+    if _engine is None:
+        return {"created": False}
+
+    pool = _engine.pool
+    stats = {
+        "created": True,
+        "backend": _engine.dialect.name,
+        "pool_class": type(pool).__name__,
+        "status": pool.status()
+    }
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "timeout": pool.timeout()
+        })
+    return stats
+
+
+def __getattr__(name):
+    # Geriye uyumluluk: `from app.models.database import engine`
+    if name == "engine":
+        return get_engine()
+    if name == "DATABASE_URL":
+        return build_database_url()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# SQLAlchemy Engine
-engine = create_engine(
-    DATABASE_URL,
-    echo=True if os.getenv("DEBUG") == "True" else False,
-    pool_pre_ping=True,
-    pool_recycle=3600
-)
 
 # Session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class LazySessionmaker(sessionmaker):
+    """İlk session açılırken engine'i oluşturup bağlayan sessionmaker"""
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+
+SessionLocal = LazySessionmaker(autocommit=False, autoflush=False)
 
 # Base
 Base = declarative_base()
@@ -59,6 +208,7 @@ class Company(Base):
     logo_url = Column(String(500))
     description = Column(Text)
     is_active = Column(Boolean, default=True)
+    product_count = Column(Integer, default=0)  # Ürün sayacı (dashboard; app.services.rollups)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -68,6 +218,8 @@ class Company(Base):
     models = relationship("Model", back_populates="company", cascade="all, delete-orphan")
     analyses = relationship("Analysis", back_populates="company", cascade="all, delete-orphan")
     scoring_rules = relationship("ScoringRule", back_populates="company", cascade="all, delete-orphan")
+    daily_stats = relationship("AnalysisDailyStats", back_populates="company", cascade="all, delete-orphan")
+    shelf_activity = relationship("ShelfActivity", back_populates="company", cascade="all, delete-orphan")
 
 
 # 2. Products (Ürünler)
@@ -82,9 +234,12 @@ class Product(Base):
     category = Column(String(100))
     brand = Column(String(100))
     image_url = Column(String(500))
+    reference_image = Column(String(500))  # Referans görüntü dosya yolu
     reference_colors = Column(JSON)  # Ana renkler: {"primary": "#FF0000", "secondary": "#00FF00"}
+    color_signature = Column(JSON)  # Referans görüntüden renk imzası (64 boyutlu histogram)
     package_type = Column(String(100))  # "bottle", "can", "box", etc.
     dimensions = Column(JSON)  # {"width": 100, "height": 200, "depth": 50}
+    is_own_product = Column(Boolean, default=True)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -106,7 +261,7 @@ class Dataset(Base):
     train_images = Column(Integer, default=0)
     val_images = Column(Integer, default=0)
     classes = Column(JSON)  # ["Product A", "Product B", "Product C"]
-    status = Column(String(50), default="preparing")  # preparing, ready, training, completed
+    status = Column(String(50), default="preparing")  # preparing, ready, training, completed, purged
     dataset_path = Column(String(500))  # ./datasets/company_1/dataset_1
     yaml_path = Column(String(500))  # ./datasets/company_1/dataset_1/data.yaml
     is_active = Column(Boolean, default=True)
@@ -116,6 +271,12 @@ class Dataset(Base):
     # Relationships
     company = relationship("Company", back_populates="datasets")
     models = relationship("Model", back_populates="dataset")
+    images = relationship("DatasetImage", back_populates="dataset", passive_deletes=True)
+
+    __table_args__ = (
+        # Keyset sayfalama: (created_at, id) DESC
+        Index("ix_datasets_company_created_id", company_id, created_at.desc(), id.desc()),
+    )
 
 
 # 4. Models (AI Modelleri)
@@ -148,6 +309,11 @@ class Model(Base):
     dataset = relationship("Dataset", back_populates="models")
     analyses = relationship("Analysis", back_populates="model")
 
+    __table_args__ = (
+        # Keyset sayfalama: (created_at, id) DESC
+        Index("ix_models_company_created_id", company_id, created_at.desc(), id.desc()),
+    )
+
 
 # 5. Analyses (Raf Analizleri)
 class Analysis(Base):
@@ -158,21 +324,123 @@ class Analysis(Base):
     model_id = Column(Integer, ForeignKey("models.id"), nullable=False)
     image_path = Column(String(500), nullable=False)
     image_url = Column(String(500))
-    detections = Column(JSON)  # Tespit edilen ürünler ve konumları
+    shelf_id = Column(String(100))  # Raf kimliği (zaman serisi karşılaştırma için)
+    # Büyük JSON alanlar varsayılan olarak yüklenmez (group="payload" ile birlikte gelir)
+    detections = deferred(Column(JSON), group="payload")  # Tespit edilen ürünler ve konumları
     total_products = Column(Integer, default=0)
     product_counts = Column(JSON)  # {"Product A": 5, "Product B": 3}
     shelf_coverage = Column(Float)  # Raf doluluk oranı %
-    color_analysis = Column(JSON)  # Renk analizi sonuçları
+    color_analysis = deferred(Column(JSON), group="payload")  # Renk analizi sonuçları
     planogram_score = Column(Float)  # Planogram uyum skoru
     visibility_score = Column(Float)  # Görünürlük skoru
     total_score = Column(Float)  # Toplam skor
     analysis_date = Column(DateTime, default=datetime.utcnow)
     inference_time = Column(Float)  # Saniye cinsinden
+    image_scale = Column(Float, default=1.0)  # Çıkarım kopyası / orijinal (bbox'lar kopya koordinatında)
+    archived_at = Column(DateTime)  # JSON alanlar Parquet arşivine taşındıysa
+    archive_path = Column(String(500))  # Arşiv dosyası (app.services.analysis_archive)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
     company = relationship("Company", back_populates="analyses")
     model = relationship("Model", back_populates="analyses")
+    detection_rows = relationship("AnalysisDetection", back_populates="analysis", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        # Raf geçmişi / son analiz: index seek
+        Index("ix_analyses_company_shelf_date", company_id, shelf_id, analysis_date.desc()),
+        # Şirket filtresiz raf geçmişi (/history/{shelf_id})
+        Index("ix_analyses_shelf_date", shelf_id, analysis_date.desc()),
+        # Keyset sayfalama: (analysis_date, id) DESC
+        Index("ix_analyses_company_date_id", company_id, analysis_date.desc(), id.desc()),
+    )
+
+
+# 5a. Analysis Detections (Normalize Tespitler)
+class AnalysisDetection(Base):
+    """
+    Analiz başına tek tek tespitler (Analysis.detections JSON'unun düz hali)
+    
+    company_id / shelf_id / analysis_date analizden kopyalanır; böylece
+    "X ürününün geçen haftaki yüz sayısı" gibi sorgular join ve JSON
+    ayrıştırma olmadan index üzerinden SQL'de toplanır.
+    """
+    __tablename__ = "analysis_detections"
+
+    id = Column(Integer, primary_key=True, index=True)
+    analysis_id = Column(Integer, ForeignKey("analyses.id", ondelete="CASCADE"), nullable=False, index=True)
+    company_id = Column(Integer, nullable=False)
+    shelf_id = Column(String(100))
+    analysis_date = Column(DateTime, nullable=False)
+    eye_id = Column(Integer)  # Raf gözü (1 = en üst), bilinmiyorsa NULL
+    class_name = Column(String(255), nullable=False)
+    confidence = Column(Float)
+    x1 = Column(Integer)
+    y1 = Column(Integer)
+    x2 = Column(Integer)
+    y2 = Column(Integer)
+
+    # Relationships
+    analysis = relationship("Analysis", back_populates="detection_rows")
+
+    __table_args__ = (
+        Index("ix_analysis_detections_company_class_date", company_id, class_name, analysis_date),
+    )
+
+
+# 5b. Analysis Daily Stats (Günlük Analiz Özeti)
+class AnalysisDailyStats(Base):
+    """
+    Şirket + gün başına analiz özeti
+    
+    Her analiz kaydıyla aynı transaction içinde artırılır (app.services.rollups);
+    dashboard ve trend grafikleri analyses tablosunu taramadan buradan okur.
+    """
+    __tablename__ = "analysis_daily_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    analysis_count = Column(Integer, default=0, nullable=False)
+    total_products_sum = Column(Integer, default=0, nullable=False)
+    total_score_sum = Column(Float, default=0.0, nullable=False)
+    shelf_coverage_sum = Column(Float, default=0.0, nullable=False)
+    visibility_score_sum = Column(Float, default=0.0, nullable=False)
+    degraded_eye_alerts = Column(Integer, default=0, nullable=False)  # Önceki analize göre bozulan gözler
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    company = relationship("Company", back_populates="daily_stats")
+
+    __table_args__ = (
+        UniqueConstraint("company_id", "day", name="uq_analysis_daily_stats_company_day"),
+    )
+
+
+# 5c. Shelf Activity (Raf Son Analiz Zamanı)
+class ShelfActivity(Base):
+    """
+    Şirket + raf başına son analiz zamanı
+    
+    Analizle aynı transaction içinde güncellenir (app.services.rollups);
+    dashboard'daki aktif raf sayısı analyses tablosunda COUNT DISTINCT
+    yerine bu tablodaki index aralığından sayılır.
+    """
+    __tablename__ = "shelf_activity"
+
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    shelf_id = Column(String(100), nullable=False)
+    last_analysis_date = Column(DateTime, nullable=False)
+
+    # Relationships
+    company = relationship("Company", back_populates="shelf_activity")
+
+    __table_args__ = (
+        UniqueConstraint("company_id", "shelf_id", name="uq_shelf_activity_company_shelf"),
+        Index("ix_shelf_activity_company_date", company_id, last_analysis_date),
+        Index("ix_shelf_activity_date", last_analysis_date),
+    )
 
 
 # 6. Scoring Rules (Puanlama Kuralları)
@@ -193,9 +461,61 @@ class ScoringRule(Base):
     company = relationship("Company", back_populates="scoring_rules")
 
 
+# 7. Image Blobs (İçerik Adresli Görüntüler)
+class ImageBlob(Base):
+    """
+    SHA-256 ile adreslenen görüntü dosyası (app.services.blob_store)
+    
+    Aynı içerik diskte bir kez tutulur; ref_count onu kullanan satır sayısıdır
+    (Analysis.image_path, Product.reference_image, dataset görüntü linkleri).
+    """
+    __tablename__ = "image_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), nullable=False, unique=True, index=True)
+    path = Column(String(500), nullable=False)  # uploads/blobs/ab/cd/<sha256>.jpg
+    size = Column(Integer)  # Bayt
+    ref_count = Column(Integer, default=0, nullable=False)
+    width = Column(Integer)  # Orijinal boyut (piksel)
+    height = Column(Integer)
+    # Türevler (app.services.derivatives); inference_path küçük görüntülerde path'in kendisi
+    thumbnail_path = Column(String(500))
+    inference_path = Column(String(500))
+    preview_path = Column(String(500))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DatasetImage(Base):
+    """
+    Dataset images/ klasöründeki bir görüntü linki ve tuttuğu blob referansı
+    
+    attach_dataset_image ile oluşturulan her link bir satırdır (app.services.blob_store);
+    aynı yola yeniden yüklendiğinde veya dataset silindiğinde referans bu
+    satır üzerinden bırakılır.
+    """
+    __tablename__ = "dataset_images"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id", ondelete="CASCADE"), nullable=False)
+    path = Column(String(500), nullable=False)  # datasets/company_1/dataset_1/images/x.jpg
+    blob_path = Column(String(500), nullable=False)  # ImageBlob.path
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    dataset = relationship("Dataset", back_populates="images")
+
+    __table_args__ = (
+        UniqueConstraint("dataset_id", "path", name="uq_dataset_images_dataset_path"),
+    )
+
+
 # Create all tables
 def init_db():
+    from app.models.migrations import run_migrations
+
+    engine = get_engine()
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
     print("Database tables created successfully!")
 
 
@@ -0,0 +1,351 @@
+﻿"""
+Basit, idempotent şema göçleri
+
+create_all() mevcut tablolara yeni kolon veya index eklemez; bu modül eksik
+kolonları/indexleri ekler ve gerekli veri dönüşümlerini (backfill) yapar.
+Uygulanan göçler schema_migrations tablosuna yazılır ve tekrar çalışmaz.
+"""
+import os
+import re
+from datetime import datetime
+from sqlalchemy import inspect, text, func, MetaData, Table, Column, String, DateTime, select, update, bindparam
+
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("name", String(255), primary_key=True),
+    Column("applied_at", DateTime, default=datetime.utcnow)
+)
+
+
+def _add_column_if_missing(connection, table_name: str, column) -> bool:
+    inspector = inspect(connection)
+    existing = {col['name'] for col in inspector.get_columns(table_name)}
+    if column.name in existing:
+        return False
+
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE {table_name} ADD {column.name} {column_type}"))
+    print(f"✅ Kolon eklendi: {table_name}.{column.name}")
+    return True
+
+
+def _add_model_columns(connection, model, column_names: list):
+    table = model.__table__
+    for name in column_names:
+        _add_column_if_missing(connection, table.name, table.c[name])
+
+
+def _create_index_if_missing(connection, index) -> bool:
+    inspector = inspect(connection)
+    existing = {ix['name'] for ix in inspector.get_indexes(index.table.name)}
+    if index.name in existing:
+        return False
+
+    index.create(bind=connection)
+    print(f"✅ Index oluşturuldu: {index.name}")
+    return True
+
+
+def migrate_product_columns(connection):
+    """Products: referans görüntü, sahiplik ve renk imzası kolonları"""
+    from app.models.database import Product
+
+    _add_model_columns(connection, Product, ['reference_image', 'is_own_product', 'color_signature'])
+
+
+# analysis_{company_id}_{shelf_id}_{timestamp}.ext
+_ANALYSIS_FILENAME = re.compile(r"^analysis_(\d+)_(.+)_(\d+)\.[^.]+$")
+
+
+def parse_shelf_id(image_path: str, model_id: int = None):
+    """
+    Eski dosya adından raf kimliğini çıkar
+    
+    /upload ile kaydedilen dosyalarda ortadaki alan model_id'dir; bunlar
+    raf kimliği olarak sayılmaz.
+    """
+    if not image_path:
+        return None
+
+    match = _ANALYSIS_FILENAME.match(os.path.basename(image_path))
+    if not match:
+        return None
+
+    shelf_id = match.group(2)
+    if shelf_id == 'unknown':
+        return None
+    if model_id is not None and shelf_id == str(model_id):
+        return None
+    return shelf_id[:100]
+
+
+def migrate_analysis_shelf_id(connection, chunk_size: int = 1000):
+    """Analyses: shelf_id kolonu + composite index + dosya yolundan backfill"""
+    from app.models.database import Analysis
+
+    _add_model_columns(connection, Analysis, ['shelf_id'])
+    _create_index_if_missing(connection, next(
+        ix for ix in Analysis.__table__.indexes if ix.name == "ix_analyses_company_shelf_date"
+    ))
+
+    table = Analysis.__table__
+    last_id = 0
+    filled = 0
+    while True:
+        rows = connection.execute(
+            select(table.c.id, table.c.image_path, table.c.model_id)
+            .where(table.c.id > last_id, table.c.shelf_id.is_(None))
+            .order_by(table.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+
+        params = []
+        for row in rows:
+            shelf_id = parse_shelf_id(row.image_path, row.model_id)
+            if shelf_id:
+                params.append({'row_id': row.id, 'shelf_id': shelf_id})
+
+        if params:
+            connection.execute(
+                update(table).where(table.c.id == bindparam('row_id')).values(shelf_id=bindparam('shelf_id')),
+                params
+            )
+            filled += len(params)
+
+        last_id = rows[-1].id
+
+    if filled:
+        print(f"✅ shelf_id backfill: {filled} analiz")
+
+
+def migrate_pagination_indexes(connection):
+    """Keyset sayfalama için composite indexler"""
+    from app.models.database import Analysis, Dataset, Model
+
+    for model, index_name in [
+        (Analysis, "ix_analyses_company_date_id"),
+        (Dataset, "ix_datasets_company_created_id"),
+        (Model, "ix_models_company_created_id"),
+    ]:
+        _create_index_if_missing(connection, next(
+            ix for ix in model.__table__.indexes if ix.name == index_name
+        ))
+
+
+def migrate_analysis_daily_stats(connection):
+    """Günlük analiz özeti tablosu + mevcut analizlerden backfill"""
+    from app.models.database import Analysis, AnalysisDailyStats
+
+    stats = AnalysisDailyStats.__table__
+    stats.create(bind=connection, checkfirst=True)
+    if connection.execute(select(stats.c.id).limit(1)).first():
+        return
+
+    table = Analysis.__table__
+    rollups = {}
+    result = connection.execution_options(yield_per=5000).execute(select(
+        table.c.company_id,
+        table.c.analysis_date,
+        table.c.total_products,
+        table.c.total_score,
+        table.c.shelf_coverage,
+        table.c.visibility_score
+    ))
+    for row in result:
+        day = (row.analysis_date or datetime.utcnow()).date()
+        entry = rollups.setdefault((row.company_id, day), {
+            'company_id': row.company_id,
+            'day': day,
+            'analysis_count': 0,
+            'total_products_sum': 0,
+            'total_score_sum': 0.0,
+            'shelf_coverage_sum': 0.0,
+            'visibility_score_sum': 0.0,
+            # Geçmiş karşılaştırmalar saklanmadığından bilinmiyor
+            'degraded_eye_alerts': 0,
+            'updated_at': datetime.utcnow()
+        })
+        entry['analysis_count'] += 1
+        entry['total_products_sum'] += row.total_products or 0
+        entry['total_score_sum'] += row.total_score or 0.0
+        entry['shelf_coverage_sum'] += row.shelf_coverage or 0.0
+        entry['visibility_score_sum'] += row.visibility_score or 0.0
+
+    if rollups:
+        connection.execute(stats.insert(), list(rollups.values()))
+        print(f"✅ Günlük özet backfill: {len(rollups)} gün")
+
+
+def migrate_analysis_detections(connection, chunk_size: int = 500):
+    """Normalize tespit tablosu + ham tespit listesi saklanan analizlerden backfill"""
+    from app.models.database import Analysis, AnalysisDetection
+    from app.services.detection_store import detection_rows
+
+    detections_table = AnalysisDetection.__table__
+    detections_table.create(bind=connection, checkfirst=True)
+    if connection.execute(select(detections_table.c.id).limit(1)).first():
+        return
+
+    # Celery görevi ham tespit listesini (list) saklar; ROI analizleri (dict)
+    # kutu bilgisi içermediğinden aktarılamaz
+    table = Analysis.__table__
+    last_id = 0
+    written = 0
+    while True:
+        rows = connection.execute(
+            select(
+                table.c.id, table.c.company_id, table.c.shelf_id,
+                table.c.analysis_date, table.c.detections
+            )
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+
+        params = []
+        for row in rows:
+            if isinstance(row.detections, list):
+                params.extend(detection_rows(row, row.detections))
+        if params:
+            connection.execute(detections_table.insert(), params)
+            written += len(params)
+
+        last_id = rows[-1].id
+
+    if written:
+        print(f"✅ Tespit backfill: {written} satır")
+
+
+def migrate_analysis_archive_columns(connection):
+    """Analyses: Parquet arşiv işaret kolonları"""
+    from app.models.database import Analysis
+
+    _add_model_columns(connection, Analysis, ['archived_at', 'archive_path'])
+
+
+def migrate_image_derivatives(connection):
+    """Image blobs: türev yolları ve boyut; analyses: çıkarım kopyası ölçeği"""
+    from app.models.database import Analysis, ImageBlob
+
+    _add_model_columns(connection, ImageBlob, ['width', 'height', 'thumbnail_path', 'inference_path', 'preview_path'])
+    _add_model_columns(connection, Analysis, ['image_scale'])
+
+
+
+def migrate_shelf_history_index(connection):
+    """Analyses: şirket filtresiz raf geçmişi için (shelf_id, analysis_date) index"""
+    from app.models.database import Analysis
+
+    _create_index_if_missing(connection, next(
+        ix for ix in Analysis.__table__.indexes if ix.name == "ix_analyses_shelf_date"
+    ))
+
+
+
+def migrate_dashboard_counters(connection):
+    """Companies: ürün sayacı; shelf_activity: raf başına son analiz zamanı (backfill)"""
+    from app.models.database import Analysis, Company, Product, ShelfActivity
+
+    _add_model_columns(connection, Company, ['product_count'])
+    companies, products = Company.__table__, Product.__table__
+    connection.execute(update(companies).values(
+        product_count=select(func.count(products.c.id)).where(
+            products.c.company_id == companies.c.id
+        ).scalar_subquery(),
+        updated_at=companies.c.updated_at
+    ))
+
+    activity = ShelfActivity.__table__
+    activity.create(bind=connection, checkfirst=True)
+    if connection.execute(select(activity.c.id).limit(1)).first():
+        return
+
+    analyses = Analysis.__table__
+    result = connection.execute(activity.insert().from_select(
+        ['company_id', 'shelf_id', 'last_analysis_date'],
+        select(
+            analyses.c.company_id,
+            analyses.c.shelf_id,
+            func.max(analyses.c.analysis_date)
+        ).where(
+            analyses.c.shelf_id.isnot(None),
+            analyses.c.analysis_date.isnot(None)
+        ).group_by(analyses.c.company_id, analyses.c.shelf_id)
+    ))
+    print(f"✅ Raf aktivitesi backfill: {result.rowcount} raf")
+
+
+def migrate_dataset_images(connection):
+    """dataset_images tablosu + mevcut dataset linklerinin sahiplik kaydı (backfill)"""
+    from app.models.database import Dataset, DatasetImage, ImageBlob
+    from app.services.blob_store import _file_sha256
+
+    images = DatasetImage.__table__
+    images.create(bind=connection, checkfirst=True)
+    if connection.execute(select(images.c.id).limit(1)).first():
+        return
+
+    blobs = ImageBlob.__table__
+    datasets = Dataset.__table__
+    backfilled = 0
+    for dataset_id, dataset_path in connection.execute(
+        select(datasets.c.id, datasets.c.dataset_path).where(datasets.c.dataset_path.isnot(None))
+    ).all():
+        images_dir = os.path.join(dataset_path, "images")
+        if not os.path.isdir(images_dir):
+            continue
+        # Referansı yüklemede alınmış depo hardlink'leri; kopyalar ve depo öncesi dosyalar ayırt edilemez
+        for name in sorted(os.listdir(images_dir)):
+            path = os.path.join(images_dir, name)
+            if not os.path.isfile(path) or os.stat(path).st_nlink < 2:
+                continue
+            blob_path = connection.execute(
+                select(blobs.c.path).where(blobs.c.sha256 == _file_sha256(path))
+            ).scalar()
+            if blob_path and os.path.exists(blob_path) and os.path.samefile(path, blob_path):
+                connection.execute(images.insert().values(
+                    dataset_id=dataset_id, path=path, blob_path=blob_path, created_at=datetime.utcnow()
+                ))
+                backfilled += 1
+    print(f"✅ Dataset görüntü sahipliği backfill: {backfilled} görüntü")
+
+
+MIGRATIONS = [
+    migrate_product_columns,
+    migrate_analysis_shelf_id,
+    migrate_pagination_indexes,
+    migrate_analysis_daily_stats,
+    migrate_analysis_detections,
+    migrate_analysis_archive_columns,
+    migrate_image_derivatives,
+    migrate_shelf_history_index,
+    migrate_dashboard_counters,
+    migrate_dataset_images,
+]
+
+
+def run_migrations(engine):
+    """Uygulanmamış göçleri sırayla uygula"""
+    _metadata.create_all(bind=engine)
+
+    for migration in MIGRATIONS:
+        with engine.begin() as connection:
+            applied = connection.execute(
+                select(schema_migrations.c.name).where(schema_migrations.c.name == migration.__name__)
+            ).first()
+            if applied:
+                continue
+
+            migration(connection)
+            connection.execute(schema_migrations.insert().values(
+                name=migration.__name__,
+                applied_at=datetime.utcnow()
+            ))
@@ -0,0 +1,206 @@
+﻿"""
+Analiz endpoint'leri için kabul kontrolü (admission control)
+
+Sabah toplu yüklemelerinde /analyze istekleri birikir; her biri bir worker,
+çözülmüş görüntü belleği ve bir DB session tutar. Bu modül analiz
+route'larının önünde üç sınır uygular:
+    
+    1. Şirket başına token bucket (ANALYSIS_COMPANY_RATE istek/sn,
+       ANALYSIS_COMPANY_BURST kapasite) -> aşılırsa 429
+    2. Eşzamanlı analiz sınırı (ANALYSIS_MAX_CONCURRENCY)
+    3. Sınırlı bekleme kuyruğu (ANALYSIS_MAX_QUEUE); kuyruk doluysa veya
+       ANALYSIS_QUEUE_TIMEOUT içinde yer açılmazsa -> 503
+
+Reddedilen yanıtlar Retry-After başlığı taşır. Sınırlar süreç (uvicorn
+worker) başınadır; durum tek event loop üzerinde tutulur.
+"""
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Optional
+from fastapi import HTTPException, Request
+
+ANALYSIS_MAX_CONCURRENCY = int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "4"))
+ANALYSIS_MAX_QUEUE = int(os.getenv("ANALYSIS_MAX_QUEUE", "16"))
+ANALYSIS_QUEUE_TIMEOUT = float(os.getenv("ANALYSIS_QUEUE_TIMEOUT", "30"))  # Kuyrukta en fazla bekleme (sn)
+ANALYSIS_COMPANY_RATE = float(os.getenv("ANALYSIS_COMPANY_RATE", "2"))  # Şirket başına istek/sn
+ANALYSIS_COMPANY_BURST = float(os.getenv("ANALYSIS_COMPANY_BURST", "10"))
+
+
+class TokenBucket:
+    """Saniyede rate token dolan, en fazla capacity token tutan kova"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def take(self, cost: float = 1.0) -> float:
+        """Token al; yetmiyorsa alınmaz ve beklenecek süre (sn) döner, alındıysa 0"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate > 0 else float(ANALYSIS_QUEUE_TIMEOUT)
+
+
+class AdmissionController:
+    """
+    Eşzamanlılık semaforu + sınırlı FIFO bekleme kuyruğu + şirket kovaları
+    
+    Slot bırakıldığında sıradaki bekleyene doğrudan devredilir; kuyruğa
+    sonradan gelen istek bekleyenlerin önüne geçemez.
+    """
+    
+    def __init__(
+        self,
+        max_concurrency: int = ANALYSIS_MAX_CONCURRENCY,
+        max_queue: int = ANALYSIS_MAX_QUEUE,
+        queue_timeout: float = ANALYSIS_QUEUE_TIMEOUT,
+        company_rate: float = ANALYSIS_COMPANY_RATE,
+        company_burst: float = ANALYSIS_COMPANY_BURST
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.company_rate = company_rate
+        self.company_burst = company_burst
+        
+        self._active = 0
+        self._waiters = deque()
+        self._buckets = {}
+        self._service_time = 1.0  # Analiz süresi (EWMA, sn) - Retry-After tahmini
+        self._counters = {
+            'admitted': 0,
+            'queued': 0,
+            'rejected_rate_limited': 0,
+            'rejected_queue_full': 0,
+            'rejected_timeout': 0
+        }
+        self._max_wait = 0.0
+    
+    def _reject(self, status_code: int, counter: str, retry_after: float, detail: str):
+        self._counters[counter] += 1
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+    
+    def _estimated_wait(self) -> float:
+        """Kuyruktaki herkesin slot alması için tahmini süre"""
+        return self._service_time * (len(self._waiters) + 1) / self.max_concurrency
+    
+    def _check_rate(self, company_id: Optional[int]):
+        if self.company_rate <= 0:
+            return
+        bucket = self._buckets.get(company_id)
+        if bucket is None:
+            bucket = self._buckets[company_id] = TokenBucket(self.company_rate, self.company_burst)
+        wait = bucket.take()
+        if wait:
+            self._reject(429, 'rejected_rate_limited', wait, "Too many analysis requests for this company")
+    
+    async def acquire(self, company_id: Optional[int] = None):
+        """
+        Slot al (gerekirse kuyrukta bekle)
+        
+        Raises:
+            HTTPException(429): Şirket kovası boş
+            HTTPException(503): Kuyruk dolu veya bekleme süresi doldu
+        """
+        self._check_rate(company_id)
+        
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            self._counters['admitted'] += 1
+            return
+        
+        if len(self._waiters) >= self.max_queue:
+            self._reject(503, 'rejected_queue_full', self._estimated_wait(), "Analysis queue is full, retry later")
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._counters['queued'] += 1
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                self._reject(503, 'rejected_timeout', self._estimated_wait(), "Analysis queue timeout, retry later")
+        except asyncio.CancelledError:
+            # İstemci koptu; slot devredildiyse geri ver
+            if self._abandon(waiter):
+                self.release()
+            raise
+        self._max_wait = max(self._max_wait, time.monotonic() - queued_at)
+        self._counters['admitted'] += 1
+    
+    def _abandon(self, waiter) -> bool:
+        """Bekleyeni kuyruktan çıkar; slot zaten devredildiyse True"""
+        if waiter.done():
+            return True
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        return False
+    
+    def release(self, service_time: float = None):
+        """Slotu bırak (varsa sıradaki bekleyene devret)"""
+        if service_time is not None:
+            self._service_time = 0.8 * self._service_time + 0.2 * service_time
+        
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # Slot devredildi, _active değişmez
+                return
+        self._active = max(0, self._active - 1)
+    
+    def stats(self) -> dict:
+        """Kuyruk derinliği ve sayaçlar (/health/admission)"""
+        return {
+            'active': self._active,
+            'max_concurrency': self.max_concurrency,
+            'queue_depth': len(self._waiters),
+            'max_queue': self.max_queue,
+            'queue_timeout': self.queue_timeout,
+            'avg_service_time': round(self._service_time, 3),
+            'max_queue_wait': round(self._max_wait, 3),
+            'company_buckets': len(self._buckets),
+            **self._counters
+        }
+
+
+controller = AdmissionController()
+
+
+async def analysis_admission(request: Request):
+    """
+    Analiz route'ları için FastAPI dependency
+    
+    Şirket ?company_id= sorgusundan okunur (route'ların kendi varsayılanı
+    OpenAPI şemasında tekrar tanımlanmasın diye); yoksa ortak kova.
+    Slot yanıt tamamlanana kadar tutulur (StreamingResponse dahil).
+    Gövde (multipart) bu noktada zaten diske alınmıştır; sınırlanan kısım
+    görüntü çözme, çıkarım ve DB işidir.
+    """
+    company_id = request.query_params.get('company_id')
+    await controller.acquire(int(company_id) if company_id and company_id.isdigit() else None)
+    start_time = time.monotonic()
+    try:
+        yield
+    finally:
+        controller.release(time.monotonic() - start_time)
+
+
+def get_admission_stats() -> dict:
+    return controller.stats()
@@ -0,0 +1,278 @@
+﻿"""
+Eski analizlerin Parquet arşivi
+
+Saklama süresini aşan analizler sunucu tarafı cursor ile (yield_per) parça
+parça okunur, şirket/ay bölümlü zstd sıkıştırılmış Parquet dosyalarına
+yazılır ve sıcak tablodaki büyük JSON alanlar boşaltılır. Skaler kolonlar
+(skorlar, tarih, raf) tabloda kalır; JSON gerektiğinde load_archived_payloads
+ile dosyadan okunur.
+
+Dizin yapısı:
+    ARCHIVE_DIR/company=<id>/month=<YYYY-MM>/part-<zaman>-<ilk_id>.parquet
+"""
+import os
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict
+from sqlalchemy import select, update, null
+from sqlalchemy.orm import Session, undefer_group
+
+from app.models.database import SessionLocal, Analysis, AnalysisDetection
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "180"))
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "500"))
+ARCHIVE_COMPRESSION = "zstd"
+
+
+def _pyarrow():
+    """pyarrow'u ilk kullanımda yükle (API süreci için gerekli değil)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet arşivi için pyarrow gerekli: pip install pyarrow")
+    return pa, pq
+
+
+def _schema(pa):
+    detection = pa.struct([
+        ('eye_id', pa.int32()),
+        ('class_name', pa.string()),
+        ('confidence', pa.float32()),
+        ('x1', pa.int32()),
+        ('y1', pa.int32()),
+        ('x2', pa.int32()),
+        ('y2', pa.int32()),
+    ])
+    return pa.schema([
+        ('id', pa.int64()),
+        ('company_id', pa.int32()),
+        ('model_id', pa.int32()),
+        ('shelf_id', pa.string()),
+        ('image_path', pa.string()),
+        ('analysis_date', pa.timestamp('us')),
+        ('total_products', pa.int32()),
+        ('shelf_coverage', pa.float64()),
+        ('planogram_score', pa.float64()),
+        ('visibility_score', pa.float64()),
+        ('total_score', pa.float64()),
+        ('inference_time', pa.float64()),
+        ('product_counts', pa.string()),  # JSON
+        ('analysis_json', pa.string()),  # Analysis.detections (JSON)
+        ('color_analysis', pa.string()),  # JSON
+        ('detections', pa.list_(detection)),
+    ])
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False) if value is not None else None
+
+
+def _loads(value):
+    return json.loads(value) if value else None
+
+
+def partition_dir(company_id: int, analysis_date: datetime) -> str:
+    return os.path.join(ARCHIVE_DIR, f"company={company_id}", f"month={analysis_date:%Y-%m}")
+
+
+def _detections_by_analysis(db: Session, analysis_ids: List[int]) -> Dict[int, list]:
+    rows = db.query(
+        AnalysisDetection.analysis_id,
+        AnalysisDetection.eye_id,
+        AnalysisDetection.class_name,
+        AnalysisDetection.confidence,
+        AnalysisDetection.x1,
+        AnalysisDetection.y1,
+        AnalysisDetection.x2,
+        AnalysisDetection.y2
+    ).filter(AnalysisDetection.analysis_id.in_(analysis_ids)).order_by(AnalysisDetection.id).all()
+    
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.analysis_id, []).append({
+            'eye_id': row.eye_id,
+            'class_name': row.class_name,
+            'confidence': row.confidence,
+            'x1': row.x1,
+            'y1': row.y1,
+            'x2': row.x2,
+            'y2': row.y2
+        })
+    return grouped
+
+
+def _write_partition(analyses: list, detections: Dict[int, list]) -> str:
+    """Aynı şirket/aya ait analizleri tek Parquet dosyasına yaz (atomik)"""
+    pa, pq = _pyarrow()
+    
+    first = analyses[0]
+    directory = partition_dir(first.company_id, first.analysis_date)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{int(time.time() * 1000)}-{first.id}.parquet")
+    
+    table = pa.Table.from_pylist([
+        {
+            'id': a.id,
+            'company_id': a.company_id,
+            'model_id': a.model_id,
+            'shelf_id': a.shelf_id,
+            'image_path': a.image_path,
+            'analysis_date': a.analysis_date,
+            'total_products': a.total_products,
+            'shelf_coverage': a.shelf_coverage,
+            'planogram_score': a.planogram_score,
+            'visibility_score': a.visibility_score,
+            'total_score': a.total_score,
+            'inference_time': a.inference_time,
+            'product_counts': _dumps(a.product_counts),
+            'analysis_json': _dumps(a.detections),
+            'color_analysis': _dumps(a.color_analysis),
+            'detections': detections.get(a.id, [])
+        }
+        for a in analyses
+    ], schema=_schema(pa))
+    
+    temp_path = path + ".tmp"
+    pq.write_table(table, temp_path, compression=ARCHIVE_COMPRESSION)
+    os.replace(temp_path, path)
+    return path
+
+
+def archive_analyses(
+    company_id: Optional[int] = None,
+    older_than_days: Optional[int] = None,
+    chunk_size: Optional[int] = None
+) -> dict:
+    """
+    Saklama süresini aşan analizleri Parquet'e taşı
+    
+    Okuma ayrı bir session üzerinden sunucu tarafı cursor ile (yield_per)
+    yapılır; her parça şirket/ay bazında dosyaya yazıldıktan sonra yazma
+    session'ında JSON alanlar boşaltılıp archived_at/archive_path işaretlenir
+    ve commit edilir. Yarıda kesilirse kalan analizler bir sonraki çalışmada
+    tekrar seçilir.
+    """
+    older_than_days = older_than_days if older_than_days is not None else ARCHIVE_RETENTION_DAYS
+    chunk_size = chunk_size or ARCHIVE_CHUNK_SIZE
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    
+    _pyarrow()
+    start_time = time.time()
+    read_db = SessionLocal()
+    write_db = SessionLocal()
+    archived = 0
+    files = []
+    
+    try:
+        statement = select(Analysis).options(undefer_group("payload")).where(
+            Analysis.archived_at.is_(None),
+            Analysis.analysis_date < cutoff
+        )
+        if company_id is not None:
+            statement = statement.where(Analysis.company_id == company_id)
+        statement = statement.order_by(Analysis.company_id, Analysis.analysis_date, Analysis.id)
+        
+        result = read_db.execute(statement, execution_options={'yield_per': chunk_size}).scalars()
+        for chunk in result.partitions():
+            detections = _detections_by_analysis(write_db, [a.id for a in chunk])
+            
+            # Şirket/ay bölümlerine ayır
+            partitions = {}
+            for analysis in chunk:
+                key = (analysis.company_id, analysis.analysis_date.strftime('%Y-%m'))
+                partitions.setdefault(key, []).append(analysis)
+            
+            archived_at = datetime.utcnow()
+            for analyses in partitions.values():
+                path = _write_partition(analyses, detections)
+                files.append(path)
+                write_db.execute(
+                    update(Analysis).where(Analysis.id.in_([a.id for a in analyses])).values(
+                        detections=null(),
+                        color_analysis=null(),
+                        archived_at=archived_at,
+                        archive_path=path
+                    ).execution_options(synchronize_session=False)
+                )
+            write_db.commit()
+            
+            archived += len(chunk)
+            print(f"📦 Arşivlendi: {archived} analiz")
+        
+        return {
+            'success': True,
+            'archived': archived,
+            'files': files,
+            'cutoff': cutoff.isoformat(),
+            'elapsed': round(time.time() - start_time, 2)
+        }
+    except Exception as e:
+        write_db.rollback()
+        return {
+            'success': False,
+            'error': str(e),
+            'archived': archived,
+            'files': files
+        }
+    finally:
+        read_db.close()
+        write_db.close()
+
+
+# ============================================================================
+# OKUMA
+# ============================================================================
+
+def _read_archive_rows(path: str, analysis_ids: List[int]) -> Dict[int, dict]:
+    _, pq = _pyarrow()
+    table = pq.read_table(
+        path,
+        columns=['id', 'analysis_json', 'color_analysis', 'detections'],
+        filters=[('id', 'in', analysis_ids)]
+    )
+    return {row['id']: row for row in table.to_pylist()}
+
+
+def load_archived_payloads(analyses: list) -> Dict[int, dict]:
+    """
+    Arşivlenmiş analizlerin JSON alanlarını Parquet'ten oku
+    
+    Args:
+        analyses: archived_at/archive_path yüklenmiş Analysis nesneleri
+    
+    Returns:
+        {analysis_id: {'detections', 'color_analysis', 'detection_rows'}}
+    """
+    by_path = {}
+    for analysis in analyses:
+        if analysis.archived_at and analysis.archive_path:
+            by_path.setdefault(analysis.archive_path, []).append(analysis.id)
+    
+    payloads = {}
+    for path, analysis_ids in by_path.items():
+        if not os.path.exists(path):
+            print(f"⚠️ Arşiv dosyası bulunamadı: {path}")
+            continue
+        for analysis_id, row in _read_archive_rows(path, analysis_ids).items():
+            payloads[analysis_id] = {
+                'detections': _loads(row['analysis_json']),
+                'color_analysis': _loads(row['color_analysis']),
+                'detection_rows': row['detections'] or []
+            }
+    return payloads
+
+
+def resolve_payload(analysis: Analysis, field: str):
+    """
+    Analysis.detections / color_analysis; arşivlenmişse Parquet'ten
+    
+    Tek analiz için (detay, karşılaştırma) kullanılır; listelerde
+    load_archived_payloads ile toplu okunmalı.
+    """
+    if not analysis.archived_at:
+        return getattr(analysis, field)
+    payload = load_archived_payloads([analysis]).get(analysis.id)
+    return payload[field] if payload else None
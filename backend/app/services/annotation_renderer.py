@@ -0,0 +1,193 @@
+﻿"""
+İşaretlenmiş analiz görüntüsü (/api/analysis/{id}/annotated.jpg)
+
+Kaydedilmiş tespitler (analysis_detections) görüntünün üzerine çizilir;
+istenirse raf gözü sınırları ve göz skorları da eklenir. Görüntü önce
+istenen genişliğe küçültülür, kutular sınıf başına tek cv2.polylines
+çağrısıyla çizilir ve JPEG bir kez kodlanır.
+
+Sonuç ANNOTATION_CACHE_DIR/<analysis_id>/<seçenek özeti>.jpg olarak saklanır;
+analizler değişmediği için aynı seçeneklerle gelen sonraki istekler
+CPU harcamadan diskten döner.
+"""
+import os
+import json
+import uuid
+import hashlib
+from typing import Optional
+from sqlalchemy.orm import Session
+
+from app.models.database import Analysis, AnalysisDetection
+from app.services.analysis_archive import resolve_payload
+from app.services.derivatives import find_blob
+
+ANNOTATION_CACHE_DIR = os.getenv("ANNOTATION_CACHE_DIR", os.path.join(os.getenv("UPLOAD_DIR", "./uploads"), "annotated"))
+ANNOTATION_MAX_WIDTH = int(os.getenv("ANNOTATION_MAX_WIDTH", "1920"))
+ANNOTATION_JPEG_QUALITY = int(os.getenv("ANNOTATION_JPEG_QUALITY", "85"))
+RENDER_VERSION = 1  # Çizim değişirse artır (eski önbellek girişleri kullanılmaz)
+
+# Sınıf renkleri (BGR); sınıflar ada göre sıralanıp dağıtılır
+PALETTE = [
+    (56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+    (10, 249, 72), (23, 204, 146), (134, 219, 61), (211, 188, 0), (255, 194, 0),
+    (147, 69, 52), (255, 115, 100), (236, 24, 0), (255, 56, 132), (133, 0, 82),
+]
+EYE_COLOR = (255, 255, 255)
+
+
+def _options_key(options: dict) -> str:
+    payload = json.dumps({**options, 'version': RENDER_VERSION}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def annotation_path(analysis_id: int, options: dict) -> str:
+    return os.path.join(ANNOTATION_CACHE_DIR, str(analysis_id), f"{_options_key(options)}.jpg")
+
+
+def _load_source(db: Session, analysis: Analysis):
+    """
+    Çizim kaynağı ve koordinat çarpanı
+    
+    Tespitler çıkarım kopyası koordinatındadır (Analysis.image_scale). Kopya
+    diskteyse o okunur (12MP orijinali çözmemek için), yoksa orijinal.
+    
+    Returns:
+        (image, kayıtlı koordinat -> kaynak piksel çarpanı) veya (None, None)
+    """
+    import cv2
+    
+    scale = analysis.image_scale or 1.0
+    source_path = analysis.image_path
+    original_width = None
+    
+    blob = find_blob(db, analysis.image_path)
+    if blob is not None and scale < 1 and blob.width and blob.inference_path and os.path.exists(blob.inference_path):
+        source_path = blob.inference_path
+        original_width = blob.width
+    
+    image = cv2.imread(source_path)
+    if image is None:
+        return None, None
+    if original_width is None:
+        original_width = image.shape[1]
+    return image, image.shape[1] / original_width / scale
+
+
+def _draw_detections(image, rows, factor: float, thickness: int, labels: bool):
+    import cv2
+    import numpy as np
+    
+    by_class = {}
+    for class_name, confidence, x1, y1, x2, y2 in rows:
+        if x1 is None:
+            continue
+        by_class.setdefault(class_name, []).append((confidence, x1, y1, x2, y2))
+    
+    for index, class_name in enumerate(sorted(by_class)):
+        color = PALETTE[index % len(PALETTE)]
+        boxes = np.array([box[1:] for box in by_class[class_name]], dtype=np.float32) * factor
+        x1, y1, x2, y2 = boxes.T
+        # (n, 4, 2) köşe dizisi: sınıfın tüm kutuları tek çağrıda
+        polygons = np.stack([
+            np.stack([x1, y1], axis=1), np.stack([x2, y1], axis=1),
+            np.stack([x2, y2], axis=1), np.stack([x1, y2], axis=1)
+        ], axis=1).round().astype(np.int32)
+        cv2.polylines(image, polygons, True, color, thickness)
+        
+        if labels:
+            font_scale = 0.35 * thickness
+            for (confidence, *_), polygon in zip(by_class[class_name], polygons):
+                label = f"{class_name} {confidence:.2f}" if confidence is not None else class_name
+                x, y = polygon[0]
+                cv2.putText(image, label, (int(x), max(int(y) - 3, 10)), cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, 1, cv2.LINE_AA)
+
+
+def _draw_eyes(image, eyes: list, factor: float, thickness: int, lines: bool, scores: bool):
+    import cv2
+    
+    width = image.shape[1]
+    font_scale = 0.5 * thickness
+    for eye in eyes:
+        region = eye.get('region') or {}
+        y1 = int(round(region.get('y1', 0) * factor))
+        y2 = int(round(region.get('y2', 0) * factor))
+        if lines:
+            cv2.line(image, (0, y2 - 1), (width, y2 - 1), EYE_COLOR, thickness)
+        
+        if scores:
+            score = eye.get('hybrid_score')
+            label = f"{eye.get('eye_name', eye.get('eye_id'))}: {score:.1f}" if score is not None else str(eye.get('eye_name', ''))
+            (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+            top = y1 + 4
+            cv2.rectangle(image, (4, top), (12 + text_width, top + text_height + baseline + 6), (0, 0, 0), -1)
+            cv2.putText(image, label, (8, top + text_height + 3), cv2.FONT_HERSHEY_SIMPLEX, font_scale, EYE_COLOR, thickness, cv2.LINE_AA)
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def render_annotated(
+    db: Session,
+    analysis: Analysis,
+    max_width: int = ANNOTATION_MAX_WIDTH,
+    eyes: bool = True,
+    scores: bool = True,
+    labels: bool = False
+) -> Optional[str]:
+    """
+    İşaretlenmiş JPEG'i üret veya önbellekten döndür
+    
+    Returns:
+        JPEG dosya yolu; görüntü okunamazsa None
+    """
+    import cv2
+    
+    max_width = max(64, min(max_width or ANNOTATION_MAX_WIDTH, ANNOTATION_MAX_WIDTH))
+    options = {'max_width': max_width, 'eyes': eyes, 'scores': scores, 'labels': labels}
+    path = annotation_path(analysis.id, options)
+    if os.path.exists(path):
+        return path
+    
+    image, factor = _load_source(db, analysis)
+    if image is None:
+        return None
+    
+    # Önce küçült: çizim ve kodlama hedef boyutta yapılır
+    if image.shape[1] > max_width:
+        resize_factor = max_width / image.shape[1]
+        image = cv2.resize(image, (max_width, max(1, round(image.shape[0] * resize_factor))), interpolation=cv2.INTER_AREA)
+        factor *= resize_factor
+    thickness = max(1, round(image.shape[1] / 640))
+    
+    rows = db.query(
+        AnalysisDetection.class_name,
+        AnalysisDetection.confidence,
+        AnalysisDetection.x1,
+        AnalysisDetection.y1,
+        AnalysisDetection.x2,
+        AnalysisDetection.y2
+    ).filter(AnalysisDetection.analysis_id == analysis.id).all()
+    _draw_detections(image, rows, factor, thickness, labels)
+    
+    if eyes or scores:
+        # Göz bölgeleri yalnızca analiz JSON'unda (hibrit analizler); liste biçiminde yok
+        payload = resolve_payload(analysis, 'detections')
+        eye_list = payload.get('eyes') if isinstance(payload, dict) else None
+        if eye_list:
+            _draw_eyes(image, eye_list, factor, thickness, eyes, scores)
+    
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, ANNOTATION_JPEG_QUALITY])
+    if not ok:
+        return None
+    _write(path, encoded.tobytes())
+    return path
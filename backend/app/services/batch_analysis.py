@@ -0,0 +1,411 @@
+﻿"""
+Toplu raf analizi (/api/analysis/analyze-batch)
+
+Mağaza ziyaretinde çekilen 50-200 fotoğraf tek istekte (çoklu dosya veya
+ZIP) gelir. Görüntüler önce içerik adresli depoya alınır, ardından
+BATCH_CHUNK_SIZE'lık parçalar halinde:
+    
+    1. paylaşılan iş parçacığı havuzunda çıkarım kopyası okunur
+       (yoksa orijinalden üretilir, app.services.derivatives),
+    2. önbellekteki YOLO modeliyle tek batch çıkarımdan geçer,
+    3. ShelfAnalyzer ile paralel analiz edilir,
+    4. parça başına tek transaction'da toplu yazılır
+       (analyses + analysis_detections + günlük özet),
+
+ve her görüntü için bir NDJSON satırı üretilir. Havuz boyutu (BATCH_WORKERS)
+tüm istekler için ortaktır; eşzamanlı toplu istekler CPU'yu aşırı yüklemez.
+"""
+import os
+import json
+import time
+import asyncio
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.models.database import SessionLocal, Analysis, ImageBlob
+from app.services.blob_store import BLOB_DIR, blob_sha, store_upload, store_stream, release_blob, remove_orphan
+from app.services.derivatives import load_inference_image, record_inference_copy, schedule_derivatives
+from app.services.uploads import save_upload, MAX_UPLOAD_SIZE
+from app.services.detection_store import store_detections_bulk
+from app.services.rollups import record_analyses
+
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "200"))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "8"))  # Inference batch + DB transaction
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+BATCH_MAX_ARCHIVE_SIZE = int(os.getenv("BATCH_MAX_ARCHIVE_SIZE", 512 * 1024 * 1024))  # 512MB
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+DEFAULT_MODEL_PATH = 'yolov8n.pt'
+
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch-analysis")
+    return _executor
+
+
+# ============================================================================
+# GİRDİLER (ÇOKLU DOSYA / ZIP)
+# ============================================================================
+
+def _is_image_name(name: str) -> bool:
+    base = os.path.basename(name)
+    return bool(base) and not base.startswith('.') and os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _zip_members(archive: zipfile.ZipFile) -> list:
+    return [
+        m for m in archive.infolist()
+        if not m.is_dir() and not m.filename.startswith('__MACOSX/') and _is_image_name(m.filename)
+    ]
+
+
+def _count_zip_images(zip_path: str) -> int:
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            return len(_zip_members(archive))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid ZIP archive")
+
+
+def _ingest_zip(db: Session, zip_path: str, items: list, skipped: list):
+    with zipfile.ZipFile(zip_path) as archive:
+        for member in _zip_members(archive):
+            # Açılmış boyut sınırı (zip bombası koruması)
+            if member.file_size > MAX_UPLOAD_SIZE:
+                skipped.append({'filename': member.filename, 'error': f"File too large. Max size: {MAX_UPLOAD_SIZE} bytes"})
+                continue
+            ext = os.path.splitext(member.filename)[1].lower()
+            try:
+                with archive.open(member) as source:
+                    blob = store_stream(db, source, ext, max_size=MAX_UPLOAD_SIZE)
+            except (ValueError, zipfile.BadZipFile) as e:
+                skipped.append({'filename': member.filename, 'error': str(e)})
+                continue
+            items.append({'filename': member.filename, 'image_path': blob.path})
+
+
+def discard_ingested(db: Session, items: list):
+    """Commit edilmemiş ingest'i geri al; bu istekle depoya yeni taşınan dosyaları sil"""
+    db.rollback()
+    for item in items:
+        remove_orphan(db, item['image_path'])
+
+
+async def ingest_uploads(db: Session, files: List[UploadFile]):
+    """
+    Yüklenen dosyaları/ZIP içeriğini depoya al (commit çağıranda)
+    
+    Görüntü sayısı depoya bir şey yazılmadan önce kontrol edilir: ZIP'ler
+    önce geçici dosyaya alınıp sayılır, sınır aşılırsa 400. Depoya alma
+    sırasında hata veya istek iptali olursa alınan referanslar geri alınır.
+    
+    Returns:
+        (items, skipped): [{'filename', 'image_path'}], [{'filename', 'error'}]
+    """
+    zip_paths = {}
+    items, skipped = [], []
+    try:
+        image_count = 0
+        for index, file in enumerate(files):
+            ext = os.path.splitext(file.filename or '')[1].lower()
+            if ext == '.zip':
+                zip_paths[index] = os.path.join(BLOB_DIR, "tmp", f"batch-{time.time_ns()}.zip")
+                await save_upload(file, zip_paths[index], max_size=BATCH_MAX_ARCHIVE_SIZE)
+                image_count += await run_in_threadpool(_count_zip_images, zip_paths[index])
+            elif ext in IMAGE_EXTENSIONS:
+                image_count += 1
+        if image_count > BATCH_MAX_IMAGES:
+            raise HTTPException(status_code=400, detail=f"Too many images. Max: {BATCH_MAX_IMAGES}")
+        
+        try:
+            for index, file in enumerate(files):
+                name = file.filename or ''
+                ext = os.path.splitext(name)[1].lower()
+                
+                if ext == '.zip':
+                    await run_in_threadpool(_ingest_zip, db, zip_paths[index], items, skipped)
+                elif ext in IMAGE_EXTENSIONS:
+                    try:
+                        blob = await store_upload(db, file)
+                    except HTTPException as e:
+                        skipped.append({'filename': name, 'error': e.detail})
+                        continue
+                    items.append({'filename': name, 'image_path': blob.path})
+                else:
+                    skipped.append({'filename': name, 'error': 'Unsupported file type'})
+        except BaseException:
+            discard_ingested(db, items)
+            raise
+    finally:
+        for zip_path in zip_paths.values():
+            if os.path.exists(zip_path):
+                os.remove(zip_path)
+    
+    return items, skipped
+
+
+# ============================================================================
+# İŞLEME
+# ============================================================================
+
+def _load_model(model_path: str):
+    """Önbellekli model; şirket modeli açılamazsa varsayılana düş"""
+    from app.ai.yolo_inference import get_shared_model
+    
+    try:
+        return get_shared_model(model_path), model_path
+    except Exception as e:
+        if model_path == DEFAULT_MODEL_PATH:
+            raise
+        print(f"⚠️ Model hatası: {e}")
+        print("🔄 Varsayılan modele geçiliyor...")
+        return get_shared_model(DEFAULT_MODEL_PATH), f"{DEFAULT_MODEL_PATH} (fallback)"
+
+
+def _known_copies(db: Session, paths: list) -> dict:
+    """Parçadaki görüntülerin kayıtlı çıkarım kopyaları (tek sorgu): sha256 -> (width, height, inference_path)"""
+    shas = {blob_sha(path) for path in paths} - {None}
+    if not shas:
+        return {}
+    rows = db.query(ImageBlob.sha256, ImageBlob.width, ImageBlob.height, ImageBlob.inference_path).filter(
+        ImageBlob.sha256.in_(shas)
+    ).all()
+    return {row.sha256: (row.width, row.height, row.inference_path) for row in rows}
+
+
+def _read_image(path: str, known: tuple):
+    """(image, info) - kopya yoksa üretilir; blob satırına _save_chunk yazar"""
+    image, info = load_inference_image(path, *(known or ()))
+    if info is not None:
+        info['created'] = not known or known[2] != info['inference_path']
+    return image, info
+
+
+def _analyze(image, detections: list, eye_count: int, image_scale: float):
+    from app.ai.shelf_analyzer import ShelfAnalyzer
+    
+    analyzer = ShelfAnalyzer(image.shape, eye_count=eye_count)
+    return analyzer.analyze_shelf(detections, image, image_scale), analyzer.eyes
+
+
+def _release_paths(db: Session, paths: list):
+    """Kaydedilmeyen görüntülerin depo referanslarını bırak"""
+    orphans = [release_blob(db, path) for path in paths]
+    db.commit()
+    for path in orphans:
+        remove_orphan(db, path)
+
+
+def release_pending(pending: list):
+    """
+    Henüz kaydedilmemiş görüntülerin referanslarını bırak (tekrar çağrılabilir)
+    
+    run_batch'in finally'sinden ve yanıtın arka plan görevinden çağrılır:
+    istemci akış başlamadan bağlantıyı keserse üreteç hiç çalışmaz. Ayrı
+    session açılır; iptal anında havuzdaki bir iş run_batch'in session'ını
+    hâlâ kullanıyor olabilir.
+    """
+    paths = pending[:]
+    del pending[:]
+    if not paths:
+        return
+    db = SessionLocal()
+    try:
+        _release_paths(db, paths)
+    finally:
+        db.close()
+
+
+def _save_chunk(db: Session, results: list, failed: list, company_id: int, model_id: int, save_to_db: bool) -> list:
+    """
+    Bir parçanın sonuçlarını tek transaction'da yaz ve NDJSON satırlarını hazırla
+    
+    Analyses tek flush ile (executemany), tespitler tek INSERT ile, günlük
+    özet şirket + gün başına tek artırımla yazılır. Okunamayan veya
+    kaydedilmeyen görüntülerin depo referansı bırakılır.
+    """
+    analyses = []
+    if save_to_db and results:
+        analysis_date = datetime.utcnow()
+        for result in results:
+            summary = result['analysis']['summary']
+            analyses.append(Analysis(
+                company_id=company_id,
+                model_id=model_id,
+                image_path=result['image_path'],
+                detections=result['analysis'],
+                total_products=summary['total_products'],
+                product_counts=summary['product_counts'],
+                shelf_coverage=summary['shelf_coverage'],
+                visibility_score=summary['visibility_score'],
+                total_score=summary['total_score'],
+                planogram_score=0.0,
+                inference_time=result['inference_time'],
+                image_scale=result['inference']['scale'],
+                analysis_date=analysis_date
+            ))
+    
+    released = [item['image_path'] for item in failed]
+    if not save_to_db:
+        released += [result['image_path'] for result in results]
+    
+    try:
+        if analyses:
+            db.add_all(analyses)
+            db.flush()
+            store_detections_bulk(db, [
+                (analysis, result['detections'], result['eyes'])
+                for analysis, result in zip(analyses, results)
+            ])
+            record_analyses(db, analyses)
+            for result in results:
+                if result['inference']['created']:
+                    record_inference_copy(db, result['image_path'], result['inference'])
+        _release_paths(db, released)
+        if analyses:
+            schedule_derivatives(*[result['image_path'] for result in results])
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Veritabanı hatası: {e}")
+        analyses = []
+        for result in results:
+            result['error'] = f"Veritabanı hatası: {e}"
+        try:
+            _release_paths(db, [result['image_path'] for result in results] + [item['image_path'] for item in failed])
+        except Exception:
+            db.rollback()
+    
+    lines = []
+    for i, result in enumerate(results):
+        summary = result['analysis']['summary']
+        lines.append({
+            'index': result['index'],
+            'filename': result['filename'],
+            'success': 'error' not in result,
+            'analysis_id': analyses[i].id if analyses else None,
+            'total_products': summary['total_products'],
+            'product_counts': summary['product_counts'],
+            'shelf_coverage': summary['shelf_coverage'],
+            'visibility_score': summary['visibility_score'],
+            'total_score': summary['total_score'],
+            'inference_time': round(result['inference_time'], 3),
+            **({'error': result['error']} if 'error' in result else {})
+        })
+    for item in failed:
+        lines.append({
+            'index': item['index'],
+            'filename': item['filename'],
+            'success': False,
+            'error': item['error']
+        })
+    return sorted(lines, key=lambda line: line['index'])
+
+
+async def run_batch(
+    items: list,
+    company_id: int,
+    model_path: str,
+    model_id: int,
+    eye_count: int = 3,
+    save_to_db: bool = True,
+    skipped: list = None,
+    pending: list = None
+):
+    """
+    Görüntüleri parça parça analiz et, her görüntü için bir sonuç dict'i üret
+    
+    Kendi session'ını açar (StreamingResponse istek bittikten sonra tüketilir).
+    pending: henüz kaydedilmemiş görüntü yolları (varsayılan: tüm items); parça
+    kaydedildikçe azalır, kalanlar (model hatası, istemci bağlantıyı kesti)
+    finally'de release_pending ile bırakılır.
+    """
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    start_time = time.time()
+    processed = failed_count = 0
+    if pending is None:
+        pending = [item['image_path'] for item in items]
+    
+    db = SessionLocal()
+    try:
+        try:
+            model, model_used = await loop.run_in_executor(executor, _load_model, model_path)
+        except Exception as e:
+            yield {'event': 'error', 'error': f"Model yüklenemedi: {e}"}
+            return
+        
+        yield {'event': 'start', 'total': len(items), 'skipped': len(skipped or []), 'model_path': model_used}
+        for item in skipped or []:
+            yield {'filename': item['filename'], 'success': False, 'error': item['error']}
+        
+        for start in range(0, len(items), BATCH_CHUNK_SIZE):
+            chunk = [dict(item, index=start + i) for i, item in enumerate(items[start:start + BATCH_CHUNK_SIZE])]
+            
+            known = await loop.run_in_executor(executor, _known_copies, db, [item['image_path'] for item in chunk])
+            loaded = await asyncio.gather(*[
+                loop.run_in_executor(
+                    executor, _read_image, item['image_path'], known.get(blob_sha(item['image_path']))
+                )
+                for item in chunk
+            ])
+            readable = [(dict(item, inference=info), image) for item, (image, info) in zip(chunk, loaded) if image is not None]
+            failed = [dict(item, error="Görüntü okunamadı") for item, (image, _) in zip(chunk, loaded) if image is None]
+            
+            # Tek batch çıkarım
+            inference_start = time.time()
+            detections = await loop.run_in_executor(executor, model.predict, [image for _, image in readable])
+            
+            analyzed = await asyncio.gather(*[
+                loop.run_in_executor(executor, _analyze, image, dets, eye_count, item['inference']['scale'])
+                for (item, image), dets in zip(readable, detections)
+            ])
+            per_image_time = (time.time() - inference_start) / len(readable) if readable else 0.0
+            
+            results = [
+                {
+                    'index': item['index'],
+                    'filename': item['filename'],
+                    'image_path': item['image_path'],
+                    'inference': item['inference'],
+                    'detections': dets,
+                    'analysis': analysis_result,
+                    'eyes': eyes,
+                    'inference_time': per_image_time
+                }
+                for (item, _), dets, (analysis_result, eyes) in zip(readable, detections, analyzed)
+            ]
+            
+            # Parçanın referansları artık _save_chunk'ta (kaydedilir veya bırakılır)
+            del pending[:len(chunk)]
+            lines = await loop.run_in_executor(
+                executor, _save_chunk, db, results, failed, company_id, model_id, save_to_db
+            )
+            for line in lines:
+                processed += 1
+                failed_count += 0 if line['success'] else 1
+                yield line
+    finally:
+        db.close()
+        release_pending(pending)
+    
+    yield {
+        'event': 'done',
+        'processed': processed,
+        'failed': failed_count,
+        'elapsed': round(time.time() - start_time, 2)
+    }
+
+
+async def ndjson_lines(results):
+    """dict üreteci -> NDJSON (satır başına bir JSON)"""
+    async for result in results:
+        yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
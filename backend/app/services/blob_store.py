@@ -0,0 +1,291 @@
+﻿"""
+İçerik adresli görüntü deposu
+
+Görüntüler SHA-256 özetine göre iki seviyeli alt klasörlere yazılır:
+    
+    BLOB_DIR/ab/cd/abcd...ef.jpg
+
+Aynı içerik ikinci kez yüklendiğinde diske tekrar yazılmaz, yalnızca
+image_blobs.ref_count artırılır. Analiz ve ürün kayıtları dosya yolunu
+(ImageBlob.path) saklar; dataset klasörlerindeki linklerin referansı
+dataset_images satırlarındadır. Satır silindiğinde release_blob ile referans
+bırakılır ve kimse kullanmıyorsa dosya silinir.
+
+Referans sayaçları çağıranın transaction'ında güncellenir (commit çağıranın
+sorumluluğunda); dosya silme commit sonrasına bırakılır (remove_orphan).
+"""
+import os
+import uuid
+import shutil
+import hashlib
+from typing import Optional
+from fastapi import UploadFile
+from sqlalchemy import update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.database import ImageBlob, DatasetImage
+from app.services.uploads import save_upload
+
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(os.getenv("UPLOAD_DIR", "./uploads"), "blobs"))
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def blob_path(sha256: str, ext: str = "") -> str:
+    return os.path.join(BLOB_DIR, sha256[:2], sha256[2:4], f"{sha256}{ext}")
+
+
+def blob_sha(path: Optional[str]) -> Optional[str]:
+    """Depo içindeki bir yoldan sha256 (depo dışı / eski yollar için None)"""
+    if not path:
+        return None
+    name = os.path.splitext(os.path.basename(path))[0]
+    if len(name) != 64 or os.path.normpath(path) != os.path.normpath(blob_path(name, os.path.splitext(path)[1])):
+        return None
+    return name
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _acquire(db: Session, sha256: str, ext: str, size: int) -> ImageBlob:
+    """
+    sha256 için referans sayacını artır, kayıt yoksa oluştur
+    
+    rollups._increment ile aynı desen: önce UPDATE, satır yoksa savepoint
+    içinde INSERT; eşzamanlı aynı içerik yüklenirse UPDATE tekrarlanır.
+    """
+    statement = update(ImageBlob).where(ImageBlob.sha256 == sha256).values(
+        ref_count=ImageBlob.ref_count + 1
+    ).execution_options(synchronize_session=False)
+    
+    if not db.execute(statement).rowcount:
+        try:
+            with db.begin_nested():
+                db.add(ImageBlob(sha256=sha256, path=blob_path(sha256, ext), size=size, ref_count=1))
+        except IntegrityError:
+            db.execute(statement)
+    
+    return db.query(ImageBlob).filter(ImageBlob.sha256 == sha256).populate_existing().one()
+
+
+def store_file(db: Session, source_path: str, sha256: str = None, size: int = None, ext: str = None) -> ImageBlob:
+    """
+    Diskteki bir dosyayı depoya taşı ve bir referans al
+    
+    Kaynak dosya tüketilir: içerik depoda zaten varsa silinir, yoksa
+    os.replace ile yerine taşınır (aynı dosya sistemi).
+    
+    Returns:
+        ImageBlob (path, sha256, ref_count)
+    """
+    sha256 = sha256 or _file_sha256(source_path)
+    size = size if size is not None else os.path.getsize(source_path)
+    ext = (ext if ext is not None else os.path.splitext(source_path)[1]).lower()
+    
+    blob = _acquire(db, sha256, ext, size)
+    if os.path.exists(blob.path):
+        os.remove(source_path)
+    else:
+        os.makedirs(os.path.dirname(blob.path), exist_ok=True)
+        os.replace(source_path, blob.path)
+    return blob
+
+
+async def receive_upload(file: UploadFile, max_size: int = None) -> dict:
+    """
+    UploadFile'ı akışla BLOB_DIR/tmp altına al (özet yazarken hesaplanır)
+    
+    Depoya henüz alınmaz; özet DB'ye dokunmadan önce gerekiyorsa (ör.
+    single-flight anahtarı) store_received veya discard_upload ile devam edilir.
+    Geçici dosya depoyla aynı dosya sisteminde olduğundan taşıma atomik bir rename olur.
+    
+    Returns:
+        {'path', 'sha256', 'size', 'ext'}
+    """
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    temp_path = os.path.join(BLOB_DIR, "tmp", f"{uuid.uuid4().hex}{ext}")
+    saved = await save_upload(file, temp_path, max_size=max_size)
+    saved['ext'] = ext
+    return saved
+
+
+def discard_upload(upload: dict):
+    """Depoya alınmayacak geçici yüklemeyi sil"""
+    if os.path.exists(upload['path']):
+        os.remove(upload['path'])
+
+
+def store_received(db: Session, upload: dict) -> ImageBlob:
+    """receive_upload sonucunu depoya taşı ve bir referans al"""
+    try:
+        return store_file(db, upload['path'], upload['sha256'], upload['size'], upload['ext'])
+    except BaseException:
+        discard_upload(upload)
+        raise
+
+
+async def store_upload(db: Session, file: UploadFile, max_size: int = None) -> ImageBlob:
+    """UploadFile'ı akışla depoya yaz (receive_upload + store_received)"""
+    return store_received(db, await receive_upload(file, max_size=max_size))
+
+
+def store_stream(db: Session, source, ext: str = "", max_size: int = None) -> ImageBlob:
+    """
+    Dosya benzeri bir nesneyi (ör. ZIP üyesi) parça parça depoya yaz
+    
+    Raises:
+        ValueError: max_size aşılırsa (geçici dosya silinir)
+    """
+    os.makedirs(os.path.join(BLOB_DIR, "tmp"), exist_ok=True)
+    temp_path = os.path.join(BLOB_DIR, "tmp", f"{uuid.uuid4().hex}{ext}")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, "wb") as buffer:
+            for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+                size += len(chunk)
+                if max_size and size > max_size:
+                    raise ValueError(f"File too large. Max size: {max_size} bytes")
+                digest.update(chunk)
+                buffer.write(chunk)
+        return store_file(db, temp_path, digest.hexdigest(), size, ext)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def link_blob(blob: ImageBlob, destination: str) -> str:
+    """
+    Depodaki dosyayı başka bir klasörde göster (dataset images/ klasörü)
+    
+    Hardlink kullanılır, disk alanı harcanmaz; desteklenmiyorsa kopyalanır.
+    Linkler salt okunur kabul edilmeli: yerinde yazma depodaki içeriği bozar.
+    Referans sahipliğini kaydetmez; dataset'ler attach_dataset_image kullanır.
+    """
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(blob.path, destination)
+    except OSError:
+        shutil.copyfile(blob.path, destination)
+    return destination
+
+
+def attach_dataset_image(db: Session, dataset_id: int, blob: ImageBlob, destination: str) -> Optional[str]:
+    """
+    Blob'u dataset klasörüne linkle; alınan referansın sahibi dataset_images satırı
+    
+    Aynı yolda önceki bir görüntü varsa onun referansı bırakılır ve satır
+    yeni blob'a geçer (commit çağıranın sorumluluğunda).
+    
+    Returns:
+        Commit sonrası remove_orphan'a verilecek yol (üzerine yazılan görüntü
+        artık kullanılmıyorsa), yoksa None
+    """
+    image = db.query(DatasetImage).filter(
+        DatasetImage.dataset_id == dataset_id,
+        DatasetImage.path == destination
+    ).first()
+    
+    orphan = None
+    if image is None:
+        db.add(DatasetImage(dataset_id=dataset_id, path=destination, blob_path=blob.path))
+    else:
+        orphan = release_blob(db, image.blob_path)
+        image.blob_path = blob.path
+    db.flush()
+    
+    link_blob(blob, destination)
+    return orphan
+
+
+async def store_dataset_upload(db: Session, dataset_id: int, file: UploadFile, destination: str, max_size: int = None):
+    """
+    UploadFile'ı depoya al ve dataset klasörüne bağla (tek savepoint)
+    
+    Link veya kayıt başarısız olursa alınan referans geri alınır ve bu
+    yüklemeyle depoya yeni taşınan dosya silinir; sahipsiz referans kalmaz.
+    
+    Returns:
+        (ImageBlob, commit sonrası remove_orphan'a verilecek yol veya None)
+    """
+    blob = None
+    try:
+        with db.begin_nested():
+            blob = await store_upload(db, file, max_size=max_size)
+            orphan = attach_dataset_image(db, dataset_id, blob, destination)
+    except BaseException:
+        if blob is not None:
+            remove_orphan(db, blob.path)
+        raise
+    return blob, orphan
+
+
+def release_dataset_images(db: Session, dataset_id: int) -> list:
+    """
+    Dataset'in tüm görüntü referanslarını bırak ve satırlarını sil
+    
+    Returns:
+        Commit sonrası remove_orphan'a verilecek yollar: dataset klasöründeki
+        linkler ve artık kullanılmayan depo dosyaları
+    """
+    images = db.query(DatasetImage).filter(DatasetImage.dataset_id == dataset_id).all()
+    paths = [image.path for image in images]
+    for image in images:
+        orphan = release_blob(db, image.blob_path)
+        if orphan:
+            paths.append(orphan)
+    
+    db.query(DatasetImage).filter(DatasetImage.dataset_id == dataset_id).delete(synchronize_session=False)
+    return paths
+
+
+def release_blob(db: Session, path: str) -> Optional[str]:
+    """
+    Referansı bırak (commit çağıranın sorumluluğunda)
+    
+    Returns:
+        Commit sonrası remove_orphan'a verilecek yol: depo dosyası artık
+        kullanılmıyorsa veya depo öncesi (tek sahipli) eski bir dosyaysa.
+        Depo dosyası hâlâ kullanılıyorsa None.
+    """
+    sha256 = blob_sha(path)
+    if not sha256:
+        return path
+    
+    db.execute(update(ImageBlob).where(
+        ImageBlob.sha256 == sha256,
+        ImageBlob.ref_count > 0
+    ).values(ref_count=ImageBlob.ref_count - 1).execution_options(synchronize_session=False))
+    
+    deleted = db.execute(delete(ImageBlob).where(
+        ImageBlob.sha256 == sha256,
+        ImageBlob.ref_count <= 0
+    ).execution_options(synchronize_session=False)).rowcount
+    return path if deleted else None
+
+
+def remove_orphan(db: Session, path: Optional[str]):
+    """release_blob'un döndürdüğü dosyayı commit sonrası sil"""
+    if not path:
+        return
+    # Arada aynı içerik yeniden yüklendiyse dosya tekrar kullanılıyordur
+    sha256 = blob_sha(path)
+    if sha256 and db.query(ImageBlob.id).filter(ImageBlob.sha256 == sha256).first():
+        return
+    if os.path.exists(path):
+        os.remove(path)
+    if sha256 and os.path.isdir(os.path.dirname(path)):
+        # Yanındaki türevler (<sha256>.thumb.jpg vb., app.services.derivatives)
+        directory = os.path.dirname(path)
+        for name in os.listdir(directory):
+            if name.startswith(f"{sha256}."):
+                os.remove(os.path.join(directory, name))
@@ -0,0 +1,64 @@
+﻿import time
+import threading
+
+from app.services.redis_client import get_redis, reset_redis
+
+# Redis yoksa süreç içi sayaçlar
+_local_versions = {}
+# Redis'ten okunan son değerler: {scope: (version, okunma zamanı)}
+_seen_versions = {}
+_lock = threading.Lock()
+
+
+def _key(scope: str) -> str:
+    return f"retail_shelf_ai:version:{scope}"
+
+
+def get_version(scope: str, max_age: float = 0) -> int:
+    """
+    Bir kaynağın (ör. "products:1") güncel versiyon numarası
+    
+    Versiyonlar Redis'te tutulur; böylece API ve Celery worker süreçleri
+    aynı sayacı görür. max_age > 0 ise Redis'ten okunan değer o kadar
+    saniye süreç içinde yeniden kullanılır (sıcak yollar için).
+    """
+    if max_age > 0:
+        with _lock:
+            seen = _seen_versions.get(scope)
+        if seen is not None and time.monotonic() - seen[1] < max_age:
+            return seen[0]
+    
+    client = get_redis()
+    if client is not None:
+        try:
+            value = client.get(_key(scope))
+            version = int(value) if value is not None else 0
+            with _lock:
+                _seen_versions[scope] = (version, time.monotonic())
+            return version
+        except Exception as e:
+            print(f"⚠️ Versiyon okunamadı ({scope}): {e}")
+            reset_redis()
+    
+    with _lock:
+        return _local_versions.get(scope, 0)
+
+
+def bump_version(scope: str) -> int:
+    """Increment the version of a scope, invalidating every cache keyed on it"""
+    with _lock:
+        _local_versions[scope] = _local_versions.get(scope, 0) + 1
+        local_version = _local_versions[scope]
+    
+    client = get_redis()
+    if client is not None:
+        try:
+            version = int(client.incr(_key(scope)))
+            with _lock:
+                _seen_versions[scope] = (version, time.monotonic())
+            return version
+        except Exception as e:
+            print(f"⚠️ Versiyon güncellenemedi ({scope}): {e}")
+            reset_redis()
+    
+    return local_version
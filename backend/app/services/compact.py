@@ -0,0 +1,133 @@
+﻿"""
+Kompakt yanıtlar
+
+Yoğun raflarda analiz yanıtları yüzlerce KB olur ve FastAPI'nin varsayılan
+yolu (jsonable_encoder + json.dumps) profilde görünür. Bu modül:
+    
+    - FastJSONResponse: orjson ile serileştirme (yüklü değilse json.dumps,
+      boşluksuz ayraçlarla); numpy sayıları/dizileri doğrudan yazılır
+    - select_fields: ?fields=analysis_id,analysis.summary,analysis.eyes.eye_id
+      ile nokta yollu alan seçimi (listelerde her elemana uygulanır)
+    - CompressionMiddleware: Accept-Encoding'e göre brotli (brotli-asgi
+      yüklüyse) veya gzip; akış (SSE/NDJSON) ve görüntü yanıtları sıkıştırılmaz
+
+Tespitlerin paketlenmiş dizi biçimi app.services.detection_store'dadır.
+"""
+import os
+import json
+from typing import Any, Optional
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    import orjson
+except ImportError:  # requirements'ta var; yoksa standart json
+    orjson = None
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # Bu boyutun altı sıkıştırılmaz
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))  # 9 yerine: büyük JSON'da CPU/boyut dengesi
+
+# Akış veya zaten sıkıştırılmış içerik dönen yollar
+UNCOMPRESSED_PATH_PREFIXES = ('/api/events', '/api/images', '/api/analysis/analyze-batch')
+UNCOMPRESSED_PATH_SUFFIXES = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def _default(value):
+    """json.dumps yedeği: numpy ve diğer tipler"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def dumps(data: Any) -> bytes:
+    """JSON -> UTF-8 bayt (orjson varsa)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # orjson'ın desteklemediği tip (ör. 64 bitten büyük int)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """orjson ile serileştiren JSONResponse (dict'i doğrudan döndüren endpoint'ler için)"""
+    
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# ============================================================================
+# ALAN SEÇİMİ (?fields=)
+# ============================================================================
+
+def parse_fields(fields: Optional[str]) -> Optional[dict]:
+    """'a,b.c,b.d' -> {'a': True, 'b': {'c': True, 'd': True}} (boşsa None)"""
+    if not fields:
+        return None
+    tree = {}
+    for path in fields.split(','):
+        parts = [part.strip() for part in path.split('.') if part.strip()]
+        if not parts:
+            continue
+        node = tree
+        for part in parts[:-1]:
+            child = node.get(part)
+            if child is True:
+                break  # Üst alan zaten tamamen seçili
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = True
+    if not tree:
+        raise HTTPException(status_code=400, detail="fields must list at least one field")
+    return tree
+
+
+def select_fields(data: Any, tree: Optional[dict]) -> Any:
+    """Ağaçtaki alanları tut; listelerde her elemana uygulanır, olmayan alan atlanır"""
+    if tree is None or tree is True:
+        return data
+    if isinstance(data, list):
+        return [select_fields(item, tree) for item in data]
+    if not isinstance(data, dict):
+        return data
+    return {key: select_fields(data[key], subtree) for key, subtree in tree.items() if key in data}
+
+
+# ============================================================================
+# SIKIŞTIRMA
+# ============================================================================
+
+class CompressionMiddleware:
+    """
+    brotli (varsa) / gzip içerik müzakeresi
+    
+    GZipMiddleware akış yanıtlarını parça parça tamponlar; SSE ve NDJSON
+    olayları gecikmesin diye bu yollar ve Accept: text/event-stream istekleri
+    olduğu gibi geçirilir.
+    """
+    
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=GZIP_LEVEL)
+        self.brotli = BrotliMiddleware(app, minimum_size=minimum_size) if BrotliMiddleware is not None else None
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(UNCOMPRESSED_PATH_PREFIXES) \
+                or scope["path"].endswith(UNCOMPRESSED_PATH_SUFFIXES):
+            await self.app(scope, receive, send)
+            return
+        
+        headers = Headers(scope=scope)
+        if "text/event-stream" in headers.get("accept", ""):
+            await self.app(scope, receive, send)
+        elif self.brotli is not None and "br" in headers.get("accept-encoding", ""):
+            await self.brotli(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
@@ -0,0 +1,78 @@
+﻿"""
+Silinen dataset'lerin görüntü temizliği
+
+DELETE /api/datasets/{id} yalnızca is_active=False işaretler; kayıt, dataset
+klasöründeki linkler ve blob referansları yerinde kalır (geri alınabilir,
+eğitilmiş modeller dataset_id ile kayda bağlı kalır). Bekleme süresini
+(DATASET_PURGE_DAYS) aşan silinmiş dataset'lerin dataset_images satırları
+burada release_dataset_images ile bırakılır, kullanılmayan dosyalar commit
+sonrası silinir ve kayıt "purged" olarak işaretlenir.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import or_
+
+from app.models.database import SessionLocal, Dataset
+from app.services.blob_store import release_dataset_images, remove_orphan
+
+DATASET_PURGE_DAYS = int(os.getenv("DATASET_PURGE_DAYS", "7"))
+
+
+def purge_deleted_datasets(company_id: Optional[int] = None, older_than_days: Optional[int] = None) -> dict:
+    """
+    Bekleme süresini aşan silinmiş dataset'lerin görüntülerini bırak
+    
+    Her dataset ayrı commit edilir; yarıda kesilirse kalanlar bir sonraki
+    çalışmada tekrar seçilir.
+    """
+    older_than_days = older_than_days if older_than_days is not None else DATASET_PURGE_DAYS
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    
+    start_time = time.time()
+    db = SessionLocal()
+    purged = []
+    removed = 0
+    
+    try:
+        query = db.query(Dataset).filter(
+            Dataset.is_active == False,
+            or_(Dataset.status.is_(None), Dataset.status != "purged"),
+            Dataset.updated_at <= cutoff
+        )
+        if company_id is not None:
+            query = query.filter(Dataset.company_id == company_id)
+        
+        for dataset in query.order_by(Dataset.id).all():
+            paths = release_dataset_images(db, dataset.id)
+            dataset.total_images = 0
+            dataset.annotated_images = 0
+            dataset.train_images = 0
+            dataset.val_images = 0
+            dataset.status = "purged"
+            db.commit()
+            
+            for path in paths:
+                remove_orphan(db, path)
+            purged.append(dataset.id)
+            removed += len(paths)
+            print(f"🧹 Dataset temizlendi: {dataset.id} ({len(paths)} dosya)")
+        
+        return {
+            'success': True,
+            'purged': purged,
+            'removed_files': removed,
+            'cutoff': cutoff.isoformat(),
+            'elapsed': round(time.time() - start_time, 2)
+        }
+    except Exception as e:
+        db.rollback()
+        return {
+            'success': False,
+            'error': str(e),
+            'purged': purged,
+            'removed_files': removed
+        }
+    finally:
+        db.close()
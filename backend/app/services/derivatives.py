@@ -0,0 +1,266 @@
+﻿"""
+Yükleme anında üretilen görüntü türevleri
+
+Depoya alınan her görüntü için blob dosyasının yanına üç türev yazılır:
+    
+    <sha256>.thumb.jpg      galeri küçük resmi (uzun kenar THUMBNAIL_SIZE)
+    <sha256>.infer.jpg      çıkarım kopyası (uzun kenar INFERENCE_LONG_EDGE)
+    <sha256>.preview.webp   önizleme (uzun kenar PREVIEW_LONG_EDGE, WebP)
+
+Çıkarım kopyası analiz yolunda gerektiğinde senkron üretilir; küçük resim
+ve önizleme commit sonrası paylaşılan iş parçacığı havuzunda (DERIVATIVE_WORKERS)
+üretilip image_blobs satırına yazılır. Türev yolları sha256'dan türetildiği
+için aynı içerik için tekrar üretilmez. Orijinali zaten uzun kenar sınırının
+altında olan görüntülerde çıkarım kopyası orijinalin kendisidir.
+
+Çıkarım kopyasında bulunan bbox koordinatları orijinale
+Analysis.image_scale ile çevrilir: orijinal = koordinat / image_scale.
+"""
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.models.database import SessionLocal, ImageBlob
+from app.services.blob_store import blob_path, blob_sha
+
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+INFERENCE_LONG_EDGE = int(os.getenv("INFERENCE_LONG_EDGE", "1280"))
+PREVIEW_LONG_EDGE = int(os.getenv("PREVIEW_LONG_EDGE", "1024"))
+DERIVATIVE_WORKERS = int(os.getenv("DERIVATIVE_WORKERS", "2"))
+
+# tür -> (dosya soneki, uzun kenar, kodlama kalitesi)
+DERIVATIVE_SPECS = {
+    'thumbnail': ('.thumb.jpg', THUMBNAIL_SIZE, 80),
+    'inference': ('.infer.jpg', INFERENCE_LONG_EDGE, 92),
+    'preview': ('.preview.webp', PREVIEW_LONG_EDGE, 80),
+}
+
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DERIVATIVE_WORKERS, thread_name_prefix="derivatives")
+    return _executor
+
+
+def derivative_path(sha256: str, kind: str) -> str:
+    return blob_path(sha256, DERIVATIVE_SPECS[kind][0])
+
+
+def _scaled_size(width: int, height: int, long_edge: int):
+    """En-boy oranı korunarak uzun kenarı long_edge'e indir (büyütme yok)"""
+    factor = long_edge / max(width, height)
+    if factor >= 1:
+        return width, height
+    return max(1, round(width * factor)), max(1, round(height * factor))
+
+
+def _resize(image, long_edge: int):
+    import cv2
+    
+    height, width = image.shape[:2]
+    size = _scaled_size(width, height, long_edge)
+    if size == (width, height):
+        return image
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def _write(path: str, image, kind: str):
+    """Geçici dosyaya kodla, os.replace ile yerine koy (yarım dosya kalmaz)"""
+    import cv2
+    
+    ext = os.path.splitext(path)[1]
+    quality_flag = cv2.IMWRITE_WEBP_QUALITY if ext == '.webp' else cv2.IMWRITE_JPEG_QUALITY
+    ok, encoded = cv2.imencode(ext, image, [quality_flag, DERIVATIVE_SPECS[kind][2]])
+    if not ok:
+        raise ValueError(f"Görüntü kodlanamadı: {path}")
+    temp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(encoded.tobytes())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _inference_info(sha256: str, original, source_path: str) -> dict:
+    """Çıkarım kopyasını (gerekirse) yaz; (görüntü, bilgi) döndür"""
+    height, width = original.shape[:2]
+    image = _resize(original, INFERENCE_LONG_EDGE)
+    path = source_path
+    if image is not original:
+        path = derivative_path(sha256, 'inference')
+        if not os.path.exists(path):
+            _write(path, image, 'inference')
+    return image, {
+        'width': width,
+        'height': height,
+        'inference_path': path,
+        'scale': image.shape[1] / width
+    }
+
+
+def load_inference_image(image_path: str, width: int = None, height: int = None, inference_path: str = None):
+    """
+    Analiz için önceden boyutlandırılmış kopyayı oku, yoksa üret
+    
+    Args:
+        image_path: Orijinal (depo) yolu
+        width, height, inference_path: image_blobs satırında kayıtlıysa
+    
+    Returns:
+        (image, info): info = {'width', 'height', 'inference_path', 'scale'};
+        görüntü okunamazsa (None, None). Depo dışı eski dosyalar bellekte
+        küçültülür, diske kopya yazılmaz.
+    """
+    import cv2
+    
+    if width and height and inference_path and os.path.exists(inference_path):
+        image = cv2.imread(inference_path)
+        if image is not None:
+            return image, {
+                'width': width,
+                'height': height,
+                'inference_path': inference_path,
+                'scale': image.shape[1] / width
+            }
+    
+    original = cv2.imread(image_path)
+    if original is None:
+        return None, None
+    
+    sha256 = blob_sha(image_path)
+    if not sha256:
+        image = _resize(original, INFERENCE_LONG_EDGE)
+        return image, {
+            'width': original.shape[1],
+            'height': original.shape[0],
+            'inference_path': None,
+            'scale': image.shape[1] / original.shape[1]
+        }
+    return _inference_info(sha256, original, image_path)
+
+
+def find_blob(db: Session, image_path: str) -> Optional[ImageBlob]:
+    sha256 = blob_sha(image_path)
+    if not sha256:
+        return None
+    return db.query(ImageBlob).filter(ImageBlob.sha256 == sha256).first()
+
+
+def record_inference_copy(db: Session, image_path: str, info: dict):
+    """Çıkarım kopyasını blob satırına yaz (commit çağıranda)"""
+    sha256 = blob_sha(image_path)
+    if not sha256 or not info or not info['inference_path']:
+        return
+    db.execute(update(ImageBlob).where(ImageBlob.sha256 == sha256).values(
+        width=info['width'],
+        height=info['height'],
+        inference_path=info['inference_path']
+    ).execution_options(synchronize_session=False))
+
+
+def prepare_inference_image(db: Session, image_path: str):
+    """
+    Tek görüntülük analiz yolu: kopyayı yükle/üret ve blob satırına işle
+    
+    Returns:
+        (image, scale) - görüntü okunamazsa (None, 1.0)
+    """
+    blob = find_blob(db, image_path)
+    image, info = load_inference_image(
+        image_path,
+        blob.width if blob else None,
+        blob.height if blob else None,
+        blob.inference_path if blob else None
+    )
+    if image is None:
+        return None, 1.0
+    if blob is not None and blob.inference_path != info['inference_path']:
+        record_inference_copy(db, image_path, info)
+    return image, info['scale']
+
+
+def build_derivatives(blob: ImageBlob, kinds=tuple(DERIVATIVE_SPECS)) -> dict:
+    """
+    Eksik türevleri üret ve blob satırına işle (commit çağıranda)
+    
+    Küçük resim ve önizleme, varsa çıkarım kopyasından üretilir (12MP
+    orijinali tekrar çözmemek için; önizleme uzun kenarı ondan küçüktür).
+    
+    Returns:
+        {'thumbnail': yol, 'inference': yol, 'preview': yol} (üretilenler)
+    """
+    values = {}
+    source = None
+    if 'inference' in kinds and not (blob.inference_path and os.path.exists(blob.inference_path)):
+        image, info = load_inference_image(blob.path)
+        if image is None:
+            return {}
+        source = image
+        values.update(width=info['width'], height=info['height'], inference_path=info['inference_path'])
+    
+    for kind in kinds:
+        if kind == 'inference':
+            continue
+        path = derivative_path(blob.sha256, kind)
+        if not os.path.exists(path):
+            if source is None:
+                import cv2
+                
+                use_copy = blob.inference_path and os.path.exists(blob.inference_path) \
+                    and DERIVATIVE_SPECS[kind][1] <= INFERENCE_LONG_EDGE
+                source = cv2.imread(blob.inference_path if use_copy else blob.path)
+                if source is None:
+                    return {}
+                if not use_copy:
+                    # Orijinal okundu; boyutu henüz kayıtlı olmayabilir
+                    values.update(width=source.shape[1], height=source.shape[0])
+            _write(path, _resize(source, DERIVATIVE_SPECS[kind][1]), kind)
+        values[f"{kind}_path"] = path
+    
+    for key, value in values.items():
+        setattr(blob, key, value)
+    return {
+        kind: getattr(blob, f"{kind}_path")
+        for kind in DERIVATIVE_SPECS
+        if getattr(blob, f"{kind}_path")
+    }
+
+
+def _derive_job(sha256: str):
+    db = SessionLocal()
+    try:
+        blob = db.query(ImageBlob).filter(ImageBlob.sha256 == sha256).first()
+        if blob is None or not os.path.exists(blob.path):
+            return  # Arada silindi
+        build_derivatives(blob)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Türev üretilemedi ({sha256[:12]}): {e}")
+    finally:
+        db.close()
+
+
+def submit_background(fn, *args):
+    """Kısa bir arka plan işini aynı sınırlı havuza gönder (ör. istek dışı DB yazmaları)"""
+    return _get_executor().submit(fn, *args)
+
+
+def schedule_derivatives(*image_paths: str):
+    """
+    Türev üretimini arka plan havuzuna gönder (blob satırı commit edildikten sonra)
+    
+    Depo dışı yollar yok sayılır; hata yükleme isteğini etkilemez.
+    """
+    executor = _get_executor()
+    for sha256 in {blob_sha(path) for path in image_paths} - {None}:
+        executor.submit(_derive_job, sha256)
@@ -0,0 +1,222 @@
+﻿"""
+Normalize tespit tablosu (analysis_detections)
+
+Analiz kaydedilirken tespitler tek bir toplu INSERT (executemany) ile
+yazılır; ürün/raf/gün bazlı toplamalar SQL'de yapılır.
+"""
+from datetime import datetime
+from typing import Optional, List
+from sqlalchemy import insert, func, cast, Date
+from sqlalchemy.orm import Session
+
+from app.models.database import Analysis, AnalysisDetection
+
+# summarize_detections için gruplama seçenekleri
+GROUP_BY_OPTIONS = ('class', 'day', 'shelf', 'eye')
+
+# Paketlenmiş biçimde satır başına değerler (class = classes listesindeki sıra)
+PACKED_COLUMNS = ('class', 'confidence', 'x1', 'y1', 'x2', 'y2', 'eye_id')
+
+
+def _bbox_ints(det: dict):
+    """bbox (dict veya [x1, y1, x2, y2]) -> int tuple"""
+    bbox = det.get('bbox')
+    if isinstance(bbox, dict):
+        return tuple(int(bbox.get(k, 0)) for k in ('x1', 'y1', 'x2', 'y2'))
+    if isinstance(bbox, (list, tuple)) and len(bbox) >= 4:
+        return tuple(int(v) for v in bbox[:4])
+    return None, None, None, None
+
+
+def _eye_id(y_center, eyes: Optional[list]):
+    if y_center is None or not eyes:
+        return None
+    for eye in eyes:
+        if eye['region']['y1'] <= y_center < eye['region']['y2']:
+            return eye['id']
+    return None
+
+
+def _iter_detections(detections: list, eyes: Optional[list] = None):
+    """Tespitler -> (eye_id, class_name, confidence, x1, y1, x2, y2)"""
+    for det in detections:
+        class_name = det.get('class') or det.get('class_name')
+        if not class_name:
+            continue
+        
+        x1, y1, x2, y2 = _bbox_ints(det)
+        y_center = det.get('y')
+        if y_center is None and y1 is not None:
+            y_center = (y1 + y2) // 2
+        
+        confidence = float(det['confidence']) if det.get('confidence') is not None else None
+        yield _eye_id(y_center, eyes), str(class_name)[:255], confidence, x1, y1, x2, y2
+
+
+def detection_rows(analysis: Analysis, detections: list, eyes: Optional[list] = None) -> List[dict]:
+    """
+    Tespit listesi -> analysis_detections satırları
+    
+    Args:
+        analysis: Flush edilmiş Analysis (id, company_id, analysis_date dolu)
+        detections: YOLO tespitleri ('class' veya 'class_name', bbox dict/list)
+        eyes: ShelfAnalyzer.eyes (göz ataması için, opsiyonel)
+    """
+    analysis_date = analysis.analysis_date or datetime.utcnow()
+    return [
+        {
+            'analysis_id': analysis.id,
+            'company_id': analysis.company_id,
+            'shelf_id': analysis.shelf_id,
+            'analysis_date': analysis_date,
+            'eye_id': eye_id,
+            'class_name': class_name,
+            'confidence': confidence,
+            'x1': x1,
+            'y1': y1,
+            'x2': x2,
+            'y2': y2
+        }
+        for eye_id, class_name, confidence, x1, y1, x2, y2 in _iter_detections(detections, eyes)
+    ]
+
+
+def store_detections(db: Session, analysis: Analysis, detections: list, eyes: Optional[list] = None) -> int:
+    """
+    Tespitleri tek bir toplu INSERT ile yaz (commit çağıranın sorumluluğunda)
+    
+    Returns:
+        Yazılan satır sayısı
+    """
+    rows = detection_rows(analysis, detections or [], eyes)
+    if rows:
+        db.execute(insert(AnalysisDetection), rows)
+    return len(rows)
+
+
+def store_detections_bulk(db: Session, items: list) -> int:
+    """
+    Birden fazla analizin tespitlerini tek INSERT ile yaz (toplu analiz)
+    
+    Args:
+        items: [(analysis, detections, eyes), ...]
+    """
+    rows = []
+    for analysis, detections, eyes in items:
+        rows.extend(detection_rows(analysis, detections or [], eyes))
+    if rows:
+        db.execute(insert(AnalysisDetection), rows)
+    return len(rows)
+
+
+def pack_detections(rows) -> dict:
+    """
+    (eye_id, class_name, confidence, x1, y1, x2, y2) satırları -> paketlenmiş dizi
+    
+    Sınıf adları bir kez yazılır, tespitler tek düz dizide sıralanır
+    (satır başına len(columns) değer). Nesne listesine göre birkaç kat küçük
+    ve istemcide de tipli diziye doğrudan okunur:
+        
+        {"columns": [...], "classes": ["cola"], "count": 2,
+         "data": [0, 0.913, 40, 40, 60, 60, 1, 0, 0.88, ...]}
+    """
+    classes = {}
+    data = []
+    for eye_id, class_name, confidence, x1, y1, x2, y2 in rows:
+        class_index = classes.setdefault(class_name, len(classes))
+        data.extend((
+            class_index,
+            round(confidence, 3) if confidence is not None else None,
+            x1, y1, x2, y2,
+            eye_id
+        ))
+    return {
+        'columns': list(PACKED_COLUMNS),
+        'classes': list(classes),
+        'count': len(data) // len(PACKED_COLUMNS),
+        'data': data
+    }
+
+
+def pack_detection_list(detections: list, eyes: Optional[list] = None) -> dict:
+    """Bellekteki tespitleri (henüz/hiç kaydedilmemiş) paketle"""
+    return pack_detections(_iter_detections(detections or [], eyes))
+
+
+def load_packed_detections(db: Session, analysis_id: int) -> dict:
+    """Kaydedilmiş analizin tespitlerini analysis_detections'tan paketle (JSON ayrıştırma yok)"""
+    rows = db.query(
+        AnalysisDetection.eye_id,
+        AnalysisDetection.class_name,
+        AnalysisDetection.confidence,
+        AnalysisDetection.x1,
+        AnalysisDetection.y1,
+        AnalysisDetection.x2,
+        AnalysisDetection.y2
+    ).filter(AnalysisDetection.analysis_id == analysis_id).order_by(AnalysisDetection.id).all()
+    return pack_detections(rows)
+
+
+def _day_expression(db: Session):
+    # SQLite'ta CAST(... AS DATE) yılı döndürür
+    if db.get_bind().dialect.name == 'sqlite':
+        return func.date(AnalysisDetection.analysis_date)
+    return cast(AnalysisDetection.analysis_date, Date)
+
+
+def summarize_detections(
+    db: Session,
+    company_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    class_name: Optional[str] = None,
+    shelf_id: Optional[str] = None,
+    group_by: str = 'class',
+    limit: int = 1000
+) -> List[dict]:
+    """
+    Tespit toplamları (yüz sayısı, analiz sayısı, ortalama güven)
+    
+    (company_id, class_name, analysis_date) index'i üzerinden SQL'de
+    gruplanır; JSON okunmaz.
+    """
+    if group_by not in GROUP_BY_OPTIONS:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUP_BY_OPTIONS)}")
+    
+    key = {
+        'class': AnalysisDetection.class_name,
+        'day': _day_expression(db),
+        'shelf': AnalysisDetection.shelf_id,
+        'eye': AnalysisDetection.eye_id
+    }[group_by]
+    
+    facings = func.count(AnalysisDetection.id)
+    query = db.query(
+        key.label('key'),
+        facings.label('facings'),
+        func.count(func.distinct(AnalysisDetection.analysis_id)).label('analyses'),
+        func.avg(AnalysisDetection.confidence).label('avg_confidence')
+    ).filter(AnalysisDetection.company_id == company_id)
+    
+    if class_name:
+        query = query.filter(AnalysisDetection.class_name == class_name)
+    if shelf_id:
+        query = query.filter(AnalysisDetection.shelf_id == shelf_id)
+    if since:
+        query = query.filter(AnalysisDetection.analysis_date >= since)
+    if until:
+        query = query.filter(AnalysisDetection.analysis_date < until)
+    
+    query = query.group_by(key)
+    query = query.order_by(key) if group_by == 'day' else query.order_by(facings.desc())
+    
+    return [
+        {
+            group_by: str(row.key) if group_by == 'day' else row.key,
+            'facings': row.facings,
+            'analyses': row.analyses,
+            'avg_facings_per_analysis': round(row.facings / row.analyses, 2) if row.analyses else 0,
+            'avg_confidence': round(float(row.avg_confidence), 4) if row.avg_confidence is not None else None
+        }
+        for row in query.limit(limit).all()
+    ]
@@ -0,0 +1,72 @@
+﻿import json
+import base64
+from datetime import datetime
+from fastapi import HTTPException, Response
+from sqlalchemy import or_, and_
+
+# Sonraki sayfanın cursor'ı bu header ile döner (liste gövdesi değişmez)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    """(tarih, id) -> opak cursor"""
+    payload = json.dumps([sort_value.isoformat() if sort_value else None, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """Opak cursor -> (tarih, id); bozuksa 400"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(sort_value) if sort_value else None), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(query, sort_column, id_column, limit: int, cursor: str = None, response: Response = None):
+    """
+    (sort_column DESC, id DESC) üzerinde keyset sayfalama
+    
+    OFFSET yerine son satırın (tarih, id) değerinden devam edilir; böylece
+    sayfa derinliğinden bağımsız olarak composite index üzerinde seek yapılır.
+    Bir sonraki sayfa varsa cursor X-Next-Cursor header'ına yazılır.
+    
+    sort_column NULL olan satırlar en sonda (id DESC) gelir: MSSQL ve SQLite'ta
+    DESC sıralamanın varsayılanı, PostgreSQL'de NULLS LAST ile.
+    
+    Returns:
+        (rows, next_cursor)
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        if sort_value is None:
+            # NULL bölümündeyiz: yalnızca kalan NULL satırlar
+            query = query.filter(and_(sort_column.is_(None), id_column < row_id))
+        else:
+            query = query.filter(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < row_id),
+                sort_column.is_(None)
+            ))
+    
+    sort_order = sort_column.desc()
+    if query.session.get_bind().dialect.name == "postgresql":
+        sort_order = sort_order.nulls_last()
+    
+    # Bir fazla satır: sonraki sayfa var mı?
+    rows = query.order_by(sort_order, id_column.desc()).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    
+    if response is not None and next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    
+    return rows, next_cursor
@@ -0,0 +1,249 @@
+﻿import threading
+from sqlalchemy.orm import Session
+
+from app.models.database import SessionLocal, Product
+from app.services.cache_versions import get_version, bump_version
+from app.services.derivatives import submit_background
+
+
+class ProductCatalog:
+    """
+    Bir şirketin ürün metadatası, sınıf adına (Product.name) göre indeksli
+    
+    Analiz sırasında her tespit için veritabanına gitmek yerine tek
+    sorguyla yüklenir.
+    """
+    
+    def __init__(self, company_id: int, version: int, products: list):
+        self.company_id = company_id
+        self.version = version
+        self.by_name = {}
+        for product in products:
+            # Aynı isimde birden fazla ürün varsa ilki (eski davranış: .first())
+            self.by_name.setdefault(product['name'], product)
+        self._palette = None
+        self._palette_lock = threading.Lock()
+    
+    def get(self, class_name: str):
+        return self.by_name.get(class_name)
+    
+    def __len__(self):
+        return len(self.by_name)
+    
+    @property
+    def reference_colors(self) -> dict:
+        """{class_name: reference_colors} (yalnızca rengi tanımlı ürünler)"""
+        return {
+            name: product['reference_colors']
+            for name, product in self.by_name.items()
+            if product['reference_colors']
+        }
+    
+    @property
+    def palette(self):
+        """CIELAB referans paleti, katalog versiyonu başına bir kez hesaplanır"""
+        if self._palette is None:
+            from app.ai.color_analyzer import ReferencePalette
+            
+            with self._palette_lock:
+                if self._palette is None:
+                    self._palette = ReferencePalette(self.reference_colors)
+        return self._palette
+
+
+# {company_id: ProductCatalog}
+_catalogs = {}
+_lock = threading.Lock()
+
+
+def _scope(company_id: int) -> str:
+    return f"products:{company_id}"
+
+
+def _load_catalog(db: Session, company_id: int, version: int) -> ProductCatalog:
+    rows = db.query(
+        Product.id,
+        Product.name,
+        Product.sku,
+        Product.package_type,
+        Product.reference_colors,
+        Product.dimensions
+    ).filter(
+        Product.company_id == company_id
+    ).order_by(Product.id).all()
+    
+    products = [
+        {
+            'id': row.id,
+            'name': row.name,
+            'sku': row.sku,
+            'package_type': row.package_type,
+            'reference_colors': row.reference_colors,
+            'dimensions': row.dimensions
+        }
+        for row in rows
+    ]
+    return ProductCatalog(company_id, version, products)
+
+
+def get_product_catalog(db: Session, company_id: int) -> ProductCatalog:
+    """
+    Şirketin ürün kataloğunu önbellekten getir
+    
+    Versiyon sayacı Redis'te paylaşıldığı için products router'ında yapılan
+    bir değişiklik worker süreçlerindeki kopyayı da geçersiz kılar.
+    """
+    version = get_version(_scope(company_id))
+    
+    with _lock:
+        catalog = _catalogs.get(company_id)
+        if catalog is not None and catalog.version == version:
+            return catalog
+    
+    catalog = _load_catalog(db, company_id, version)
+    with _lock:
+        _catalogs[company_id] = catalog
+    return catalog
+
+
+def invalidate_product_catalog(company_id: int):
+    """Ürün eklendi/güncellendi/silindiğinde çağrılır"""
+    bump_version(_scope(company_id))
+    bump_version("products")  # Şirket filtresiz ürün listesi (response_cache)
+    with _lock:
+        _catalogs.pop(company_id, None)
+
+
+# ============================================================================
+# RENK İMZASI İNDEKSİ (SKU AYRIŞTIRMA)
+# ============================================================================
+
+# {company_id: ColorSignatureIndex}
+_sku_indexes = {}
+_sku_lock = threading.Lock()
+
+
+def _refresh_sku_index(db: Session, index):
+    """Yalnızca değişen ürünlerin imzalarını yükle (artımlı güncelleme)"""
+    rows = db.query(
+        Product.id,
+        Product.name,
+        Product.sku,
+        Product.package_type,
+        Product.updated_at
+    ).filter(Product.company_id == index.company_id).all()
+    
+    current = {row.id: row for row in rows}
+    for product_id in list(index.entries.keys()):
+        if product_id not in current:
+            index.remove(product_id)
+    
+    changed = [
+        row.id for row in rows
+        if row.id not in index.entries or index.entries[row.id]['updated_at'] != row.updated_at
+    ]
+    if not changed:
+        return
+    
+    signature_rows = db.query(
+        Product.id,
+        Product.color_signature,
+        Product.reference_image
+    ).filter(Product.id.in_(changed)).all()
+    
+    color_analyzer = None
+    backfilled = {}
+    for signature_row in signature_rows:
+        signature = signature_row.color_signature
+        
+        # İmzası hiç hesaplanmamış eski ürünler: bir kez hesapla, ayrı session'da kaydet
+        if signature is None and signature_row.reference_image:
+            if color_analyzer is None:
+                from app.ai.color_analyzer import ColorAnalyzer
+                color_analyzer = ColorAnalyzer()
+            signature = color_analyzer.color_signature(signature_row.reference_image)
+            if signature is not None:
+                backfilled[signature_row.id] = (signature, current[signature_row.id].updated_at)
+        
+        row = current[signature_row.id]
+        index.upsert(
+            row.id,
+            row.name,
+            signature,
+            sku=row.sku,
+            package_type=row.package_type,
+            updated_at=row.updated_at
+        )
+    
+    if backfilled:
+        submit_background(_save_signatures, backfilled)
+
+
+def _save_signatures(signatures: dict):
+    """
+    Hesaplanan imzaları kendi session'ında kaydet ({id: (imza, updated_at)})
+    
+    İndeks analiz isteği içinde yenilenir; isteğin session'ı commit
+    edilirse henüz analizi yazılmamış yükleme (blob referansı) erkenden
+    kalıcı olur. Yazma paylaşılan arka plan havuzunda yapılır; SQLite'ta
+    isteğin yazma kilidi bırakılana kadar bekler. updated_at korunur (imza
+    doldurmak ürün güncellemesi sayılmaz, indeks tekrar yenilenmez).
+    """
+    db = SessionLocal()
+    try:
+        for product_id, (signature, updated_at) in signatures.items():
+            # Arada ürün güncellendiyse (yeni referans görüntü) dokunma
+            db.query(Product).filter(
+                Product.id == product_id,
+                Product.updated_at == updated_at
+            ).update({
+                'color_signature': signature,
+                'updated_at': Product.updated_at
+            }, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Renk imzaları kaydedilemedi: {e}")
+    finally:
+        db.close()
+
+
+def get_sku_index(db: Session, company_id: int):
+    """Şirketin renk imzası indeksini getir (ürün versiyonu değiştiyse günceller)"""
+    from app.ai.sku_index import ColorSignatureIndex
+    
+    version = get_version(_scope(company_id))
+    
+    with _sku_lock:
+        index = _sku_indexes.get(company_id)
+        if index is None:
+            index = ColorSignatureIndex(company_id)
+            _sku_indexes[company_id] = index
+        
+        if index.version != version:
+            _refresh_sku_index(db, index)
+            index.version = version
+    
+    return index
+
+
+def match_detection_skus(db: Session, company_id: int, image, detections: list, k: int = 3) -> list:
+    """
+    Opsiyonel analiz adımı: her tespit kırpımını en yakın SKU'lara eşle
+    
+    Args:
+        image: RGB görüntü
+        detections: YOLO tespitleri ('class' / 'class_name', 'bbox')
+    
+    Returns:
+        Tespit sırasıyla aday listeleri
+    """
+    from app.ai.color_analyzer import ColorAnalyzer
+    
+    index = get_sku_index(db, company_id)
+    if not detections or len(index) == 0:
+        return [[] for _ in detections]
+    
+    signatures = ColorAnalyzer().signatures_for_boxes(image, detections)
+    package_types = [det.get('class_name', det.get('class')) for det in detections]
+    return index.query(signatures, k=k, package_types=package_types)
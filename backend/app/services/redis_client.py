@@ -0,0 +1,55 @@
+﻿import os
+import time
+import threading
+
+# Redis URL: ayrı verilmezse Celery broker'ı kullanılır
+REDIS_URL = os.getenv("REDIS_URL", os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0"))
+
+# Bağlantı hatasından sonra tekrar denemeden önce beklenecek süre (sn)
+RETRY_INTERVAL = 30
+
+_client = None
+_failed_at = None
+_lock = threading.Lock()
+
+
+def get_redis():
+    """
+    Paylaşılan Redis istemcisini döndür
+    
+    Redis erişilemezse None döner; çağıranlar süreç içi (in-process)
+    davranışa geri düşer. Başarısız bağlantı RETRY_INTERVAL boyunca
+    tekrar denenmez.
+    """
+    global _client, _failed_at
+    
+    if _client is not None:
+        return _client
+    
+    if _failed_at is not None and time.time() - _failed_at < RETRY_INTERVAL:
+        return None
+    
+    with _lock:
+        if _client is not None:
+            return _client
+        
+        try:
+            import redis
+            
+            client = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5)
+            client.ping()
+            _client = client
+            _failed_at = None
+        except Exception as e:
+            print(f"⚠️ Redis bağlantısı kurulamadı, süreç içi önbellek kullanılıyor: {e}")
+            _failed_at = time.time()
+        
+        return _client
+
+
+def reset_redis():
+    """Drop the cached client (e.g. after a connection error)"""
+    global _client, _failed_at
+    with _lock:
+        _client = None
+        _failed_at = time.time()
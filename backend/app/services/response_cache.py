@@ -0,0 +1,133 @@
+﻿"""
+GET yanıt önbelleği (ETag / 304)
+
+Sık sorgulanan liste endpoint'lerinin serileştirilmiş JSON gövdeleri,
+ilgili kaynakların versiyon sayaçlarıyla (cache_versions) anahtarlanarak
+süreç içinde tutulur. Yazma işlemleri sayacı artırdığında eski girişler
+bir daha eşleşmez. Gövdenin sha256'sı güçlü ETag olarak döner; istemci
+If-None-Match ile aynı ETag'i gönderirse 304 verilir.
+
+Önbellekte olan bir yanıt için ne veritabanına gidilir ne de serileştirme
+yapılır.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, List
+from fastapi import Request, Response
+
+from app.services.cache_versions import get_version, bump_version
+from app.services.compact import dumps
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 30))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 256))
+# Redis'teki versiyonun süreç içinde yeniden kullanılma süresi (sn)
+RESPONSE_CACHE_VERSION_MAX_AGE = float(os.getenv("RESPONSE_CACHE_VERSION_MAX_AGE", 1.0))
+
+# Önbelleğe gövdeyle birlikte alınan header'lar
+CACHED_HEADERS = ("X-Next-Cursor",)
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+
+class _Entry:
+    __slots__ = ("body", "etag", "headers", "expires_at")
+    
+    def __init__(self, body: bytes, etag: str, headers: dict, expires_at: float):
+        self.body = body
+        self.etag = etag
+        self.headers = headers
+        self.expires_at = expires_at
+
+
+def _cache_key(request: Request, scopes: List[str]) -> tuple:
+    versions = tuple(get_version(scope, max_age=RESPONSE_CACHE_VERSION_MAX_AGE) for scope in scopes)
+    query = tuple(sorted(request.query_params.multi_items()))
+    return request.url.path, query, tuple(scopes), versions
+
+
+def _get(key: tuple):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        return entry
+
+
+def _put(key: tuple, entry: _Entry):
+    with _lock:
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        while len(_entries) > RESPONSE_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # GET için zayıf karşılaştırma: W/ öneki yok sayılır
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.replace("W/", "", 1) == etag for tag in candidates)
+
+
+def _response(request: Request, entry: _Entry, cache_status: str) -> Response:
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": "private, no-cache",  # Her seferinde If-None-Match ile doğrula
+        "X-Cache": cache_status,
+        **entry.headers
+    }
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def cached_response(request: Request, scopes: List[str], build: Callable[[Response], object], ttl: float = None) -> Response:
+    """
+    Versiyonlu, ETag'li JSON yanıtı
+    
+    Args:
+        request: Gelen istek (path + query string anahtarın parçası)
+        scopes: Yanıtın bağlı olduğu versiyon kapsamları (ör. ["products:1"])
+        build: Önbellekte yoksa çağrılır; JSON'a çevrilebilir veri döndürür.
+            Aldığı Response'a yazılan CACHED_HEADERS gövdeyle saklanır.
+        ttl: Saniye (varsayılan RESPONSE_CACHE_TTL). Versiyonu artırılmayan
+            değişiklikler (ör. Redis'siz worker yazmaları) en fazla bu kadar
+            gecikir.
+    """
+    key = _cache_key(request, scopes)
+    entry = _get(key)
+    if entry is not None:
+        return _response(request, entry, "HIT")
+    
+    header_holder = Response()
+    data = build(header_holder)
+    body = dumps(data)
+    entry = _Entry(
+        body=body,
+        etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        headers={name: header_holder.headers[name] for name in CACHED_HEADERS if name in header_holder.headers},
+        expires_at=time.monotonic() + (ttl if ttl is not None else RESPONSE_CACHE_TTL)
+    )
+    _put(key, entry)
+    return _response(request, entry, "MISS")
+
+
+def invalidate_responses(*scopes: str):
+    """Kapsamların versiyonunu artır (ilgili tüm önbellek girişleri geçersiz olur)"""
+    for scope in scopes:
+        bump_version(scope)
+
+
+def clear_response_cache():
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,220 @@
+﻿"""
+Günlük analiz özetleri (analysis_daily_stats) ve dashboard sayaçları
+
+Analiz kaydedilirken aynı session/transaction içinde şirket + gün satırı
+artırılır ve rafın son analiz zamanı (shelf_activity) güncellenir; ürün
+sayısı companies.product_count'ta tutulur. Dashboard ve trend sorguları
+analyses/products tablolarını taramaz.
+"""
+import os
+from datetime import datetime, date, timedelta
+from typing import Optional
+from sqlalchemy import update, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.database import Analysis, AnalysisDailyStats, Company, ShelfActivity
+
+# Dashboard "son dönem" penceresi (gün)
+DASHBOARD_WINDOW_DAYS = int(os.getenv("DASHBOARD_WINDOW_DAYS", "7"))
+
+SUM_COLUMNS = [
+    'analysis_count',
+    'total_products_sum',
+    'total_score_sum',
+    'shelf_coverage_sum',
+    'visibility_score_sum',
+    'degraded_eye_alerts'
+]
+
+
+def _to_day(value) -> date:
+    if value is None:
+        return datetime.utcnow().date()
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _increment(db: Session, company_id: int, day: date, deltas: dict):
+    """
+    (company_id, day) satırını deltas kadar artır, yoksa oluştur
+    
+    Önce UPDATE denenir; satır yoksa savepoint içinde INSERT yapılır. Aynı
+    günü eşzamanlı oluşturan başka bir istek kazanırsa UPDATE tekrarlanır.
+    """
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    
+    values = {col: getattr(AnalysisDailyStats, col) + delta for col, delta in deltas.items()}
+    values['updated_at'] = datetime.utcnow()
+    statement = update(AnalysisDailyStats).where(
+        AnalysisDailyStats.company_id == company_id,
+        AnalysisDailyStats.day == day
+    ).values(values).execution_options(synchronize_session=False)
+    
+    if db.execute(statement).rowcount:
+        return
+    
+    try:
+        with db.begin_nested():
+            row = AnalysisDailyStats(company_id=company_id, day=day)
+            for col in SUM_COLUMNS:
+                setattr(row, col, deltas.get(col, 0))
+            db.add(row)
+    except IntegrityError:
+        db.execute(statement)
+
+
+def _analysis_deltas(analysis: Analysis, degraded_eyes: int = 0) -> dict:
+    return {
+        'analysis_count': 1,
+        'total_products_sum': analysis.total_products or 0,
+        'total_score_sum': analysis.total_score or 0.0,
+        'shelf_coverage_sum': analysis.shelf_coverage or 0.0,
+        'visibility_score_sum': analysis.visibility_score or 0.0,
+        'degraded_eye_alerts': degraded_eyes
+    }
+
+
+def _touch_shelf(db: Session, company_id: int, shelf_id: str, analysis_date: datetime):
+    """
+    Rafın son analiz zamanını ileri al, satır yoksa oluştur
+    
+    _increment ile aynı UPDATE -> savepoint INSERT düzeni; satır varsa ama
+    kayıtlı tarih daha yeniyse (geriye dönük kayıt) değişmez.
+    """
+    statement = update(ShelfActivity).where(
+        ShelfActivity.company_id == company_id,
+        ShelfActivity.shelf_id == shelf_id,
+        ShelfActivity.last_analysis_date < analysis_date
+    ).values(last_analysis_date=analysis_date).execution_options(synchronize_session=False)
+    
+    if db.execute(statement).rowcount:
+        return
+    
+    try:
+        with db.begin_nested():
+            db.add(ShelfActivity(company_id=company_id, shelf_id=shelf_id, last_analysis_date=analysis_date))
+    except IntegrityError:
+        db.execute(statement)
+
+
+def record_analysis(db: Session, analysis: Analysis, degraded_eyes: int = 0):
+    """
+    Yeni analizi günlük özete ve raf aktivitesine ekle (commit çağıranın sorumluluğunda)
+    
+    Args:
+        analysis: Kaydedilecek Analysis (flush edilmiş olmalı)
+        degraded_eyes: Önceki analize göre bozulan göz sayısı
+    """
+    _increment(db, analysis.company_id, _to_day(analysis.analysis_date), _analysis_deltas(analysis, degraded_eyes))
+    if analysis.shelf_id:
+        _touch_shelf(db, analysis.company_id, analysis.shelf_id, analysis.analysis_date or datetime.utcnow())
+
+
+def record_analyses(db: Session, analyses: list):
+    """Toplu kayıt: aynı şirket + gün / raf için tek bir güncelleme (commit çağıranda)"""
+    grouped = {}
+    shelves = {}
+    for analysis in analyses:
+        key = (analysis.company_id, _to_day(analysis.analysis_date))
+        totals = grouped.setdefault(key, dict.fromkeys(SUM_COLUMNS, 0))
+        for col, delta in _analysis_deltas(analysis).items():
+            totals[col] += delta
+        if analysis.shelf_id:
+            shelf_key = (analysis.company_id, analysis.shelf_id)
+            analysis_date = analysis.analysis_date or datetime.utcnow()
+            shelves[shelf_key] = max(shelves.get(shelf_key, analysis_date), analysis_date)
+    
+    for (company_id, day), deltas in grouped.items():
+        _increment(db, company_id, day, deltas)
+    for (company_id, shelf_id), analysis_date in shelves.items():
+        _touch_shelf(db, company_id, shelf_id, analysis_date)
+
+
+def adjust_product_count(db: Session, company_id: int, delta: int):
+    """Ürün eklendi/silindi: companies.product_count (commit çağıranda)"""
+    db.execute(update(Company).where(Company.id == company_id).values(
+        product_count=func.coalesce(Company.product_count, 0) + delta,
+        updated_at=Company.updated_at  # Sayaç değişimi şirket güncellemesi sayılmaz
+    ).execution_options(synchronize_session=False))
+
+
+def count_products(db: Session, company_id: Optional[int] = None) -> int:
+    """Ürün sayısı sayaçtan (şirket filtresizse şirketler toplamı)"""
+    query = db.query(func.sum(Company.product_count))
+    if company_id is not None:
+        query = query.filter(Company.id == company_id)
+    return int(query.scalar() or 0)
+
+
+def apply_score_deltas(db: Session, company_id: int, deltas_by_day: dict):
+    """Yeniden puanlama sonrası gün bazlı total_score farklarını uygula"""
+    for day, delta in deltas_by_day.items():
+        _increment(db, company_id, _to_day(day), {'total_score_sum': delta})
+
+
+def _window_query(db: Session, company_id: Optional[int], days: Optional[int]):
+    query = db.query(*[func.sum(getattr(AnalysisDailyStats, col)) for col in SUM_COLUMNS])
+    if company_id is not None:
+        query = query.filter(AnalysisDailyStats.company_id == company_id)
+    if days:
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        query = query.filter(AnalysisDailyStats.day >= since)
+    return query
+
+
+def get_stats(db: Session, company_id: Optional[int] = None, days: Optional[int] = None) -> dict:
+    """
+    Özet istatistikler (tüm zamanlar veya son `days` gün)
+    
+    Returns:
+        {'analysis_count', 'total_products', 'average_score',
+         'average_coverage', 'average_visibility', 'degraded_eye_alerts'}
+    """
+    sums = dict(zip(SUM_COLUMNS, (value or 0 for value in _window_query(db, company_id, days).one())))
+    count = sums['analysis_count']
+    
+    def average(col):
+        return round(sums[col] / count, 2) if count else None
+    
+    return {
+        'analysis_count': int(count),
+        'total_products': int(sums['total_products_sum']),
+        'average_score': average('total_score_sum'),
+        'average_coverage': average('shelf_coverage_sum'),
+        'average_visibility': average('visibility_score_sum'),
+        'degraded_eye_alerts': int(sums['degraded_eye_alerts'])
+    }
+
+
+def get_daily_trend(db: Session, company_id: int, days: int = 30) -> list:
+    """Gün gün ortalama skor / doluluk (trend grafikleri için)"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    rows = db.query(AnalysisDailyStats).filter(
+        AnalysisDailyStats.company_id == company_id,
+        AnalysisDailyStats.day >= since
+    ).order_by(AnalysisDailyStats.day).all()
+    
+    return [
+        {
+            'day': str(row.day),
+            'analysis_count': row.analysis_count,
+            'total_products': row.total_products_sum,
+            'average_score': round(row.total_score_sum / row.analysis_count, 2) if row.analysis_count else None,
+            'average_coverage': round(row.shelf_coverage_sum / row.analysis_count, 2) if row.analysis_count else None,
+            'degraded_eye_alerts': row.degraded_eye_alerts
+        }
+        for row in rows
+    ]
+
+
+def count_active_shelves(db: Session, company_id: Optional[int] = None, days: int = DASHBOARD_WINDOW_DAYS) -> int:
+    """Son `days` gün içinde analiz edilmiş farklı raf sayısı (shelf_activity index aralığı)"""
+    since = datetime.utcnow() - timedelta(days=days)
+    query = db.query(func.count(ShelfActivity.id)).filter(ShelfActivity.last_analysis_date >= since)
+    if company_id is not None:
+        query = query.filter(ShelfActivity.company_id == company_id)
+    return query.scalar() or 0
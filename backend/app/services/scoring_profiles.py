@@ -0,0 +1,66 @@
+﻿import os
+import threading
+from sqlalchemy.orm import Session
+
+from app.models.database import ScoringRule
+from app.ai.scoring_engine import ScoringProfile
+from app.services.cache_versions import get_version, bump_version
+
+# Redis'teki versiyonun süreç içinde yeniden kullanılma süresi (sn)
+PROFILE_VERSION_MAX_AGE = float(os.getenv("SCORING_PROFILE_VERSION_MAX_AGE", 1.0))
+
+# {company_id: ScoringProfile}
+_profiles = {}
+_lock = threading.Lock()
+
+
+def _scope(company_id: int) -> str:
+    return f"scoring_rules:{company_id}"
+
+
+def compile_scoring_profile(db: Session, company_id: int, version: int = 0) -> ScoringProfile:
+    """Aktif ScoringRule satırlarından profil derle"""
+    rules = db.query(
+        ScoringRule.rule_type,
+        ScoringRule.weight,
+        ScoringRule.parameters
+    ).filter(
+        ScoringRule.company_id == company_id,
+        ScoringRule.is_active == True
+    ).order_by(ScoringRule.id).all()
+    
+    return ScoringProfile(
+        company_id,
+        [
+            {'rule_type': rule.rule_type, 'weight': rule.weight, 'parameters': rule.parameters}
+            for rule in rules
+        ],
+        version=version
+    )
+
+
+def get_scoring_profile(db: Session, company_id: int) -> ScoringProfile:
+    """
+    Şirketin derlenmiş puanlama profili (bellek içi önbellek)
+    
+    Kural eklenip güncellendiğinde veya silindiğinde versiyon artar ve
+    profil bir sonraki çağrıda yeniden derlenir.
+    """
+    version = get_version(_scope(company_id), max_age=PROFILE_VERSION_MAX_AGE)
+    
+    with _lock:
+        profile = _profiles.get(company_id)
+        if profile is not None and profile.version == version:
+            return profile
+    
+    profile = compile_scoring_profile(db, company_id, version)
+    with _lock:
+        _profiles[company_id] = profile
+    return profile
+
+
+def invalidate_scoring_profile(company_id: int):
+    """ScoringRule create/update/delete sonrasında çağrılır"""
+    bump_version(_scope(company_id))
+    with _lock:
+        _profiles.pop(company_id, None)
@@ -0,0 +1,194 @@
+﻿"""
+Aynı analiz isteklerini birleştirme (single-flight)
+
+Mobil istemciler yavaş ağda aynı görüntüyü saniye içinde birkaç kez
+gönderir. Anahtar görüntü özeti + parametrelerdir; bir analiz sürerken gelen
+aynı istekler onun sonucunu bekler ve aynı yanıtı alır:
+    
+    - süreç içinde: anahtar -> asyncio.Future
+    - worker'lar arasında: Redis'te SET NX kilidi (single-flight:lock:<key>);
+      kilidi alamayan worker sonucun single-flight:result:<key> altına
+      yazılmasını bekler. Sonuç SINGLE_FLIGHT_RESULT_TTL süreyle saklanır,
+      bu sürede gelen tekrar denemeler de analiz çalıştırmaz.
+
+Lider sonuç yayınlamadan biterse (hata yanıtı, istisna) bekleyenler
+analizi kendileri çalıştırır. Redis yoksa birleştirme ve sonuç saklama
+süreç içinde yapılır.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
+
+from app.services.redis_client import get_redis
+
+SINGLE_FLIGHT_PREFIX = "single-flight:"
+SINGLE_FLIGHT_LOCK_TTL = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL", "120"))  # Lider çökerse kilidin düşme süresi (sn)
+SINGLE_FLIGHT_RESULT_TTL = int(os.getenv("SINGLE_FLIGHT_RESULT_TTL", "30"))
+SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", "0.1"))
+LOCAL_RESULT_LIMIT = 256
+
+# Süreç içi liderler: anahtar -> Future (sonuç veya yayınlanmadıysa None)
+_inflight = {}
+# Redis yokken son sonuçlar: anahtar -> (bitiş zamanı, sonuç)
+_recent = OrderedDict()
+
+
+def flight_key(sha256: str, **params) -> str:
+    """Görüntü özeti + istek parametreleri -> birleştirme anahtarı"""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return f"{sha256}:{digest}"
+
+
+def _lock_key(key: str) -> str:
+    return f"{SINGLE_FLIGHT_PREFIX}lock:{key}"
+
+
+def _result_key(key: str) -> str:
+    return f"{SINGLE_FLIGHT_PREFIX}result:{key}"
+
+
+class Flight:
+    """
+    join_flight sonucu
+    
+    shared=True ise result başka bir isteğin yanıtıdır. Aksi halde çağıran
+    liderdir: analizi çalıştırır, yanıtı publish() ile yayınlar ve her
+    durumda finish() çağırır.
+    """
+    
+    def __init__(self, key: str, future=None, result=None):
+        self.key = key
+        self.result = result
+        self.shared = result is not None
+        self._future = future
+        self._token = None  # Redis kilidi bizdeyse
+    
+    def publish(self, result: dict) -> dict:
+        if self._future is not None and not self._future.done():
+            self._future.set_result(result)
+        if self._token is None:
+            _remember(self.key, result)
+        else:
+            try:
+                get_redis().set(
+                    _result_key(self.key),
+                    json.dumps(result, ensure_ascii=False, default=str),
+                    ex=SINGLE_FLIGHT_RESULT_TTL
+                )
+            except Exception as e:
+                print(f"⚠️ Single-flight sonucu yazılamadı: {e}")
+        return result
+    
+    def finish(self):
+        if self._future is not None:
+            if not self._future.done():
+                self._future.set_result(None)  # Bekleyenler kendileri çalıştırır
+            if _inflight.get(self.key) is self._future:
+                del _inflight[self.key]
+            self._future = None
+        if self._token is not None:
+            token, self._token = self._token, None
+            try:
+                client = get_redis()
+                # Yalnızca kendi kilidimizi sil (TTL dolup başkası almış olabilir)
+                if client.get(_lock_key(self.key)) == token.encode():
+                    client.delete(_lock_key(self.key))
+            except Exception:
+                pass
+
+
+def _remember(key: str, result: dict):
+    _recent[key] = (time.monotonic() + SINGLE_FLIGHT_RESULT_TTL, result)
+    _recent.move_to_end(key)
+    while len(_recent) > LOCAL_RESULT_LIMIT:
+        _recent.popitem(last=False)
+
+
+def _recent_result(key: str) -> Optional[dict]:
+    entry = _recent.get(key)
+    if entry is None:
+        return None
+    if entry[0] < time.monotonic():
+        del _recent[key]
+        return None
+    return entry[1]
+
+
+def _claim_remote(key: str, token: str):
+    """
+    Redis: önce saklanan sonuç, yoksa kilit
+    
+    Returns:
+        ('result', dict) | ('lock', None) kilit alındı | ('wait', None) | ('none', None) Redis yok
+    """
+    client = get_redis()
+    if client is None:
+        return 'none', None
+    try:
+        payload = client.get(_result_key(key))
+        if payload:
+            return 'result', json.loads(payload)
+        if client.set(_lock_key(key), token, nx=True, ex=SINGLE_FLIGHT_LOCK_TTL):
+            return 'lock', None
+        return 'wait', None
+    except Exception as e:
+        print(f"⚠️ Single-flight kilidi kullanılamadı: {e}")
+        return 'none', None
+
+
+async def _wait_remote(flight: Flight) -> Optional[dict]:
+    """Başka worker'daki lideri bekle; sonuç gelmezse kilidi alıp None döndür"""
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + SINGLE_FLIGHT_LOCK_TTL
+    while True:
+        state, result = await run_in_threadpool(_claim_remote, flight.key, token)
+        if state == 'result':
+            return result
+        if state == 'lock':
+            flight._token = token
+            return None
+        if state == 'none' or time.monotonic() > deadline:
+            return None
+        await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+
+
+async def join_flight(key: str) -> Flight:
+    """
+    Aynı anahtarla süren analize katıl veya lider ol
+    
+    Returns:
+        Flight: shared=True ise result hazır yanıttır
+    """
+    while True:
+        recent = _recent_result(key)
+        if recent is not None:
+            return Flight(key, result=recent)
+        future = _inflight.get(key)
+        if future is None:
+            break
+        result = await asyncio.shield(future)
+        if result is not None:
+            return Flight(key, result=result)
+        # Lider yanıt yayınlamadı; tekrar dene (lider olabiliriz)
+    
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    flight = Flight(key, future=future)
+    try:
+        result = await _wait_remote(flight)
+    except BaseException:
+        flight.finish()
+        raise
+    if result is not None:
+        # Başka worker'ın sonucu; bu süreçte bekleyenlere de dağıt
+        if not future.done():
+            future.set_result(result)
+        flight.finish()
+        return Flight(key, result=result)
+    return flight
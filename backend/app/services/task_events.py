@@ -0,0 +1,187 @@
+﻿"""
+Celery görev durumları için push kanalı
+
+Worker'lar update_state (ve başlangıç/bitiş) anında olayı Redis pub/sub'a
+yayınlar; son olay ayrıca TASK_EVENT_TTL süreyle saklanır. API süreci tek bir
+pattern aboneliğiyle (task-events:*) tüm olayları dinler ve SSE/WebSocket
+ile bağlı istemcilere dağıtır; istemci başına Redis bağlantısı açılmaz ve
+AsyncResult ile polling yapılmaz.
+
+Redis yoksa (testler, eager Celery, tek süreçli geliştirme) olaylar süreç
+içi broker üzerinden aynı süreçteki abonelere iletilir.
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from app.services.redis_client import REDIS_URL, get_redis
+
+TASK_EVENTS_PREFIX = "task-events:"
+TASK_EVENT_TTL = int(os.getenv("TASK_EVENT_TTL", "3600"))  # Son olayın saklanma süresi (sn)
+TASK_EVENT_KEEPALIVE = float(os.getenv("TASK_EVENT_KEEPALIVE", "15"))  # Olay yoksa keepalive aralığı (sn)
+LOCAL_EVENT_LIMIT = 1000
+
+# Bu durumlardan sonra görev için başka olay gelmez
+READY_STATES = frozenset(['SUCCESS', 'FAILURE', 'REVOKED'])
+
+
+def _channel(task_id: str) -> str:
+    return f"{TASK_EVENTS_PREFIX}{task_id}"
+
+
+def _last_key(task_id: str) -> str:
+    return f"{TASK_EVENTS_PREFIX}last:{task_id}"
+
+
+class TaskEventHub:
+    """
+    Süreç içi abone listesi (task_id -> asyncio kuyrukları)
+    
+    Olaylar herhangi bir thread'den (Redis dinleyicisi, yerel publish)
+    gelebilir; her kuyruğa kendi event loop'u üzerinden eklenir.
+    """
+    
+    def __init__(self):
+        self._subscribers = {}
+        self._last = OrderedDict()  # Redis yokken son olaylar
+        self._lock = threading.Lock()
+        self._listener = None
+    
+    def add(self, task_id: str):
+        entry = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(task_id, set()).add(entry)
+        return entry
+    
+    def remove(self, task_id: str, entry):
+        with self._lock:
+            subscribers = self._subscribers.get(task_id)
+            if subscribers is not None:
+                subscribers.discard(entry)
+                if not subscribers:
+                    del self._subscribers[task_id]
+    
+    def dispatch(self, event: dict):
+        with self._lock:
+            targets = list(self._subscribers.get(event.get('task_id'), ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                pass  # Loop kapanmış (bağlantı koptu)
+    
+    def publish_local(self, event: dict):
+        with self._lock:
+            self._last[event['task_id']] = event
+            self._last.move_to_end(event['task_id'])
+            while len(self._last) > LOCAL_EVENT_LIMIT:
+                self._last.popitem(last=False)
+        self.dispatch(event)
+    
+    def last_local(self, task_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._last.get(task_id)
+    
+    def ensure_listener(self):
+        """Redis varsa pattern aboneliğini arka plan thread'inde bir kez başlat"""
+        if self._listener is not None or get_redis() is None:
+            return
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="task-events", daemon=True)
+                self._listener.start()
+    
+    def _listen(self):
+        import redis
+        
+        while True:
+            try:
+                # Ayrı bağlantı: paylaşılan istemcinin kısa socket_timeout'u dinlemeyi keser
+                client = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=0.5)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{TASK_EVENTS_PREFIX}*")
+                for message in pubsub.listen():
+                    if message['type'] == 'pmessage':
+                        self.dispatch(json.loads(message['data']))
+            except Exception as e:
+                print(f"⚠️ Görev olay dinleyicisi koptu, yeniden bağlanılıyor: {e}")
+                time.sleep(1)
+
+
+hub = TaskEventHub()
+
+
+def publish_task_event(task_id: str, state: str, meta=None):
+    """
+    Görev durumunu yayınla (worker tarafı, EventTask tarafından çağrılır)
+    
+    Yayın hatası görevi asla düşürmez.
+    """
+    if not task_id or not state:
+        return
+    
+    event = {
+        'task_id': task_id,
+        'state': state,
+        'meta': meta,
+        'timestamp': time.time()
+    }
+    
+    client = get_redis()
+    if client is None:
+        hub.publish_local(event)
+        return
+    
+    try:
+        payload = json.dumps(event, ensure_ascii=False, default=str)
+        pipe = client.pipeline()
+        pipe.set(_last_key(task_id), payload, ex=TASK_EVENT_TTL)
+        pipe.publish(_channel(task_id), payload)
+        pipe.execute()
+    except Exception as e:
+        print(f"⚠️ Görev olayı yayınlanamadı ({task_id}): {e}")
+
+
+def get_last_event(task_id: str) -> Optional[dict]:
+    """Görevin bilinen son olayı (Redis veya süreç içi)"""
+    client = get_redis()
+    if client is None:
+        return hub.last_local(task_id)
+    try:
+        payload = client.get(_last_key(task_id))
+    except Exception:
+        return None
+    return json.loads(payload) if payload else None
+
+
+async def subscribe(task_id: str):
+    """
+    Görev olaylarını sırayla üret (SSE/WebSocket)
+    
+    İlk olarak bilinen son durum (yoksa PENDING) döner; olay gelmeyen her
+    TASK_EVENT_KEEPALIVE saniyede None üretilir. Görev bitince sonlanır.
+    """
+    hub.ensure_listener()
+    loop, queue = entry = hub.add(task_id)
+    try:
+        # Abone olduktan sonra okunur; arada gelen olay kaybolmaz
+        last = await loop.run_in_executor(None, get_last_event, task_id)
+        yield last or {'task_id': task_id, 'state': 'PENDING', 'meta': None, 'timestamp': time.time()}
+        if last and last['state'] in READY_STATES:
+            return
+        
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=TASK_EVENT_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            yield event
+            if event['state'] in READY_STATES:
+                return
+    finally:
+        hub.remove(task_id, entry)
@@ -0,0 +1,70 @@
+﻿"""
+Akışlı (chunked) dosya yükleme
+
+UploadFile içeriği sabit boyutlu parçalar halinde aiofiles ile diske yazılır;
+dosya belleğe alınmaz ve event loop bloklanmaz. Yazarken SHA-256 hesaplanır
+ve MAX_UPLOAD_SIZE aşıldığı anda 413 ile kesilir. Yazma geçici dosyaya
+yapılır, tamamlanınca os.replace ile hedefe taşınır (yarım dosya kalmaz).
+"""
+import os
+import uuid
+import hashlib
+import aiofiles
+from fastapi import HTTPException, UploadFile
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))  # 1MB
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 10485760))  # 10MB default
+
+
+def _too_large(max_size: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large. Max size: {max_size} bytes")
+
+
+async def save_upload(file: UploadFile, destination: str, max_size: int = None) -> dict:
+    """
+    Yüklenen dosyayı parça parça hedefe yaz
+    
+    Args:
+        file: FastAPI UploadFile
+        destination: Hedef dosya yolu (klasör yoksa oluşturulur)
+        max_size: Bayt sınırı (varsayılan MAX_UPLOAD_SIZE)
+    
+    Returns:
+        {'path', 'sha256', 'size'}
+    
+    Raises:
+        HTTPException(413): Dosya sınırı aşarsa (hedefe hiçbir şey yazılmaz)
+    """
+    max_size = max_size or MAX_UPLOAD_SIZE
+    
+    # Content-Length biliniyorsa hiç okumadan reddet
+    if file.size is not None and file.size > max_size:
+        raise _too_large(max_size)
+    
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    temp_path = f"{destination}.{uuid.uuid4().hex[:8]}.part"
+    digest = hashlib.sha256()
+    size = 0
+    
+    try:
+        async with aiofiles.open(temp_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise _too_large(max_size)
+                digest.update(chunk)
+                await buffer.write(chunk)
+        os.replace(temp_path, destination)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    
+    return {
+        'path': destination,
+        'sha256': digest.hexdigest(),
+        'size': size
+    }
@@ -1,5 +1,5 @@
 ﻿import os
-from celery import Celery
+from celery import Celery, Task
 from datetime import datetime
 from sqlalchemy.orm import Session
 
@@ -7,10 +7,41 @@ from sqlalchemy.orm import Session
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 
+
+
+class EventTask(Task):
+    """
+    Durum değişikliklerini push kanalına da yayınlayan görev sınıfı
+    
+    update_state, başlangıç ve bitiş app.services.task_events üzerinden
+    Redis pub/sub'a gider; istemciler /api/events ile AsyncResult polling
+    yapmadan takip eder.
+    """
+    
+    def _publish(self, task_id, state, meta=None):
+        from app.services.task_events import publish_task_event
+        
+        publish_task_event(task_id, state, meta)
+    
+    def update_state(self, task_id=None, state=None, meta=None, **kwargs):
+        super().update_state(task_id=task_id, state=state, meta=meta, **kwargs)
+        self._publish(task_id or self.request.id, state, meta)
+    
+    def before_start(self, task_id, args, kwargs):
+        self._publish(task_id, 'STARTED')
+    
+    def on_success(self, retval, task_id, args, kwargs):
+        self._publish(task_id, 'SUCCESS', retval)
+    
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        self._publish(task_id, 'FAILURE', {'error': str(exc)})
+
+
 celery_app = Celery(
     "retail_shelf_ai",
     broker=CELERY_BROKER_URL,
-    backend=CELERY_RESULT_BACKEND
+    backend=CELERY_RESULT_BACKEND,
+    task_cls=EventTask
 )
 
 celery_app.conf.update(
@@ -32,6 +63,7 @@ def train_model_task(self, company_id: int, dataset_id: int, model_name: str, co
     """
     from app.models.database import SessionLocal, Model, Dataset
     from app.ai.yolo_trainer import YOLOTrainer
+    from app.services.response_cache import invalidate_responses
     
     db = SessionLocal()
     
@@ -62,6 +94,8 @@ def train_model_task(self, company_id: int, dataset_id: int, model_name: str, co
             model.training_config = config
             db.commit()
         
+        invalidate_responses(f"models:{company_id}")
+        
         # Get dataset
         dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
         if not dataset or not dataset.yaml_path:
@@ -76,12 +110,20 @@ def train_model_task(self, company_id: int, dataset_id: int, model_name: str, co
         # Initialize trainer
         trainer = YOLOTrainer(company_id, dataset_id)
         
+        # Epoch ilerlemesi (push kanalına da gider)
+        def on_epoch_end(epoch, total_epochs):
+            self.update_state(
+                state='PROGRESS',
+                meta={'current': epoch, 'total': total_epochs, 'status': f'Epoch {epoch}/{total_epochs}'}
+            )
+        
         # Train model
         result = trainer.train(
             yaml_path=dataset.yaml_path,
             epochs=config.get('epochs', 50),
             batch=config.get('batch', 16),
-            imgsz=config.get('imgsz', 640)
+            imgsz=config.get('imgsz', 640),
+            on_epoch_end=on_epoch_end
         )
         
         if result['success']:
@@ -124,6 +166,8 @@ def train_model_task(self, company_id: int, dataset_id: int, model_name: str, co
         raise e
     
     finally:
+        # Tamamlandı/başarısız durumu model listesine yansısın
+        invalidate_responses(f"models:{company_id}")
         db.close()
 
 
@@ -132,10 +176,14 @@ def analyze_image_task(self, company_id: int, model_id: int, image_path: str):
     """
     Background task for analyzing shelf image
     """
-    from app.models.database import SessionLocal, Analysis, Model, Product
+    from app.models.database import SessionLocal, Analysis, Model
     from app.ai.yolo_inference import YOLOInference
     from app.ai.shelf_analyzer import ShelfAnalyzer
     from app.ai.color_analyzer import ColorAnalyzer
+    from app.services.product_cache import get_product_catalog
+    from app.services.rollups import record_analysis
+    from app.services.detection_store import store_detections
+    from app.services.derivatives import prepare_inference_image
     from app.ai.scoring_engine import ScoringEngine
     
     db = SessionLocal()
@@ -155,8 +203,13 @@ def analyze_image_task(self, company_id: int, model_id: int, image_path: str):
         # Initialize inference
         inference = YOLOInference(model.model_path)
         
+        # Önceden boyutlandırılmış çıkarım kopyası (görüntü bir kez okunur)
+        image, image_scale = prepare_inference_image(db, image_path)
+        if image is None:
+            raise Exception(f"Cannot read image: {image_path}")
+        
         # Run detection
-        result = inference.predict(image_path, conf_threshold=0.25)
+        result = inference.predict(image, conf_threshold=0.25)
         
         if not result['success']:
             raise Exception(f"Inference failed: {result.get('error')}")
@@ -172,30 +225,43 @@ def analyze_image_task(self, company_id: int, model_id: int, image_path: str):
         
         # Analyze shelf
         analyzer = ShelfAnalyzer(image_shape)
-        shelf_analysis = analyzer.analyze_shelf(detections, image_shape)
+        shelf_analysis = analyzer.analyze_shelf(detections, image, image_scale)
+        
+        # Color analysis (çıkarımla aynı görüntü)
+        import cv2
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         
-        # Color analysis
         color_analyzer = ColorAnalyzer()
-        color_results = color_analyzer.extract_dominant_colors(image_path)
+        try:
+            color_results = {
+                'success': True,
+                'colors': color_analyzer.extract_dominant_colors_from_array(image)
+            }
+        except Exception as e:
+            color_results = {'success': False, 'error': str(e)}
         
         # Get product reference colors for comparison
         color_matches = {}
         if detections:
-            for det in detections:
-                class_name = det['class_name']
-                product = db.query(Product).filter(
-                    Product.company_id == company_id,
-                    Product.name == class_name
-                ).first()
-                
-                if product and product.reference_colors:
-                    color_result = color_analyzer.analyze_product_colors(
-                        image_path,
-                        det['bbox'],
-                        product.reference_colors
+            # Şirket ürün kataloğu: tek sorgu, süreçler arası önbellekli
+            catalog = get_product_catalog(db, company_id)
+            
+            # Tüm tespitler tek geçişte (Lab paleti katalogla birlikte önbellekte)
+            color_results_per_detection = color_analyzer.analyze_detections_colors(
+                image, detections, catalog.palette
+            )
+            
+            class_scores = {}
+            for det, color_result in zip(detections, color_results_per_detection):
+                if color_result and color_result['color_match_scores']:
+                    class_scores.setdefault(det['class_name'], []).append(
+                        max(color_result['color_match_scores'].values())
                     )
-                    if color_result['success']:
-                        color_matches[class_name] = color_result['color_match_scores']
+            
+            color_matches = {
+                class_name: round(float(sum(scores) / len(scores)), 2)
+                for class_name, scores in class_scores.items()
+            }
         
         # Calculate scores
         scoring = ScoringEngine()
@@ -224,14 +290,19 @@ def analyze_image_task(self, company_id: int, model_id: int, image_path: str):
             total_products=shelf_analysis['total_products'],
             product_counts=shelf_analysis['product_counts'],
             shelf_coverage=shelf_analysis['shelf_coverage'],
-            color_analysis=color_results if color_results['success'] else None,
+            # Sınıf başına renk eşleşmeleri de saklanır (toplu yeniden puanlama için)
+            color_analysis={**color_results, 'color_matches': color_matches},
             visibility_score=shelf_analysis['visibility_score'],
             planogram_score=score_result['component_scores']['planogram_compliance'],
             total_score=score_result['total_score'],
+            image_scale=image_scale,
             analysis_date=datetime.utcnow()
         )
         
         db.add(analysis)
+        db.flush()
+        store_detections(db, analysis, detections, analyzer.eyes)
+        record_analysis(db, analysis)
         db.commit()
         db.refresh(analysis)
         
@@ -253,6 +324,44 @@ def analyze_image_task(self, company_id: int, model_id: int, image_path: str):
         db.close()
 
 
+@celery_app.task(bind=True, name="archive_analyses")
+def archive_analyses_task(self, company_id: int = None, older_than_days: int = None):
+    """
+    Saklama süresini aşan analizleri Parquet arşivine taşı
+    """
+    from app.services.analysis_archive import archive_analyses
+    
+    self.update_state(
+        state='PROGRESS',
+        meta={'status': 'Archiving analyses...'}
+    )
+    
+    result = archive_analyses(company_id=company_id, older_than_days=older_than_days)
+    if not result['success']:
+        raise Exception(f"Archive failed: {result.get('error')}")
+    
+    return result
+
+
+@celery_app.task(bind=True, name="purge_deleted_datasets")
+def purge_deleted_datasets_task(self, company_id: int = None, older_than_days: int = None):
+    """
+    Bekleme süresini aşan silinmiş dataset'lerin görüntülerini bırak
+    """
+    from app.services.dataset_purge import purge_deleted_datasets
+    
+    self.update_state(
+        state='PROGRESS',
+        meta={'status': 'Purging deleted datasets...'}
+    )
+    
+    result = purge_deleted_datasets(company_id=company_id, older_than_days=older_than_days)
+    if not result['success']:
+        raise Exception(f"Purge failed: {result.get('error')}")
+    
+    return result
+
+
 @celery_app.task(name="test_task")
 def test_task():
     """Simple test task"""
@@ -0,0 +1,74 @@
+﻿"""
+Test ortamı
+
+Uygulama modülleri import edilmeden önce ortam değişkenleri ayarlanır:
+geçici SQLite veritabanı ve yükleme dizini, erişilemeyen Redis (süreç içi
+yedek yollar kullanılır). Her test boş tablolarla başlar.
+"""
+import os
+import tempfile
+
+_TEST_DIR = tempfile.mkdtemp(prefix="retail_shelf_ai_tests_")
+os.environ.update(
+    DATABASE_BACKEND="sqlite",
+    SQLITE_PATH=os.path.join(_TEST_DIR, "test.db"),
+    UPLOAD_DIR=os.path.join(_TEST_DIR, "uploads"),
+    REDIS_URL="redis://127.0.0.1:1/0",
+)
+os.environ.pop("DATABASE_URL", None)
+
+import cv2
+import numpy as np
+import pytest
+
+from app.models.database import Base, SessionLocal, get_engine
+
+
+@pytest.fixture
+def db():
+    engine = get_engine()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def company(db):
+    from app.models.database import Company
+    
+    company = Company(name="Test Company")
+    db.add(company)
+    db.commit()
+    return company
+
+
+@pytest.fixture
+def model(db, company):
+    from app.models.database import Model
+    
+    model = Model(company_id=company.id, name="test-model", status="completed")
+    db.add(model)
+    db.commit()
+    return model
+
+
+@pytest.fixture
+def jpeg_bytes():
+    """Rastgele içerikli JPEG üreteci (her seed farklı özet verir)"""
+    def make(width: int = 64, height: int = 48, seed: int = 0) -> bytes:
+        image = np.random.default_rng(seed).integers(0, 255, (height, width, 3), dtype=np.uint8)
+        return cv2.imencode(".jpg", image)[1].tobytes()
+    return make
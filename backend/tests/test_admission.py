@@ -0,0 +1,115 @@
+﻿import types
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import admission
+from app.services.admission import AdmissionController, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """admission modülüne sahte monotonic saat (asyncio'nun saatine dokunmaz)"""
+    now = [1000.0]
+    monkeypatch.setattr(admission, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_token_bucket_burst_then_refill(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() == pytest.approx(0.5)  # Bir token 1/rate saniyede dolar
+    
+    clock[0] += 0.5
+    assert bucket.take() == 0.0
+    clock[0] += 60
+    assert [bucket.take() for _ in range(4)][-1] > 0  # Kapasiteden fazla birikmez
+
+
+def test_rate_limit_is_per_company(clock):
+    controller = AdmissionController(max_concurrency=100, company_rate=1, company_burst=2)
+    
+    async def run():
+        for _ in range(2):
+            await controller.acquire(company_id=1)
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire(company_id=1)
+        # Kovasını tüketen şirket diğerlerini etkilemez
+        await controller.acquire(company_id=2)
+        await controller.acquire(company_id=None)
+        return error.value
+    
+    error = asyncio.run(run())
+    
+    assert error.status_code == 429
+    assert error.headers['Retry-After'] == "1"
+    assert controller.stats()['rejected_rate_limited'] == 1
+    assert controller.stats()['admitted'] == 4
+
+
+def test_queued_requests_are_admitted_in_order():
+    controller = AdmissionController(max_concurrency=1, max_queue=5, queue_timeout=5, company_rate=0)
+    admitted = []
+    
+    async def request(name):
+        await controller.acquire()
+        admitted.append(name)
+    
+    async def run():
+        await request("first")
+        waiting = [asyncio.create_task(request(name)) for name in ("a", "b", "c")]
+        await asyncio.sleep(0)
+        for _ in waiting:
+            controller.release()
+            await asyncio.sleep(0)
+            # Slot bekleyene devredilirken yeni gelen öne geçemez
+            late = asyncio.create_task(request("late"))
+            await asyncio.sleep(0)
+            late.cancel()
+        await asyncio.gather(*waiting)
+    
+    asyncio.run(run())
+    
+    assert admitted == ["first", "a", "b", "c"]
+    assert controller.stats()['active'] == 1
+
+
+def test_queue_full_and_timeout_return_503():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=0.05, company_rate=0)
+    
+    async def run():
+        await controller.acquire()
+        queued = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as full:
+            await controller.acquire()
+        with pytest.raises(HTTPException) as timeout:
+            await queued
+        return full.value, timeout.value
+    
+    full, timeout = asyncio.run(run())
+    
+    assert (full.status_code, timeout.status_code) == (503, 503)
+    assert int(full.headers['Retry-After']) >= 1
+    stats = controller.stats()
+    assert (stats['rejected_queue_full'], stats['rejected_timeout'], stats['queue_depth']) == (1, 1, 0)
+
+
+def test_cancelled_waiter_leaves_queue():
+    controller = AdmissionController(max_concurrency=1, max_queue=5, queue_timeout=5, company_rate=0)
+    
+    async def run():
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()  # İstemci kuyruktayken koptu
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.stats()['queue_depth'] == 0
+        controller.release()  # Slot iptal edilmiş bekleyene devredilmez
+    
+    asyncio.run(run())
+    
+    assert controller.stats()['active'] == 0
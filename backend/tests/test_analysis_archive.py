@@ -0,0 +1,87 @@
+﻿from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.database import Analysis, AnalysisDetection
+from app.services import analysis_archive
+from app.services.analysis_archive import archive_analyses, load_archived_payloads, resolve_payload
+
+pytest.importorskip("pyarrow")
+
+PAYLOAD = {'eyes': [{'eye_id': 1, 'eye_name': "Üst Göz", 'hybrid_score': 71.5}], 'summary': {'total': 2}}
+COLORS = {'color_matches': [{'class_name': "cola", 'score': 0.93}]}
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    return tmp_path / "archive"
+
+
+def _add_analysis(db, company, model, age_days: int) -> Analysis:
+    analysis = Analysis(
+        company_id=company.id,
+        model_id=model.id,
+        image_path="shelf.jpg",
+        shelf_id="A1",
+        total_products=2,
+        product_counts={'cola': 2},
+        shelf_coverage=0.5,
+        visibility_score=60.0,
+        planogram_score=70.0,
+        total_score=65.0,
+        detections=PAYLOAD,
+        color_analysis=COLORS,
+        analysis_date=datetime.utcnow() - timedelta(days=age_days)
+    )
+    db.add(analysis)
+    db.flush()
+    for x in (10, 40):
+        db.add(AnalysisDetection(
+            analysis_id=analysis.id,
+            company_id=company.id,
+            shelf_id="A1",
+            analysis_date=analysis.analysis_date,
+            eye_id=1,
+            class_name="cola",
+            confidence=0.9,
+            x1=x, y1=5, x2=x + 20, y2=45
+        ))
+    db.commit()
+    return analysis
+
+
+def test_archive_round_trip(db, company, model, archive_dir):
+    old = _add_analysis(db, company, model, age_days=400)
+    recent = _add_analysis(db, company, model, age_days=1)
+    
+    result = archive_analyses(older_than_days=180, chunk_size=1)
+    
+    assert result['success'] and result['archived'] == 1
+    assert all(path.startswith(str(archive_dir / f"company={company.id}")) for path in result['files'])
+    
+    db.expire_all()
+    old = db.get(Analysis, old.id)
+    assert old.archived_at is not None and old.detections is None and old.color_analysis is None
+    assert old.total_score == 65.0  # Skaler kolonlar sıcak tabloda kalır
+    assert db.get(Analysis, recent.id).archived_at is None
+    
+    payload = load_archived_payloads([old])[old.id]
+    assert payload['detections'] == PAYLOAD
+    assert payload['color_analysis'] == COLORS
+    assert [(row['x1'], row['class_name']) for row in payload['detection_rows']] == [(10, "cola"), (40, "cola")]
+    assert resolve_payload(old, 'detections') == PAYLOAD
+    
+    # İkinci çalışma arşivlenmişleri tekrar seçmez
+    assert archive_analyses(older_than_days=180)['archived'] == 0
+
+
+def test_archived_payload_served_by_api(client, db, company, model):
+    old = _add_analysis(db, company, model, age_days=400)
+    archive_analyses(older_than_days=180)
+    
+    rows = client.get(f"/api/analysis/company/{company.id}?include=detections,color_analysis").json()
+    
+    assert [row['id'] for row in rows] == [old.id]
+    assert rows[0]['detections'] == PAYLOAD
+    assert rows[0]['color_analysis'] == COLORS
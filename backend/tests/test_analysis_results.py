@@ -0,0 +1,59 @@
+﻿from datetime import datetime
+
+import pytest
+
+from app.models.database import Analysis
+
+# Celery görevi tespit listesi, hibrit/toplu analiz özet sözlüğü saklar
+LIST_DETECTIONS = [{'class_name': 'cola', 'confidence': 0.91, 'bbox': [1, 2, 30, 60]}]
+DICT_DETECTIONS = {'summary': {'total_products': 1}, 'eyes': []}
+
+
+def _analysis(db, company, model, detections):
+    analysis = Analysis(
+        company_id=company.id,
+        model_id=model.id,
+        image_path="shelf.jpg",
+        detections=detections,
+        total_products=1,
+        product_counts={'cola': 1},
+        shelf_coverage=40.0,
+        visibility_score=70.0,
+        planogram_score=80.0,
+        total_score=65.0,
+        color_analysis={'success': True, 'colors': []},
+        analysis_date=datetime(2026, 4, 1)
+    )
+    db.add(analysis)
+    db.commit()
+    return analysis
+
+
+@pytest.mark.parametrize("detections", [LIST_DETECTIONS, DICT_DETECTIONS])
+def test_analysis_detail_includes_either_detection_shape(client, db, company, model, detections):
+    analysis = _analysis(db, company, model, detections)
+    
+    response = client.get(f"/api/analysis/{analysis.id}?include=detections,color_analysis")
+    
+    assert response.status_code == 200
+    assert response.json()['detections'] == detections
+
+
+def test_company_analyses_include_mixed_detection_shapes(client, db, company, model):
+    _analysis(db, company, model, LIST_DETECTIONS)
+    _analysis(db, company, model, DICT_DETECTIONS)
+    
+    response = client.get(f"/api/analysis/company/{company.id}?include=detections")
+    
+    assert response.status_code == 200
+    assert sorted(map(str, (item['detections'] for item in response.json()))) == \
+        sorted(map(str, [LIST_DETECTIONS, DICT_DETECTIONS]))
+
+
+def test_analysis_list_omits_payload_by_default(client, db, company, model):
+    _analysis(db, company, model, LIST_DETECTIONS)
+    
+    item = client.get(f"/api/analysis/company/{company.id}").json()[0]
+    
+    assert 'detections' not in item
+    assert 'color_analysis' not in item
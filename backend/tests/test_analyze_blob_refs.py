@@ -0,0 +1,73 @@
+﻿import os
+
+import pytest
+
+from app.ai import yolo_inference
+from app.ai.shelf_analyzer import ShelfAnalyzer
+from app.models.database import Analysis, ImageBlob
+from app.services import blob_store, single_flight
+
+
+@pytest.fixture(autouse=True)
+def blob_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "BLOB_DIR", str(tmp_path / "blobs"))
+    single_flight._recent.clear()
+    yield tmp_path / "blobs"
+    single_flight._recent.clear()
+
+
+def _files(directory) -> list:
+    return [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+
+
+def _analyze(client, company, jpeg_bytes, **params):
+    return client.post(
+        f"/api/analysis/analyze?company_id={company.id}",
+        params=params,
+        files={'file': ("shelf.jpg", jpeg_bytes(width=120, height=90, seed=400), "image/jpeg")}
+    ).json()
+
+
+def test_predict_failure_releases_blob(client, db, company, jpeg_bytes, blob_dir, monkeypatch):
+    def broken_model(model_path):
+        raise ImportError("ultralytics missing")
+    
+    monkeypatch.setattr(yolo_inference, "get_shared_model", broken_model)
+    
+    result = _analyze(client, company, jpeg_bytes)
+    
+    assert result['success'] is False
+    assert _files(blob_dir) == []
+    db.expire_all()
+    assert db.query(ImageBlob).count() == 0 and db.query(Analysis).count() == 0
+
+
+class _EmptyModel:
+    def predict(self, images, conf_threshold=0.25):
+        return [[] for _ in images]
+
+
+def test_analysis_failure_releases_blob(client, db, company, jpeg_bytes, blob_dir, monkeypatch):
+    def broken_analysis(self, detections, full_image=None, image_scale=1.0):
+        raise RuntimeError("analysis failed")
+    
+    monkeypatch.setattr(yolo_inference, "get_shared_model", lambda model_path: _EmptyModel())
+    monkeypatch.setattr(ShelfAnalyzer, "analyze_shelf", broken_analysis)
+    
+    result = _analyze(client, company, jpeg_bytes)
+    
+    assert result['success'] is False
+    assert _files(blob_dir) == []
+    db.expire_all()
+    assert db.query(ImageBlob).count() == 0
+
+
+def test_saved_analysis_keeps_blob(client, db, company, model, jpeg_bytes, blob_dir, monkeypatch):
+    monkeypatch.setattr(yolo_inference, "get_shared_model", lambda model_path: _EmptyModel())
+    
+    result = _analyze(client, company, jpeg_bytes)
+    
+    assert result['success'] and result['analysis_id']
+    db.expire_all()
+    blob = db.query(ImageBlob).one()
+    assert blob.ref_count == 1 and os.path.exists(blob.path)
@@ -0,0 +1,84 @@
+﻿import os
+from datetime import datetime
+
+import cv2
+import numpy as np
+import pytest
+
+from app.models.database import Analysis, AnalysisDetection
+from app.services import annotation_renderer
+from app.services.annotation_renderer import annotation_path, render_annotated, _options_key
+
+OPTIONS = {'max_width': 640, 'eyes': True, 'scores': True, 'labels': False}
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(annotation_renderer, "ANNOTATION_CACHE_DIR", str(tmp_path / "annotated"))
+    return tmp_path / "annotated"
+
+
+@pytest.fixture
+def analysis(db, company, model, tmp_path):
+    image_path = str(tmp_path / "shelf.jpg")
+    cv2.imwrite(image_path, np.random.default_rng(0).integers(0, 255, (300, 400, 3), dtype=np.uint8))
+    analysis = Analysis(
+        company_id=company.id,
+        model_id=model.id,
+        image_path=image_path,
+        image_scale=1.0,
+        detections={'eyes': [{'eye_id': 1, 'eye_name': "Göz 1", 'region': {'y1': 0, 'y2': 150}, 'hybrid_score': 70.0}]},
+        analysis_date=datetime.utcnow()
+    )
+    db.add(analysis)
+    db.flush()
+    db.add(AnalysisDetection(
+        analysis_id=analysis.id, company_id=company.id, analysis_date=analysis.analysis_date,
+        class_name="cola", confidence=0.9, x1=10, y1=10, x2=60, y2=90
+    ))
+    db.commit()
+    return analysis
+
+
+def test_options_key_is_order_independent_and_versioned(monkeypatch):
+    reordered = dict(reversed(list(OPTIONS.items())))
+    
+    assert _options_key(OPTIONS) == _options_key(reordered)
+    assert len({_options_key({**OPTIONS, name: value}) for name, value in [
+        ('max_width', 320), ('eyes', False), ('scores', False), ('labels', True)
+    ]} | {_options_key(OPTIONS)}) == 5
+    
+    key = _options_key(OPTIONS)
+    monkeypatch.setattr(annotation_renderer, "RENDER_VERSION", annotation_renderer.RENDER_VERSION + 1)
+    assert _options_key(OPTIONS) != key  # Çizim değişince eski girişler kullanılmaz
+
+
+def test_annotation_path_is_per_analysis(cache_dir):
+    path = annotation_path(7, OPTIONS)
+    
+    assert os.path.dirname(path) == str(cache_dir / "7")
+    assert annotation_path(8, OPTIONS) != path
+
+
+def test_render_is_cached_per_options(db, analysis, monkeypatch):
+    path = render_annotated(db, analysis, **OPTIONS)
+    
+    assert path == annotation_path(analysis.id, OPTIONS)
+    assert cv2.imread(path).shape[1] == 400  # Kaynak max_width'ten küçük: büyütülmez
+    
+    # Önbellekteyse kaynak görüntü tekrar okunmaz
+    load_source = annotation_renderer._load_source
+    monkeypatch.setattr(annotation_renderer, "_load_source", lambda *args: pytest.fail("source re-read"))
+    assert render_annotated(db, analysis, **OPTIONS) == path
+    
+    monkeypatch.setattr(annotation_renderer, "_load_source", load_source)
+    narrow = render_annotated(db, analysis, **{**OPTIONS, 'max_width': 200})
+    assert narrow != path and cv2.imread(narrow).shape[1] == 200
+
+
+def test_max_width_is_clamped_before_keying(db, analysis):
+    limit = annotation_renderer.ANNOTATION_MAX_WIDTH
+    
+    path = render_annotated(db, analysis, **{**OPTIONS, 'max_width': limit * 10})
+    
+    assert path == annotation_path(analysis.id, {**OPTIONS, 'max_width': limit})
@@ -0,0 +1,120 @@
+﻿import io
+import os
+import asyncio
+import hashlib
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+from starlette.datastructures import UploadFile
+
+from app.models.database import ImageBlob
+from app.services import batch_analysis
+from app.services.blob_store import blob_path
+from app.services.batch_analysis import ingest_uploads, run_batch, release_pending
+
+
+def _upload(name: str, data: bytes) -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename=name, size=len(data))
+
+
+def _zip(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _stored(data: bytes) -> bool:
+    return os.path.exists(blob_path(hashlib.sha256(data).hexdigest(), ".jpg"))
+
+
+def _blob_count(db) -> int:
+    db.expire_all()
+    return db.query(ImageBlob).count()
+
+
+def test_image_limit_checked_before_storing(db, jpeg_bytes, monkeypatch):
+    monkeypatch.setattr(batch_analysis, "BATCH_MAX_IMAGES", 2)
+    images = [jpeg_bytes(seed=200 + i) for i in range(3)]
+    
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(ingest_uploads(db, [_upload(f"{i}.jpg", data) for i, data in enumerate(images)]))
+    
+    assert error.value.status_code == 400
+    assert _blob_count(db) == 0
+    assert not any(_stored(data) for data in images)
+
+
+def test_zip_limit_checked_before_storing(db, jpeg_bytes, monkeypatch):
+    monkeypatch.setattr(batch_analysis, "BATCH_MAX_IMAGES", 2)
+    loose = jpeg_bytes(seed=210)
+    archived = {f"shelf/{i}.jpg": jpeg_bytes(seed=211 + i) for i in range(2)}
+    
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(ingest_uploads(db, [_upload("loose.jpg", loose), _upload("visit.zip", _zip(archived))]))
+    
+    assert error.value.status_code == 400
+    assert _blob_count(db) == 0
+    assert not _stored(loose) and not any(_stored(data) for data in archived.values())
+    tmp_dir = os.path.join(batch_analysis.BLOB_DIR, "tmp")
+    assert not [name for name in os.listdir(tmp_dir) if name.endswith(".zip")]
+
+
+def test_failed_ingest_discards_stored_items(db, jpeg_bytes, monkeypatch):
+    images = [jpeg_bytes(seed=220 + i) for i in range(3)]
+    store_upload = batch_analysis.store_upload
+    calls = []
+    
+    async def flaky_store(db, file, max_size=None):
+        calls.append(file.filename)
+        if len(calls) == 3:
+            raise RuntimeError("connection reset")
+        return await store_upload(db, file, max_size=max_size)
+    
+    monkeypatch.setattr(batch_analysis, "store_upload", flaky_store)
+    
+    with pytest.raises(RuntimeError):
+        asyncio.run(ingest_uploads(db, [_upload(f"{i}.jpg", data) for i, data in enumerate(images)]))
+    
+    assert _blob_count(db) == 0
+    assert not any(_stored(data) for data in images)
+
+
+class _FakeModel:
+    def predict(self, images):
+        return [[] for _ in images]
+
+
+def test_abandoned_stream_releases_unsaved_items(db, company, jpeg_bytes, monkeypatch):
+    monkeypatch.setattr(batch_analysis, "_load_model", lambda model_path: (_FakeModel(), model_path))
+    images = [jpeg_bytes(seed=230 + i) for i in range(3)]
+    items, _ = asyncio.run(ingest_uploads(db, [_upload(f"{i}.jpg", data) for i, data in enumerate(images)]))
+    db.commit()
+    assert _blob_count(db) == 3
+    
+    async def consume_start_then_disconnect():
+        results = run_batch(items, company_id=company.id, model_path="fake.pt", model_id=1)
+        assert (await results.__anext__())['event'] == 'start'
+        await results.aclose()  # İstemci bağlantıyı kesti
+    
+    asyncio.run(consume_start_then_disconnect())
+    
+    assert _blob_count(db) == 0
+    assert not any(_stored(data) for data in images)
+
+
+def test_release_pending_is_idempotent(db, jpeg_bytes):
+    shared = jpeg_bytes(seed=240)
+    items, _ = asyncio.run(ingest_uploads(db, [_upload("a.jpg", shared), _upload("b.jpg", shared)]))
+    db.commit()
+    pending = [item['image_path'] for item in items[:1]]
+    
+    # Akış hiç başlamadıysa yalnızca arka plan görevi çalışır; ikisi birden çalışırsa tek sefer bırakılır
+    release_pending(pending)
+    release_pending(pending)
+    
+    db.expire_all()
+    assert pending == []
+    assert db.query(ImageBlob).one().ref_count == 1
@@ -0,0 +1,143 @@
+﻿import os
+import hashlib
+
+from app.models.database import Dataset, DatasetImage, ImageBlob, get_engine
+from app.models.migrations import migrate_dataset_images
+from app.services import blob_store
+from app.services.dataset_purge import purge_deleted_datasets
+
+
+def _blob(db, path):
+    db.expire_all()
+    return db.query(ImageBlob).filter(ImageBlob.path == path).first()
+
+
+def _upload_dataset(client, company, files):
+    response = client.post(
+        "/api/datasets/upload",
+        params={'dataset_name': "refs", 'company_id': company.id},
+        files=[('files', (name, data, "image/jpeg")) for name, data in files]
+    )
+    assert response.status_code == 200
+    return response.json()['dataset_id']
+
+
+def _image(db, dataset_id, name):
+    db.expire_all()
+    return db.query(DatasetImage).filter(
+        DatasetImage.dataset_id == dataset_id,
+        DatasetImage.path.endswith(name)
+    ).one()
+
+
+def test_dataset_images_own_their_references(client, db, company, jpeg_bytes):
+    shared = jpeg_bytes(seed=101)
+    dataset_id = _upload_dataset(client, company, [("a.jpg", shared), ("b.jpg", shared), ("c.jpg", jpeg_bytes(seed=102))])
+    
+    a, b, c = (_image(db, dataset_id, name) for name in ("a.jpg", "b.jpg", "c.jpg"))
+    assert a.blob_path == b.blob_path != c.blob_path
+    assert _blob(db, a.blob_path).ref_count == 2
+    assert _blob(db, c.blob_path).ref_count == 1
+    assert os.path.samefile(a.path, a.blob_path)
+
+
+def test_overwrite_releases_previous_reference(client, db, company, jpeg_bytes):
+    dataset_id = _upload_dataset(client, company, [("a.jpg", jpeg_bytes(seed=111))])
+    old_blob_path = _image(db, dataset_id, "a.jpg").blob_path
+    
+    # Aynı içerik aynı ada: referans sayısı değişmez
+    client.post(f"/api/datasets/{dataset_id}/upload-image", files={'file': ("a.jpg", jpeg_bytes(seed=111))})
+    assert _blob(db, old_blob_path).ref_count == 1
+    
+    # Farklı içerik aynı ada: eski referans bırakılır, kullanılmayan dosya silinir
+    client.post(f"/api/datasets/{dataset_id}/upload-image", files={'file': ("a.jpg", jpeg_bytes(seed=112))})
+    image = _image(db, dataset_id, "a.jpg")
+    assert image.blob_path != old_blob_path
+    assert _blob(db, old_blob_path) is None and not os.path.exists(old_blob_path)
+    assert _blob(db, image.blob_path).ref_count == 1
+    assert os.path.samefile(image.path, image.blob_path)
+
+
+def test_dataset_delete_is_soft_and_hidden_from_listing(client, db, company, jpeg_bytes):
+    dataset_id = _upload_dataset(client, company, [("a.jpg", jpeg_bytes(seed=121))])
+    path, blob = _image(db, dataset_id, "a.jpg").path, _image(db, dataset_id, "a.jpg").blob_path
+    assert [d['id'] for d in client.get(f"/api/datasets/company/{company.id}").json()] == [dataset_id]
+    
+    assert client.delete(f"/api/datasets/{dataset_id}").status_code == 200
+    
+    db.expire_all()
+    assert client.get(f"/api/datasets/company/{company.id}").json() == []
+    # Görüntüler ve referanslar purge'e kadar yerinde kalır
+    assert db.get(Dataset, dataset_id).total_images == 1
+    assert db.query(DatasetImage).filter(DatasetImage.dataset_id == dataset_id).count() == 1
+    assert os.path.exists(path) and _blob(db, blob).ref_count == 1
+    assert client.post(f"/api/datasets/{dataset_id}/upload-image", files={'file': ("b.jpg", jpeg_bytes(seed=123))}).status_code == 404
+
+
+def test_purge_releases_deleted_dataset_references(client, db, company, jpeg_bytes):
+    shared = jpeg_bytes(seed=121)
+    product = client.post(
+        "/api/products/",
+        data={'name': "p", 'brand': "b", 'company_id': company.id},
+        files={'reference_image': ("p.jpg", shared)}
+    ).json()
+    dataset_id = _upload_dataset(client, company, [("a.jpg", shared), ("b.jpg", jpeg_bytes(seed=122))])
+    kept_id = _upload_dataset(client, company, [("c.jpg", jpeg_bytes(seed=124))])
+    a, b = [(image.path, image.blob_path) for image in (_image(db, dataset_id, "a.jpg"), _image(db, dataset_id, "b.jpg"))]
+    assert _blob(db, a[1]).ref_count == 2
+    client.delete(f"/api/datasets/{dataset_id}")
+    
+    # Bekleme süresi dolmadan dokunulmaz
+    assert purge_deleted_datasets()['purged'] == []
+    result = purge_deleted_datasets(older_than_days=0)
+    
+    assert result['success'] and result['purged'] == [dataset_id]
+    db.expire_all()
+    dataset = db.get(Dataset, dataset_id)
+    assert dataset.status == "purged" and dataset.total_images == 0
+    assert db.query(DatasetImage).filter(DatasetImage.dataset_id == dataset_id).count() == 0
+    assert not os.path.exists(a[0]) and not os.path.exists(b[0])
+    # Ürünün tuttuğu referans kalır; yalnızca dataset'in kullandığı dosya silinir
+    assert _blob(db, a[1]).ref_count == 1 and os.path.exists(a[1])
+    assert _blob(db, b[1]) is None and not os.path.exists(b[1])
+    assert product['reference_image'] == a[1]
+    # Aktif dataset etkilenmez, ikinci çalışma aynı kaydı tekrar seçmez
+    assert db.query(DatasetImage).filter(DatasetImage.dataset_id == kept_id).count() == 1
+    assert purge_deleted_datasets(older_than_days=0)['purged'] == []
+
+
+def test_failed_link_rolls_back_reference(client, db, company, jpeg_bytes, monkeypatch):
+    def fail_link(blob, destination):
+        raise OSError("disk full")
+    
+    monkeypatch.setattr(blob_store, "link_blob", fail_link)
+    data = jpeg_bytes(seed=131)
+    
+    response = client.post(
+        "/api/datasets/upload",
+        params={'dataset_name': "broken", 'company_id': company.id},
+        files=[('files', ("a.jpg", data, "image/jpeg"))]
+    )
+    
+    assert response.json()['total_images'] == 0
+    db.expire_all()
+    assert db.query(ImageBlob).count() == 0
+    assert db.query(DatasetImage).count() == 0
+    assert not os.path.exists(blob_store.blob_path(hashlib.sha256(data).hexdigest(), ".jpg"))
+
+
+def test_migration_backfills_hardlinked_dataset_images(client, db, company, jpeg_bytes):
+    dataset_id = _upload_dataset(client, company, [("a.jpg", jpeg_bytes(seed=141))])
+    linked = _image(db, dataset_id, "a.jpg")
+    linked_path, linked_blob = linked.path, linked.blob_path
+    # Depo öncesi kopya: sahiplik kaydı oluşturulmaz
+    with open(os.path.join(db.get(Dataset, dataset_id).dataset_path, "images", "legacy.jpg"), "wb") as f:
+        f.write(jpeg_bytes(seed=141))
+    db.query(DatasetImage).delete()
+    db.commit()
+    
+    with get_engine().begin() as connection:
+        migrate_dataset_images(connection)
+    
+    db.expire_all()
+    assert [(image.path, image.blob_path) for image in db.query(DatasetImage).all()] == [(linked_path, linked_blob)]
@@ -0,0 +1,190 @@
+﻿import cv2
+import numpy as np
+import pytest
+
+from app.ai.color_analyzer import ColorAnalyzer
+
+def _banded_image(height: int, width: int, seed: int = 0) -> np.ndarray:
+    """Altı renk bandı + gürültü (RGB)"""
+    rng = np.random.default_rng(seed)
+    image = np.zeros((height, width, 3), dtype=np.int16)
+    band = height // 6
+    for i in range(6):
+        image[i * band:(i + 1) * band] = rng.integers(0, 255, 3)
+    image += rng.integers(-20, 20, image.shape, dtype=np.int16)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def test_dominant_colors_12mp_work_is_bounded(monkeypatch):
+    # Gürültü en kötü durum: neredeyse tüm histogram binleri dolu
+    image = np.random.default_rng(1).integers(0, 255, (3000, 4000, 3), dtype=np.uint8)
+    analyzer = ColorAnalyzer()
+    sampled, clustered = [], []
+    
+    sample_pixels, weighted_kmeans = analyzer._sample_pixels, analyzer._weighted_kmeans
+    monkeypatch.setattr(analyzer, "_sample_pixels", lambda image: sampled.append(sample_pixels(image)) or sampled[-1])
+    monkeypatch.setattr(analyzer, "_weighted_kmeans", lambda points, weights, k: clustered.append(len(points)) or weighted_kmeans(points, weights, k))
+    
+    colors = analyzer.extract_dominant_colors_from_array(image)
+    
+    assert len(colors) == analyzer.n_colors
+    assert len(sampled[0]) <= analyzer.pixel_budget
+    assert clustered[0] <= ColorAnalyzer.MAX_KMEANS_POINTS
+
+
+def test_large_jpeg_is_decoded_reduced(tmp_path, monkeypatch):
+    path = str(tmp_path / "shelf.jpg")
+    cv2.imwrite(path, np.full((64, 64, 3), 128, dtype=np.uint8))
+    # 12 MP başlık: çözücü 1/8 ölçekte okumalı
+    monkeypatch.setattr(ColorAnalyzer, "_jpeg_size", staticmethod(lambda image_path: (4000, 3000)))
+    flags = []
+    imread = cv2.imread
+    monkeypatch.setattr(cv2, "imread", lambda image_path, flag=cv2.IMREAD_COLOR: flags.append(flag) or imread(image_path, flag))
+    
+    ColorAnalyzer().extract_dominant_colors(path)
+    
+    assert flags == [cv2.IMREAD_REDUCED_COLOR_8]
+
+
+def test_dominant_colors_match_reference_kmeans(tmp_path):
+    path = str(tmp_path / "bands.jpg")
+    cv2.imwrite(path, cv2.cvtColor(_banded_image(300, 400), cv2.COLOR_RGB2BGR))
+    
+    report = ColorAnalyzer().evaluate_dominant_colors(path)
+    
+    assert report['success']
+    assert report['weighted_rgb_error'] < 8
+    assert report['percentage_error'] < 3
+
+
+def test_kmeans_labels_match_final_centers_when_max_iter_runs_out():
+    analyzer = ColorAnalyzer()
+    analyzer.max_iter = 1
+    points, weights = analyzer._quantize(_banded_image(120, 160).reshape(-1, 3))
+    
+    centers, cluster_weights = analyzer._weighted_kmeans(points, weights, 5)
+    
+    nearest = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+    np.testing.assert_allclose(cluster_weights, np.bincount(nearest, weights=weights, minlength=5))
+
+
+def test_quantize_bounds_kmeans_points():
+    analyzer = ColorAnalyzer()
+    pixels = np.random.default_rng(2).integers(0, 255, (20000, 3), dtype=np.uint8)
+    
+    points, weights = analyzer._quantize(pixels)
+    
+    assert len(points) <= ColorAnalyzer.MAX_KMEANS_POINTS
+    assert weights.sum() == len(pixels)
+
+
+@pytest.mark.parametrize("size, expected", [
+    ((4000, 3000), cv2.IMREAD_REDUCED_COLOR_8),
+    ((1000, 800), cv2.IMREAD_REDUCED_COLOR_2),
+    ((400, 300), cv2.IMREAD_COLOR),
+])
+def test_reduction_flag_uses_jpeg_dimensions(tmp_path, size, expected):
+    path = str(tmp_path / "image.jpg")
+    cv2.imwrite(path, np.zeros((size[1], size[0], 3), dtype=np.uint8))
+    
+    assert ColorAnalyzer()._jpeg_size(path) == size
+    assert ColorAnalyzer()._reduction_flag(path) == expected
+
+
+def test_reduction_flag_skips_non_jpeg(tmp_path):
+    path = str(tmp_path / "image.png")
+    cv2.imwrite(path, np.zeros((3000, 4000, 3), dtype=np.uint8))
+    
+    assert ColorAnalyzer()._reduction_flag(path) == cv2.IMREAD_COLOR
+
+
+def _two_tone_image() -> np.ndarray:
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+    image[:, :100] = (200, 30, 30)
+    image[:, 100:] = (30, 30, 200)
+    return image
+
+
+def test_boxes_outside_image_have_no_color():
+    boxes = np.array([
+        [10, 10, 60, 60],        # içeride
+        [250, 10, 300, 60],      # tamamen sağda
+        [-50, -50, -10, -10],    # tamamen solda/üstte
+        [40, 40, 40, 80],        # sıfır genişlik
+        [180, 90, 260, 140],     # kısmen dışarıda
+    ])
+    
+    dominant = ColorAnalyzer().dominant_colors_for_boxes(_two_tone_image(), boxes)
+    
+    np.testing.assert_allclose(dominant[0], (200, 30, 30))
+    assert np.isnan(dominant[1:4]).all()
+    np.testing.assert_allclose(dominant[4], (30, 30, 200))
+
+
+def test_detection_colors_skip_out_of_bounds_boxes():
+    detections = [
+        {'class_name': 'cola', 'bbox': [10, 10, 60, 60]},
+        {'class_name': 'cola', 'bbox': [500, 500, 600, 600]},
+    ]
+    
+    results = ColorAnalyzer().analyze_detections_colors(
+        _two_tone_image(), detections, {'cola': {'primary': '#c81e1e'}}
+    )
+    
+    assert results[0]['best_match'] == 'primary'
+    assert results[1] is None
+
+
+def test_signatures_for_out_of_bounds_boxes_are_not_matched():
+    from app.ai.sku_index import ColorSignatureIndex
+    
+    analyzer = ColorAnalyzer()
+    image = _two_tone_image()
+    index = ColorSignatureIndex(company_id=1)
+    index.upsert(1, 'red', analyzer.color_signature_from_array(image[:, :100]))
+    
+    signatures = analyzer.signatures_for_boxes(image, [
+        {'bbox': [0, 0, 100, 100]},
+        {'bbox': [300, 0, 400, 100]},
+    ])
+    matches = index.query(signatures, k=1)
+    
+    assert matches[0][0]['product_id'] == 1
+    assert matches[1] == []
+
+
+def test_compare_colors_defaults_to_ciede2000(monkeypatch):
+    monkeypatch.delenv("COLOR_MATCH_METRIC", raising=False)
+    analyzer = ColorAnalyzer()
+    
+    assert analyzer.metric == 'ciede2000'
+    assert analyzer.compare_colors([200, 30, 30], [200, 30, 30]) == 100.0
+    # Algısal ölçek RGB öklid mesafesinden farklıdır (geçmiş skorlar kayar)
+    assert analyzer.compare_colors([200, 30, 30], [100, 30, 30]) != ColorAnalyzer(metric='rgb').compare_colors([200, 30, 30], [100, 30, 30])
+
+
+def test_rgb_metric_is_opt_in(monkeypatch):
+    monkeypatch.setenv("COLOR_MATCH_METRIC", "rgb")
+    analyzer = ColorAnalyzer()
+    
+    expected = (1 - np.linalg.norm([100, 0, 0]) / np.sqrt(3 * 255 ** 2)) * 100
+    assert analyzer.metric == 'rgb'
+    assert analyzer.compare_colors([200, 30, 30], [100, 30, 30]) == round(expected, 2)
+    assert ColorAnalyzer(metric='cie76').metric == 'cie76'
+    
+    with pytest.raises(ValueError):
+        ColorAnalyzer(metric='hsv')
+
+
+def test_similarity_matrix_matches_compare_colors():
+    from app.ai.color_analyzer import ReferencePalette
+    
+    palette = ReferencePalette({'cola': {'primary': '#c81e1e', 'secondary': '#ffffff'}})
+    rgb = np.array([[190, 40, 35], [240, 240, 240]])
+    
+    for metric in ColorAnalyzer.COLOR_METRICS:
+        analyzer = ColorAnalyzer(metric=metric)
+        matrix = analyzer.similarity_matrix(rgb, palette)
+        for i, color in enumerate(rgb):
+            for j, reference in enumerate(palette.rgb):
+                assert round(float(matrix[i, j]), 2) == analyzer.compare_colors(color.tolist(), reference.tolist())
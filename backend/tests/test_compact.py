@@ -0,0 +1,133 @@
+﻿import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from app.ai import yolo_inference
+from app.services import blob_store, single_flight
+from app.services.compact import CompressionMiddleware, parse_fields, select_fields
+from app.services.detection_store import PACKED_COLUMNS
+
+
+@pytest.fixture(autouse=True)
+def blob_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "BLOB_DIR", str(tmp_path / "blobs"))
+    single_flight._recent.clear()
+    yield
+    single_flight._recent.clear()
+
+
+class _GridModel:
+    """Rafı dolduran sabit tespitler (cola/fanta dönüşümlü)"""
+    
+    def __init__(self, count):
+        self.count = count
+    
+    def predict(self, images, conf_threshold=0.25):
+        detections = []
+        for i in range(self.count):
+            x1, y1 = (i % 10) * 30, (i // 10) * 40
+            detections.append({
+                'class': "cola" if i % 2 == 0 else "fanta",
+                'confidence': 0.9,
+                'x': x1 + 12,
+                'y': y1 + 15,
+                'bbox': {'x1': x1, 'y1': y1, 'x2': x1 + 25, 'y2': y1 + 30}
+            })
+        return [detections for _ in images]
+
+
+def _analyze(client, company, jpeg_bytes, monkeypatch, count=6, headers=None, **params):
+    monkeypatch.setattr(yolo_inference, "get_shared_model", lambda model_path: _GridModel(count))
+    return client.post(
+        "/api/analysis/analyze",
+        params={'company_id': company.id, 'save_to_db': False, **params},
+        files={'file': ("shelf.jpg", jpeg_bytes(width=320, height=240, seed=500), "image/jpeg")},
+        headers=headers or {}
+    )
+
+
+def test_parse_fields_builds_tree():
+    assert parse_fields(None) is None and parse_fields("") is None
+    assert parse_fields("a, b.c,b.d") == {'a': True, 'b': {'c': True, 'd': True}}
+    # Üst alan seçiliyse alt yollar yok sayılır
+    assert parse_fields("b,b.c") == {'b': True}
+    
+    with pytest.raises(HTTPException) as error:
+        parse_fields(" , .")
+    assert error.value.status_code == 400
+
+
+def test_select_fields_fans_out_over_lists():
+    data = {'id': 1, 'eyes': [{'eye_id': 1, 'score': 80}, {'eye_id': 2, 'score': 70}], 'extra': "x"}
+    
+    assert select_fields(data, parse_fields("id,eyes.eye_id,missing")) == {'id': 1, 'eyes': [{'eye_id': 1}, {'eye_id': 2}]}
+    assert select_fields([data, data], parse_fields("id")) == [{'id': 1}, {'id': 1}]
+
+
+def test_analyze_fields_selection(client, company, jpeg_bytes, monkeypatch):
+    response = _analyze(client, company, jpeg_bytes, monkeypatch, fields="success,analysis.summary.total_products,analysis.eyes.eye_id")
+    
+    body = response.json()
+    assert set(body) == {'success', 'analysis'}
+    assert set(body['analysis']) == {'summary', 'eyes'}
+    assert body['analysis']['summary'] == {'total_products': 6}
+    assert body['analysis']['eyes'] and all(set(eye) == {'eye_id'} for eye in body['analysis']['eyes'])
+    
+    assert _analyze(client, company, jpeg_bytes, monkeypatch, fields=",").status_code == 400
+
+
+def test_analyze_packed_detections(client, company, jpeg_bytes, monkeypatch):
+    assert 'detections' not in _analyze(client, company, jpeg_bytes, monkeypatch).json()
+    
+    packed = _analyze(client, company, jpeg_bytes, monkeypatch, packed_detections=True).json()['detections']
+    
+    assert packed['columns'] == list(PACKED_COLUMNS)
+    assert packed['classes'] == ["cola", "fanta"]
+    assert packed['count'] == 6
+    assert len(packed['data']) == 6 * len(PACKED_COLUMNS)
+    first = dict(zip(PACKED_COLUMNS, packed['data'][:len(PACKED_COLUMNS)]))
+    assert first == {'class': 0, 'confidence': 0.9, 'x1': 0, 'y1': 0, 'x2': 25, 'y2': 30, 'eye_id': first['eye_id']}
+
+
+def test_large_analysis_response_is_gzipped(client, company, jpeg_bytes, monkeypatch):
+    response = _analyze(client, company, jpeg_bytes, monkeypatch, count=60, headers={'Accept-Encoding': "gzip"})
+    
+    assert response.status_code == 200
+    assert response.headers['content-encoding'] == "gzip"
+    assert int(response.headers['content-length']) < len(response.content)
+    assert response.json()['analysis']['summary']['total_products'] == 60
+
+
+def _streaming_app():
+    app = FastAPI()
+    body = "data: " + "x" * 4096 + "\n\n"
+    
+    @app.get("/api/events/tasks/{task_id}")
+    def events(task_id: str):
+        return PlainTextResponse(body, media_type="text/event-stream")
+    
+    @app.post("/api/analysis/analyze-batch")
+    def batch():
+        return PlainTextResponse(body, media_type="application/x-ndjson")
+    
+    @app.get("/api/other")
+    def other():
+        return PlainTextResponse(body)
+    
+    app.add_middleware(CompressionMiddleware)
+    return TestClient(app)
+
+
+def test_stream_paths_are_not_compressed():
+    client = _streaming_app()
+    headers = {'Accept-Encoding': "gzip"}
+    
+    assert 'content-encoding' not in client.get("/api/events/tasks/1", headers=headers).headers
+    assert 'content-encoding' not in client.post("/api/analysis/analyze-batch", headers=headers).headers
+    # Accept: text/event-stream istekleri de olduğu gibi geçer
+    assert 'content-encoding' not in client.get("/api/other", headers={**headers, 'Accept': "text/event-stream"}).headers
+    
+    compressed = client.get("/api/other", headers=headers)
+    assert compressed.headers['content-encoding'] == "gzip"
+    assert compressed.text.startswith("data: ")
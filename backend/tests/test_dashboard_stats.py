@@ -0,0 +1,96 @@
+﻿from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app.models.database import Analysis, Company, Product, get_engine
+from app.services.rollups import record_analysis, record_analyses, count_active_shelves, count_products
+
+
+def _analysis(company, model, shelf_id, analysis_date, score=80.0):
+    return Analysis(
+        company_id=company.id,
+        model_id=model.id,
+        image_path=f"{shelf_id}.jpg",
+        shelf_id=shelf_id,
+        total_products=3,
+        total_score=score,
+        analysis_date=analysis_date
+    )
+
+
+class _StatementLog:
+    """Engine üzerinde çalışan SQL ifadelerini topla"""
+    
+    def __enter__(self):
+        self.statements = []
+        event.listen(get_engine(), "before_cursor_execute", self._record)
+        return self
+    
+    def __exit__(self, *exc):
+        event.remove(get_engine(), "before_cursor_execute", self._record)
+    
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement.lower())
+
+
+def test_active_shelves_follow_latest_analysis(db, company, model):
+    now = datetime.utcnow()
+    for shelf_id, age_days in [("A1", 1), ("A1", 30), ("B2", 20), ("C3", 2)]:
+        analysis = _analysis(company, model, shelf_id, now - timedelta(days=age_days))
+        db.add(analysis)
+        db.flush()
+        record_analysis(db, analysis)
+    # Geriye dönük kayıt son analiz zamanını geri almaz
+    backfilled = [_analysis(company, model, "C3", now - timedelta(days=40)), _analysis(company, model, "B2", now - timedelta(days=3))]
+    db.add_all(backfilled)
+    db.flush()
+    record_analyses(db, backfilled)
+    db.commit()
+    
+    assert count_active_shelves(db, company.id, days=7) == 3
+    assert count_active_shelves(db, company.id, days=1) == 0
+    assert count_active_shelves(db, None, days=7) == 3
+
+
+def test_product_counter_tracks_create_and_delete(client, db, company, jpeg_bytes):
+    created = [
+        client.post(
+            "/api/products/",
+            data={'name': f"p{i}", 'brand': "b", 'company_id': company.id},
+            files={'reference_image': (f"p{i}.jpg", jpeg_bytes(seed=i))}
+        ).json()
+        for i in range(3)
+    ]
+    assert client.delete(f"/api/products/{created[0]['id']}").status_code == 200
+    
+    db.expire_all()
+    assert db.get(Company, company.id).product_count == 2
+    assert count_products(db, company.id) == db.query(Product).filter(Product.company_id == company.id).count()
+
+
+def test_dashboard_stats_read_only_rollups(client, db, company, model):
+    analysis = _analysis(company, model, "A1", datetime.utcnow(), score=72.0)
+    db.add(analysis)
+    db.flush()
+    record_analysis(db, analysis)
+    db.commit()
+    
+    with _StatementLog() as log:
+        stats = client.get(f"/api/stats?company_id={company.id}").json()
+    
+    assert stats == {'total_products': 0, 'active_shelves': 1, 'stock_level': 72, 'alerts': 0}
+    assert not [statement for statement in log.statements if "from analyses" in statement or "from products" in statement]
+
+
+def test_dashboard_stats_without_recent_analyses(client, db, company, model):
+    old = _analysis(company, model, "A1", datetime.utcnow() - timedelta(days=90), score=40.0)
+    db.add(old)
+    db.flush()
+    record_analysis(db, old)
+    db.commit()
+    
+    stats = client.get("/api/stats").json()
+    
+    # Tüm zamanlar toplamına düşülmez
+    assert stats['stock_level'] == 85
+    assert stats['active_shelves'] == 0
@@ -0,0 +1,76 @@
+﻿from datetime import datetime
+
+import pytest
+
+from app.models.database import Analysis
+from app.services.detection_store import store_detections, store_detections_bulk
+
+
+def _detection(class_name, confidence, x):
+    return {'class': class_name, 'confidence': confidence, 'bbox': {'x1': x, 'y1': 10, 'x2': x + 20, 'y2': 40}}
+
+
+def _analysis(db, company, model, shelf_id, detections):
+    analysis = Analysis(
+        company_id=company.id,
+        model_id=model.id,
+        shelf_id=shelf_id,
+        image_path="shelf.jpg",
+        detections={'detections': detections},
+        total_products=len(detections),
+        analysis_date=datetime(2026, 3, 2, 9, 0)
+    )
+    db.add(analysis)
+    db.flush()
+    return analysis
+
+
+def _expected_by_class(analyses) -> dict:
+    """JSON payload'dan sınıf başına yüz sayısı, analiz sayısı, ortalama güven"""
+    expected = {}
+    for analysis in analyses:
+        for det in analysis.detections['detections']:
+            entry = expected.setdefault(det['class'], {'confidences': [], 'analyses': set()})
+            entry['confidences'].append(det['confidence'])
+            entry['analyses'].add(analysis.id)
+    return {
+        class_name: {
+            'facings': len(entry['confidences']),
+            'analyses': len(entry['analyses']),
+            'avg_facings_per_analysis': round(len(entry['confidences']) / len(entry['analyses']), 2),
+            'avg_confidence': sum(entry['confidences']) / len(entry['confidences'])
+        }
+        for class_name, entry in expected.items()
+    }
+
+
+def test_summary_matches_json_payload(client, db, company, model):
+    single = _analysis(db, company, model, "A1", [
+        _detection("cola", 0.91, 0), _detection("cola", 0.85, 30), _detection("fanta", 0.7, 60)
+    ])
+    bulk = _analysis(db, company, model, "B2", [
+        _detection("cola", 0.6, 0), _detection("sprite", 0.95, 30), _detection("sprite", 0.8, 60), _detection("sprite", 0.75, 90)
+    ])
+    assert store_detections(db, single, single.detections['detections']) == 3
+    assert store_detections_bulk(db, [(bulk, bulk.detections['detections'], None)]) == 4
+    db.commit()
+    
+    body = client.get(f"/api/analysis/company/{company.id}/detections/summary", params={'group_by': "class"}).json()
+    results = {row['class']: row for row in body['results']}
+    expected = _expected_by_class([single, bulk])
+    
+    assert set(results) == set(expected)
+    for class_name, row in results.items():
+        assert row['facings'] == expected[class_name]['facings']
+        assert row['analyses'] == expected[class_name]['analyses']
+        assert row['avg_facings_per_analysis'] == expected[class_name]['avg_facings_per_analysis']
+        assert row['avg_confidence'] == pytest.approx(expected[class_name]['avg_confidence'], abs=1e-4)
+    # En çok yüz önce
+    facings = [row['facings'] for row in body['results']]
+    assert facings == sorted(facings, reverse=True)
+    
+    shelves = client.get(
+        f"/api/analysis/company/{company.id}/detections/summary",
+        params={'group_by': "shelf", 'class_name': "cola"}
+    ).json()['results']
+    assert {row['shelf']: row['facings'] for row in shelves} == {"A1": 2, "B2": 1}
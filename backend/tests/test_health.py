@@ -0,0 +1,23 @@
+﻿from app.models.database import DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+
+def test_health_db_reports_pool(client, db):
+    response = client.get("/health/db")
+    
+    assert response.status_code == 200
+    body = response.json()
+    assert body['status'] == "healthy" and "error" not in body
+    assert body['latency_ms'] >= 0
+    
+    pool = body['pool']
+    # Dosya tabanlı SQLite fixture'ı QueuePool kullanır
+    assert pool['created'] is True
+    assert pool['backend'] == "sqlite"
+    assert pool['pool_class'] == "QueuePool"
+    assert set(pool) == {
+        'created', 'backend', 'pool_class', 'status',
+        'size', 'checked_in', 'checked_out', 'overflow', 'max_overflow', 'timeout'
+    }
+    assert pool['size'] == DB_POOL_SIZE and pool['max_overflow'] == DB_MAX_OVERFLOW
+    # İsteğin kendi session'ı yanıt yazılırken hâlâ açıktır
+    assert pool['checked_out'] >= 1
@@ -0,0 +1,84 @@
+﻿"""
+Import süresi bütçesi (python -X importtime)
+
+API ve worker süreçleri soğuk başlangıçta ağır kütüphaneleri (Celery,
+ultralytics/torch, sklearn, pyarrow, DB driver) yüklememeli ve toplam import
+süresi bütçe içinde kalmalı. Bütçeler ortamdan okunur:
+    
+    IMPORT_BUDGET_API_MS=1200 IMPORT_BUDGET_WORKER_MS=800 pytest tests/test_import_time.py
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_TIME_RUNS = int(os.getenv("IMPORT_TIME_RUNS", "3"))  # En iyi ölçüm alınır (gürültü)
+
+# (modül, bütçe ortam değişkeni, varsayılan ms, import edilmemesi gereken paketler)
+TARGETS = [
+    (
+        "app.main",
+        "IMPORT_BUDGET_API_MS",
+        2000,
+        ["celery", "ultralytics", "torch", "sklearn", "pyarrow", "pyodbc", "cv2"]
+    ),
+    (
+        "app.tasks.training_tasks",
+        "IMPORT_BUDGET_WORKER_MS",
+        1000,
+        ["ultralytics", "torch", "sklearn", "pyarrow", "pyodbc", "fastapi"]
+    ),
+]
+
+
+def measure(module: str):
+    """
+    Modülü temiz bir süreçte import et
+    
+    Returns:
+        (toplam_ms, {paket: kümülatif_ms})
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True
+    )
+    assert result.returncode == 0, f"{module} import edilemedi:\n{result.stderr[-2000:]}"
+    
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            value = int(parts[1].strip())
+        except ValueError:
+            continue  # başlık satırı
+        cumulative[parts[2].strip()] = value / 1000
+    
+    return cumulative.get(module, 0.0), cumulative
+
+
+def _slowest(cumulative: dict, module: str, count: int = 5) -> str:
+    top_level = sorted(
+        ((name, ms) for name, ms in cumulative.items() if "." not in name and name != module),
+        key=lambda item: item[1],
+        reverse=True
+    )[:count]
+    return ", ".join(f"{name} {ms:.0f} ms" for name, ms in top_level)
+
+
+@pytest.mark.parametrize("module, budget_env, default_ms, forbidden", TARGETS, ids=[t[0] for t in TARGETS])
+def test_import_budget(module, budget_env, default_ms, forbidden):
+    budget_ms = int(os.getenv(budget_env, str(default_ms)))
+    
+    runs = [measure(module) for _ in range(max(1, IMPORT_TIME_RUNS))]
+    total_ms, cumulative = min(runs, key=lambda run: run[0])
+    
+    loaded = [name for name in forbidden if name in cumulative]
+    assert not loaded, f"{module} açılışta yüklememeli: {', '.join(loaded)}"
+    assert total_ms <= budget_ms, \
+        f"{module}: {total_ms:.0f} ms > {budget_env}={budget_ms} ms ({_slowest(cumulative, module)})"
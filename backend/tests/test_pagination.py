@@ -0,0 +1,84 @@
+﻿from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.database import Analysis
+from app.services.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, keyset_page
+
+
+def _add_analyses(db, company, model, dates):
+    for i, date in enumerate(dates):
+        db.add(Analysis(
+            company_id=company.id,
+            model_id=model.id,
+            image_path=f"shelf_{i}.jpg",
+            total_products=0,
+            product_counts={},
+            shelf_coverage=0.0,
+            visibility_score=0.0,
+            planogram_score=0.0,
+            total_score=float(i),
+            analysis_date=date
+        ))
+    db.commit()
+
+
+def _expected_order(analyses):
+    dated = sorted((a for a in analyses if a.analysis_date), key=lambda a: (a.analysis_date, a.id), reverse=True)
+    undated = sorted((a for a in analyses if not a.analysis_date), key=lambda a: a.id, reverse=True)
+    return [a.id for a in dated + undated]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 50])
+def test_keyset_pages_cover_rows_with_null_and_duplicate_sort_values(db, company, model, limit):
+    base = datetime(2026, 5, 1)
+    dates = [base, None, base + timedelta(days=1), base, None, base + timedelta(days=2), None]
+    _add_analyses(db, company, model, dates)
+    # Kolon varsayılanı (datetime.utcnow) None'ı ezer; NULL'u sonradan yaz
+    db.query(Analysis).filter(Analysis.image_path.in_(["shelf_1.jpg", "shelf_4.jpg", "shelf_6.jpg"])).update(
+        {'analysis_date': None}, synchronize_session=False
+    )
+    db.commit()
+    db.expire_all()
+    analyses = db.query(Analysis).all()
+    
+    seen, cursor, pages = [], None, 0
+    while True:
+        query = db.query(Analysis).filter(Analysis.company_id == company.id)
+        rows, cursor = keyset_page(query, Analysis.analysis_date, Analysis.id, limit, cursor)
+        seen.extend(row.id for row in rows)
+        pages += 1
+        if cursor is None:
+            break
+        assert pages <= len(analyses)
+    
+    assert seen == _expected_order(analyses)
+
+
+def test_cursor_round_trip_with_null_sort_value():
+    assert decode_cursor(encode_cursor(None, 42)) == (None, 42)
+    date = datetime(2026, 5, 1, 12, 30)
+    assert decode_cursor(encode_cursor(date, 7)) == (date, 7)
+
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not-a-cursor")
+    assert error.value.status_code == 400
+
+
+def test_company_analyses_next_cursor_header(client, db, company, model):
+    base = datetime(2026, 5, 1)
+    _add_analyses(db, company, model, [base + timedelta(hours=i) for i in range(5)])
+    
+    response = client.get(f"/api/analysis/company/{company.id}?limit=3")
+    first_page = [item['id'] for item in response.json()]
+    cursor = response.headers[NEXT_CURSOR_HEADER]
+    
+    response = client.get(f"/api/analysis/company/{company.id}?limit=3&cursor={cursor}")
+    second_page = [item['id'] for item in response.json()]
+    
+    assert len(first_page) == 3 and len(second_page) == 2
+    assert NEXT_CURSOR_HEADER not in response.headers
+    assert sorted(first_page + second_page, reverse=True) == first_page + second_page
@@ -0,0 +1,77 @@
+﻿import time
+
+import cv2
+import numpy as np
+
+from app.models.database import SessionLocal, Company, Product
+from app.services import product_cache
+
+
+def _wait_for_signature(product_id: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        session = SessionLocal()
+        try:
+            signature = session.query(Product.color_signature).filter(Product.id == product_id).scalar()
+        finally:
+            session.close()
+        if signature is not None:
+            return signature
+        time.sleep(0.05)
+    return None
+
+
+def test_sku_index_backfill_does_not_commit_request_session(db, company, tmp_path, monkeypatch):
+    monkeypatch.setattr(product_cache, '_sku_indexes', {})
+    image_path = str(tmp_path / "reference.jpg")
+    cv2.imwrite(image_path, np.full((40, 40, 3), (30, 30, 200), dtype=np.uint8))
+    product = Product(company_id=company.id, name="cola", reference_image=image_path)
+    db.add(product)
+    db.commit()
+    updated_at = product.updated_at
+    submitted = []
+    submit = product_cache.submit_background
+    monkeypatch.setattr(product_cache, 'submit_background', lambda fn, *args: submitted.append(fn) or submit(fn, *args))
+    
+    # İsteğin henüz commit edilmemiş işi (ör. yüklemenin blob referansı)
+    db.add(Company(name="Pending Company"))
+    db.flush()
+    
+    index = product_cache.get_sku_index(db, company.id)
+    assert product.id in index.entries
+    
+    db.rollback()
+    assert db.query(Company).filter(Company.name == "Pending Company").count() == 0
+    assert _wait_for_signature(product.id) is not None
+    # Paylaşılan havuzda çalışır; imza doldurmak updated_at'i değiştirmez
+    assert submitted == [product_cache._save_signatures]
+    db.expire_all()
+    assert db.get(Product, product.id).updated_at == updated_at
+
+
+def test_catalog_reloads_after_product_changes(client, db, company, jpeg_bytes, monkeypatch):
+    monkeypatch.setattr(product_cache, '_catalogs', {})
+    
+    catalog = product_cache.get_product_catalog(db, company.id)
+    assert len(catalog) == 0
+    assert product_cache.get_product_catalog(db, company.id) is catalog
+    
+    product = client.post(
+        "/api/products/",
+        data={'name': "cola", 'brand': "b", 'company_id': company.id},
+        files={'reference_image': ("p.jpg", jpeg_bytes(seed=601))}
+    ).json()
+    created = product_cache.get_product_catalog(db, company.id)
+    assert created.version > catalog.version
+    assert created.get("cola")['id'] == product['id']
+    assert product_cache.get_product_catalog(db, company.id) is created
+    
+    client.put(f"/api/products/{product['id']}", data={'name': "cola zero"})
+    updated = product_cache.get_product_catalog(db, company.id)
+    assert updated.version > created.version
+    assert updated.get("cola") is None and updated.get("cola zero")['id'] == product['id']
+    
+    client.delete(f"/api/products/{product['id']}")
+    deleted = product_cache.get_product_catalog(db, company.id)
+    assert deleted.version > updated.version
+    assert len(deleted) == 0
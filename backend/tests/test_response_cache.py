@@ -0,0 +1,60 @@
+﻿import pytest
+
+from app.services.response_cache import clear_response_cache
+
+
+@pytest.fixture(autouse=True)
+def _empty_cache():
+    clear_response_cache()
+    yield
+    clear_response_cache()
+
+
+def _create_company(client, company, jpeg_bytes):
+    client.post("/api/companies/", json={'name': "Second", 'description': None})
+
+
+def _create_product(client, company, jpeg_bytes):
+    client.post(
+        "/api/products/",
+        data={'name': "p", 'brand': "b", 'company_id': company.id},
+        files={'reference_image': ("p.jpg", jpeg_bytes(seed=301))}
+    )
+
+
+def _create_dataset(client, company, jpeg_bytes):
+    client.post("/api/datasets/", json={'company_id': company.id, 'name': "d"})
+
+
+@pytest.mark.parametrize("path, mutate", [
+    ("/api/companies/", _create_company),
+    ("/api/products/?company_id={company}", _create_product),
+    ("/api/products/", _create_product),
+    ("/api/datasets/company/{company}", _create_dataset),
+])
+def test_list_etag_revalidation(client, company, jpeg_bytes, path, mutate):
+    url = path.format(company=company.id)
+    
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers['etag']
+    
+    cached = client.get(url, headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['etag'] == etag and cached.content == b""
+    
+    mutate(client, company, jpeg_bytes)
+    
+    changed = client.get(url, headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['etag'] != etag
+    assert len(changed.json()) == len(first.json()) + 1
+
+
+def test_repeated_request_is_served_from_cache(client, company):
+    first = client.get("/api/companies/")
+    assert first.headers['x-cache'] == "MISS"
+    
+    second = client.get("/api/companies/")
+    assert second.headers['x-cache'] == "HIT"
+    assert second.content == first.content
@@ -0,0 +1,179 @@
+﻿from datetime import datetime
+
+import numpy as np
+import pytest
+
+from app.ai.scoring_engine import ScoringEngine
+from app.models.database import Analysis, AnalysisDailyStats, ScoringRule
+from app.services import scoring_profiles
+from app.services.rollups import record_analysis
+
+
+def _random_metrics(rng) -> dict:
+    distribution = None
+    if rng.random() < 0.8:
+        left, center = rng.integers(0, 60, 2)
+        distribution = {'left': int(left), 'center': int(center), 'right': int(100 - left - center)}
+    n_matches = int(rng.integers(0, 4))
+    return {
+        'shelf_coverage': float(rng.uniform(0, 110)),
+        'visibility_score': float(rng.uniform(0, 120)),
+        'expected_distribution': {'left': 33, 'center': 34, 'right': 33},
+        'actual_distribution': distribution or {},
+        'color_matches': {f"class_{i}": float(rng.uniform(0, 100)) for i in range(n_matches)}
+    }
+
+
+def test_batch_scores_match_single_row_scores():
+    rng = np.random.default_rng(7)
+    engine = ScoringEngine()
+    rows = [_random_metrics(rng) for _ in range(2000)]
+    
+    columns = {
+        'shelf_coverage': [row['shelf_coverage'] for row in rows],
+        'visibility_score': [row['visibility_score'] for row in rows],
+        'expected_distribution': {'left': 33, 'center': 34, 'right': 33},
+        'actual_distribution': ScoringEngine.distribution_matrix([row['actual_distribution'] for row in rows]),
+        'color_match': [
+            np.mean(list(row['color_matches'].values())) if row['color_matches'] else np.nan
+            for row in rows
+        ]
+    }
+    batch = engine.calculate_total_scores_batch(columns)
+    
+    for i, metrics in enumerate(rows):
+        single = engine.calculate_total_score(metrics)
+        assert batch['total_score'][i] == pytest.approx(single['total_score'], abs=1e-9)
+        for component, score in single['component_scores'].items():
+            assert batch['component_scores'][component][i] == pytest.approx(score, abs=1e-9)
+
+
+def _analysis(db, company, model, total_score, color_analysis):
+    analysis = Analysis(
+        company_id=company.id,
+        model_id=model.id,
+        image_path="shelf.jpg",
+        detections=[],
+        shelf_coverage=78.0,
+        visibility_score=64.0,
+        planogram_score=90.0,
+        total_score=total_score,
+        color_analysis=color_analysis,
+        analysis_date=datetime(2026, 1, 5, 10, 0)
+    )
+    db.add(analysis)
+    db.flush()
+    record_analysis(db, analysis)
+    return analysis
+
+
+def test_rescore_uses_stored_color_matches(client, db, company, model):
+    metrics = {
+        'shelf_coverage': 78.0,
+        'visibility_score': 64.0,
+        'expected_distribution': {'left': 33, 'center': 34, 'right': 33},
+        'actual_distribution': {},
+        'color_matches': {'cola': 92.5, 'fanta': 71.0}
+    }
+    expected = ScoringEngine().calculate_total_score(metrics)
+    # Depolanan planogram skoru dağılım yokken kullanılır
+    expected_total = expected['total_score'] + (90.0 - 50.0) * 0.25
+    # color_matches yoksa renk bileşeni nötr (50)
+    legacy_total = ScoringEngine().calculate_total_score({**metrics, 'color_matches': {}})['total_score'] + (90.0 - 50.0) * 0.25
+    
+    matched = _analysis(db, company, model, 0.0, {'success': True, 'colors': [], 'color_matches': metrics['color_matches']})
+    legacy = _analysis(db, company, model, 55.5, None)
+    db.commit()
+    
+    response = client.post(f"/api/scoring/company/{company.id}/rescore")
+    assert response.status_code == 200
+    assert response.json()['rescored'] == 2
+    assert response.json()['missing_color'] == 1
+    
+    db.expire_all()
+    assert db.get(Analysis, matched.id).total_score == pytest.approx(expected_total, abs=0.01)
+    assert db.get(Analysis, legacy.id).total_score == pytest.approx(legacy_total, abs=0.01)
+    
+    stats = db.query(AnalysisDailyStats).filter(AnalysisDailyStats.company_id == company.id).one()
+    assert stats.total_score_sum == pytest.approx(expected_total + legacy_total, abs=0.01)
+
+
+def test_rescore_reads_distribution_path(client, db, company, model):
+    analysis = _analysis(db, company, model, 0.0, {'color_matches': {'cola': 80.0}})
+    analysis.detections = {'detections': [{'class_name': "cola"}] * 3, 'summary': {'distribution': {'left': 33, 'center': 34, 'right': 33}}}
+    db.commit()
+    
+    client.post(f"/api/scoring/company/{company.id}/rescore")
+    
+    db.expire_all()
+    # Dağılım beklenenle aynı -> planogram 100 (depolanan 90 yerine)
+    assert db.get(Analysis, analysis.id).planogram_score == 100.0
+
+
+@pytest.fixture
+def compiled(monkeypatch):
+    """Profil önbelleğini boşalt ve derleme sayısını say"""
+    calls = []
+    compile_profile = scoring_profiles.compile_scoring_profile
+    
+    def counting(db, company_id, version=0):
+        calls.append(company_id)
+        return compile_profile(db, company_id, version)
+    
+    monkeypatch.setattr(scoring_profiles, "_profiles", {})
+    monkeypatch.setattr(scoring_profiles, "compile_scoring_profile", counting)
+    return calls
+
+
+def _rule(company, rule_type="shelf_coverage", weight=1.0, parameters=None):
+    return {'company_id': company.id, 'rule_name': rule_type, 'rule_type': rule_type, 'weight': weight, 'parameters': parameters}
+
+
+@pytest.mark.parametrize("parameters", [
+    {'ideal_min': 0, 'ideal_max': 80},
+    {'ideal_min': 90, 'ideal_max': 80},
+    {'ideal_min': 60, 'ideal_max': 120},
+    {'ideal_min': "low"},
+])
+def test_invalid_coverage_band_is_rejected(client, company, parameters):
+    assert client.post("/api/scoring/", json=_rule(company, parameters=parameters)).status_code == 400
+    
+    rule_id = client.post("/api/scoring/", json=_rule(company, parameters={'ideal_min': 60, 'ideal_max': 80})).json()['id']
+    assert client.put(f"/api/scoring/{rule_id}", json=_rule(company, parameters=parameters)).status_code == 400
+    assert client.get(f"/api/scoring/{rule_id}").json()['parameters'] == {'ideal_min': 60, 'ideal_max': 80}
+
+
+def test_bad_stored_rule_falls_back_to_default_band(client, db, company, compiled):
+    db.add(ScoringRule(company_id=company.id, rule_name="legacy", rule_type="shelf_coverage", weight=1.0,
+                       parameters={'ideal_min': 0, 'ideal_max': 0}))
+    db.commit()
+    
+    profile = client.get(f"/api/scoring/company/{company.id}/profile").json()
+    assert profile['coverage_ideal_band'] == [70.0, 85.0]
+    
+    response = client.post(f"/api/scoring/company/{company.id}/calculate", json={'shelf_coverage': 0, 'visibility_score': 50})
+    assert response.status_code == 200
+    assert response.json()['component_scores']['shelf_coverage'] == 0
+
+
+def test_profile_cache_is_invalidated_on_rule_changes(client, company, compiled):
+    def profile():
+        return client.get(f"/api/scoring/company/{company.id}/profile").json()
+    
+    assert profile()['rules_count'] == 0
+    assert profile()['rules_count'] == 0
+    assert len(compiled) == 1
+    
+    rule_id = client.post("/api/scoring/", json=_rule(company, parameters={'ideal_min': 60, 'ideal_max': 80})).json()['id']
+    assert profile()['coverage_ideal_band'] == [60.0, 80.0]
+    assert len(compiled) == 2
+    
+    client.put(f"/api/scoring/{rule_id}", json=_rule(company, parameters={'ideal_min': 50, 'ideal_max': 90}))
+    assert profile()['coverage_ideal_band'] == [50.0, 90.0]
+    assert profile()['weights']['shelf_coverage'] == 1.0
+    assert len(compiled) == 3
+    
+    client.delete(f"/api/scoring/{rule_id}")
+    assert profile()['rules_count'] == 0
+    assert profile()['coverage_ideal_band'] == [70.0, 85.0]
+    assert len(compiled) == 4
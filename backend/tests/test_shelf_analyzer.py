@@ -0,0 +1,41 @@
+﻿import numpy as np
+
+from app.ai.shelf_analyzer import ShelfAnalyzer
+
+
+def _image(seed: int = 0):
+    return np.random.default_rng(seed).integers(0, 255, (90, 120, 3), dtype=np.uint8)
+
+
+def _detections():
+    return [
+        {'class': "cola", 'confidence': 0.9, 'bbox': {'x1': 10, 'y1': 5, 'x2': 40, 'y2': 25}},
+        {'class': "fanta", 'confidence': 0.8, 'bbox': {'x1': 50, 'y1': 60, 'x2': 90, 'y2': 85}},
+    ]
+
+
+def test_classic_metrics_record_their_scale():
+    image = _image()
+    
+    result = ShelfAnalyzer(image.shape).analyze_shelf(_detections(), image, image_scale=0.3125)
+    
+    assert result['classic_metrics_scale'] == 0.3125
+    assert all('classic_metrics' in eye for eye in result['eyes'])
+
+
+def test_no_scale_marker_without_classic_metrics():
+    result = ShelfAnalyzer((90, 120, 3)).analyze_shelf(_detections())
+    
+    assert 'classic_metrics_scale' not in result
+    assert all('classic_metrics' not in eye for eye in result['eyes'])
+
+
+def test_comparison_flags_scale_mismatch():
+    image = _image()
+    analyzer = ShelfAnalyzer(image.shape)
+    downscaled = analyzer.analyze_shelf(_detections(), image, image_scale=0.5)
+    also_downscaled = analyzer.analyze_shelf(_detections(), image, image_scale=0.5)
+    legacy = {key: value for key, value in downscaled.items() if key != 'classic_metrics_scale'}  # Orijinal üzerinde
+    
+    assert ShelfAnalyzer.compare_analyses(legacy, downscaled)['scale_mismatch'] is True
+    assert 'scale_mismatch' not in ShelfAnalyzer.compare_analyses(also_downscaled, downscaled)
@@ -0,0 +1,51 @@
+﻿from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.database import Analysis, Company
+
+
+def _query_plan(db, sql: str, **params) -> str:
+    from sqlalchemy import text
+    
+    rows = db.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).fetchall()
+    return " ".join(str(row[-1]) for row in rows)
+
+
+@pytest.mark.parametrize("where, index_name", [
+    ("shelf_id = :shelf_id", "ix_analyses_shelf_date"),
+    ("company_id = :company_id AND shelf_id = :shelf_id", "ix_analyses_company_shelf_date"),
+])
+def test_shelf_history_queries_seek_an_index(db, where, index_name):
+    plan = _query_plan(
+        db,
+        f"SELECT id FROM analyses WHERE {where} ORDER BY analysis_date DESC LIMIT 10",
+        shelf_id="A1",
+        company_id=1
+    )
+    
+    assert index_name in plan
+    assert "TEMP B-TREE" not in plan  # Sıralama index'ten gelir
+
+
+def test_shelf_history_without_company(client, db, company, model):
+    other = Company(name="Other Company")
+    db.add(other)
+    db.flush()
+    start = datetime(2026, 3, 1)
+    for i, company_id in enumerate([company.id, other.id, company.id]):
+        db.add(Analysis(
+            company_id=company_id,
+            model_id=model.id,
+            image_path=f"shelf_{i}.jpg",
+            shelf_id="A1",
+            total_score=float(i),
+            analysis_date=start + timedelta(days=i)
+        ))
+    db.commit()
+    
+    history = client.get("/api/analysis/history/A1").json()['history']
+    assert [item['total_score'] for item in history] == [2.0, 1.0, 0.0]
+    
+    history = client.get(f"/api/analysis/history/A1?company_id={company.id}").json()['history']
+    assert [item['total_score'] for item in history] == [2.0, 0.0]
@@ -0,0 +1,121 @@
+﻿import uuid
+import asyncio
+
+import pytest
+
+from app.ai import yolo_inference
+from app.services import single_flight
+from app.services.single_flight import flight_key, join_flight
+
+
+@pytest.fixture(autouse=True)
+def clean_flights():
+    single_flight._inflight.clear()
+    single_flight._recent.clear()
+    yield
+    single_flight._inflight.clear()
+    single_flight._recent.clear()
+
+
+def _key(**params) -> str:
+    return flight_key(uuid.uuid4().hex, **params)
+
+
+def test_concurrent_requests_share_leader_result():
+    key = _key(eye_count=3)
+    runs = []
+    
+    async def request(name):
+        flight = await join_flight(key)
+        if flight.shared:
+            return flight.result
+        try:
+            runs.append(name)
+            await asyncio.sleep(0.05)  # Çıkarım
+            return flight.publish({'analysis_id': 1, 'by': name})
+        finally:
+            flight.finish()
+    
+    async def run():
+        return await asyncio.gather(*[request(name) for name in ("a", "b", "c")])
+    
+    results = asyncio.run(run())
+    
+    assert runs == ["a"]
+    assert results == [{'analysis_id': 1, 'by': "a"}] * 3
+    assert key not in single_flight._inflight
+
+
+def test_waiter_runs_itself_when_leader_fails():
+    key = _key(eye_count=3)
+    
+    async def run():
+        leader = await join_flight(key)
+        waiter = asyncio.create_task(join_flight(key))
+        await asyncio.sleep(0)
+        leader.finish()  # Yanıt yayınlamadan bitti (hata)
+        return await waiter
+    
+    flight = asyncio.run(run())
+    
+    assert not flight.shared
+    flight.finish()
+
+
+def test_recent_result_served_until_ttl(monkeypatch):
+    key = _key(eye_count=3)
+    
+    async def lead():
+        flight = await join_flight(key)
+        flight.publish({'analysis_id': 7})
+        flight.finish()
+    
+    asyncio.run(lead())
+    assert asyncio.run(join_flight(key)).result == {'analysis_id': 7}
+    
+    # TTL dolunca tekrar deneme analizi yeniden çalıştırır
+    expires_at, result = single_flight._recent[key]
+    single_flight._recent[key] = (expires_at - single_flight.SINGLE_FLIGHT_RESULT_TTL - 1, result)
+    assert not asyncio.run(join_flight(key)).shared
+
+
+def test_key_covers_request_parameters():
+    sha256 = uuid.uuid4().hex
+    
+    assert flight_key(sha256, eye_count=3, shelf_id="A1") == flight_key(sha256, shelf_id="A1", eye_count=3)
+    assert flight_key(sha256, eye_count=3, shelf_id="A1") != flight_key(sha256, eye_count=4, shelf_id="A1")
+
+
+class _CountingModel:
+    def __init__(self):
+        self.calls = 0
+    
+    def predict(self, images, conf_threshold=0.25):
+        self.calls += 1
+        return [[{'class': "cola", 'confidence': 0.9, 'x': 20, 'y': 20, 'bbox': {'x1': 5, 'y1': 5, 'x2': 35, 'y2': 35}}] for _ in images]
+
+
+def test_analyze_uses_shared_model_and_coalesces_retries(client, company, jpeg_bytes, monkeypatch):
+    model = _CountingModel()
+    loaded = []
+    
+    def fake_shared_model(model_path):
+        loaded.append(model_path)
+        return model
+    
+    monkeypatch.setattr(yolo_inference, "get_shared_model", fake_shared_model)
+    image = jpeg_bytes(width=120, height=90, seed=300)
+    
+    def analyze():
+        return client.post(
+            f"/api/analysis/analyze?company_id={company.id}&shelf_id=A1",
+            files={'file': ("shelf.jpg", image, "image/jpeg")}
+        ).json()
+    
+    first, retry = analyze(), analyze()
+    
+    assert first['success'] and 'coalesced' not in first
+    assert retry['coalesced'] is True
+    assert retry['analysis_id'] == first['analysis_id']
+    assert model.calls == 1
+    assert loaded == ['yolov8n.pt']
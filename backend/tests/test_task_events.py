@@ -0,0 +1,73 @@
+﻿import json
+import uuid
+import asyncio
+import threading
+
+from app.services import task_events
+from app.services.task_events import hub, publish_task_event, subscribe
+
+
+def _task_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _sse_events(body: str) -> list:
+    events = []
+    for block in body.split("\n\n"):
+        data = [line[len("data: "):] for line in block.splitlines() if line.startswith("data: ")]
+        if data:
+            events.append(json.loads(data[0]))
+    return events
+
+
+def test_stream_ends_after_ready_state(client):
+    task_id = _task_id()
+    publish_task_event(task_id, 'PROGRESS', {'current': 1})
+    timer = threading.Timer(0.2, publish_task_event, (task_id, 'SUCCESS', {'result': 'ok'}))
+    timer.start()
+    
+    with client.stream("GET", f"/api/events/tasks/{task_id}") as response:
+        assert response.headers['content-type'].startswith("text/event-stream")
+        body = "".join(response.iter_text())  # SUCCESS'ten sonra sunucu akışı kapatır
+    timer.join()
+    
+    assert [event['state'] for event in _sse_events(body)] == ['PROGRESS', 'SUCCESS']
+    assert task_id not in hub._subscribers
+
+
+def test_finished_task_returns_single_event(client):
+    task_id = _task_id()
+    publish_task_event(task_id, 'FAILURE', {'error': 'boom'})
+    
+    body = client.get(f"/api/events/tasks/{task_id}").text
+    
+    assert [(event['state'], event['meta']) for event in _sse_events(body)] == [('FAILURE', {'error': 'boom'})]
+
+
+def test_subscribe_keepalive_then_end(monkeypatch):
+    monkeypatch.setattr(task_events, "TASK_EVENT_KEEPALIVE", 0.05)
+    task_id = _task_id()
+    
+    async def collect():
+        received = []
+        async for event in subscribe(task_id):
+            received.append(event and event['state'])
+            if event is None and received.count(None) == 1:
+                publish_task_event(task_id, 'REVOKED')  # İlk keepalive'dan sonra görev iptal edilir
+        return received
+    
+    received = asyncio.run(asyncio.wait_for(collect(), timeout=5))
+    
+    assert received[0] == 'PENDING'
+    assert None in received
+    assert received[-1] == 'REVOKED'
+    assert task_id not in hub._subscribers
+
+
+def test_websocket_closes_after_ready_state(client):
+    task_id = _task_id()
+    publish_task_event(task_id, 'SUCCESS', {'result': 1})
+    
+    with client.websocket_connect(f"/api/events/tasks/{task_id}/ws") as websocket:
+        assert json.loads(websocket.receive_text())['state'] == 'SUCCESS'
+        assert websocket.receive()['type'] == 'websocket.close'
@@ -0,0 +1,51 @@
+﻿import io
+import os
+import asyncio
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from app.models.database import ImageBlob, Product
+from app.services import blob_store, uploads
+
+
+@pytest.fixture
+def blob_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "BLOB_DIR", str(tmp_path / "blobs"))
+    return tmp_path / "blobs"
+
+
+def _files(directory):
+    return [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+
+
+def test_oversized_upload_is_rejected_without_leftovers(client, db, company, jpeg_bytes, blob_dir, monkeypatch):
+    data = jpeg_bytes(width=256, height=256, seed=401)
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_SIZE", len(data) - 1)
+    
+    response = client.post(
+        "/api/products/",
+        data={'name': "p", 'brand': "b", 'company_id': company.id},
+        files={'reference_image': ("p.jpg", data)}
+    )
+    
+    assert response.status_code == 413
+    assert _files(blob_dir) == []
+    assert db.query(ImageBlob).count() == 0
+    assert db.query(Product).count() == 0
+
+
+def test_streamed_upload_stops_at_limit(db, jpeg_bytes, blob_dir, monkeypatch):
+    # Content-Length yok: sınır yazarken aşılır, .part dosyası silinmeli
+    data = jpeg_bytes(width=256, height=256, seed=402)
+    monkeypatch.setattr(uploads, "UPLOAD_CHUNK_SIZE", 256)
+    file = UploadFile(io.BytesIO(data), filename="a.jpg")
+    assert file.size is None
+    
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(blob_store.store_upload(db, file, max_size=len(data) - 1))
+    
+    assert error.value.status_code == 413
+    assert os.path.isdir(blob_dir / "tmp")
+    assert _files(blob_dir) == []
+    assert db.query(ImageBlob).count() == 0